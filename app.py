@@ -1,40 +1,303 @@
-from flask import Flask, jsonify, request
-from werkzeug.exceptions import HTTPException
+from datetime import date, datetime
+
+import click
+
+from flask import Blueprint, Flask, Response, current_app, g, jsonify, request, stream_with_context
+from werkzeug.exceptions import BadRequest, HTTPException, NotFound
+from werkzeug.local import LocalProxy
+from database import migrations
+from database.backends import SQLiteBackend, backend_from_url
 from database.db import DatabaseManager
-from models.daos import CustomerDAO
+from database.instrumentation import SharedMetrics
+from models.cache import LRUCache
+from models.daos import BaseDAO, BookingDAO, CustomerDAO, InvoiceDAO, NotificationDAO, RateDAO, VehicleDAO
+from models.json_provider import RecordJSONProvider
+from responses import error_response, not_modified, record_response
+from services.availability_calendar import AvailabilityCalendar
+from services.availability_index import AvailabilityIndex
+from services.booking_service import BookingServices
 from services.customer_service import CustomerService
+from services.invoice_service import InvoiceService
+from services.notifications import FileSink, NotificationDispatcher, SMTPSender
+from services.pricing_engine import PricingEngine
+from services.report_scheduler import DailyReportScheduler
+from services.utilization_service import UtilizationService
+from services.vehicle_service import VehicleService
 from decouple import Config, RepositoryEnv
 
-app = Flask(__name__)
-
-# Connect to database
 DOTENV_FILE = './envs.env'
-config = Config(RepositoryEnv(DOTENV_FILE))
-mysql_config = {
-	'host': config('DB_HOST'),
-	'user': config('DB_USER'),
-	'password': config('DB_PASSWORD'),
-	'database': config('DB_DATABASE')
-}
-db_manager = DatabaseManager(**mysql_config)
-db_manager.connect()
-db_manager.create_tables()
-
-# Create DAOs, and Services
-customer_dao = CustomerDAO(db_manager)
-customer_service = CustomerService(customer_dao)
-
-
-@app.route('/')
+
+# The routes and CLI commands, registered on the app by create_app
+api = Blueprint('api', __name__, cli_group=None)
+
+
+def create_app(dotenv_file=DOTENV_FILE, background=True):
+	"""
+	Builds the application from the settings in the dotenv file. Nothing
+	here touches the database: connections are opened on first use and
+	the tables are created by the migrate command, so the app can be
+	created without a database server and worker processes boot fast.
+
+	Parameters
+	----------
+	dotenv_file : str
+		The settings file.
+	background : bool
+		Start the report scheduler and notification dispatcher threads
+		when their settings enable them. The pre-fork server turns this
+		off, since the threads would not survive the fork into the
+		workers; run the generate-daily-report and dispatch-notifications
+		commands from cron instead. Without it the customer and vehicle
+		caches and the availability index are off, as each worker's copy
+		would miss the others' writes.
+
+	Returns
+	-------
+	flask.Flask
+		The application, with its DAOs and services in
+		app.extensions['car_hire'].
+	"""
+	app = Flask(__name__)
+	app.json = RecordJSONProvider(app)
+	config = Config(RepositoryEnv(dotenv_file))
+
+	mysql_config = {
+		'host': config('DB_HOST'),
+		'user': config('DB_USER'),
+		'password': config('DB_PASSWORD'),
+		'database': config('DB_DATABASE'),
+		'pool_size': config('DB_POOL_SIZE', default=10, cast=int),
+		'idle_timeout': config('DB_POOL_IDLE_TIMEOUT', default=300, cast=float),
+		'health_check_interval': config('DB_POOL_HEALTH_CHECK_INTERVAL', default=30, cast=float),
+		'pool_timeout': config('DB_POOL_TIMEOUT', default=30, cast=float),
+		'slow_query_threshold': config('DB_SLOW_QUERY_THRESHOLD', default=0.5, cast=float)
+	}
+	# Run on MySQL, or on an embedded SQLite file
+	backend = None
+	if config('DB_BACKEND', default='mysql') == 'sqlite':
+		backend = SQLiteBackend(
+			config('DB_SQLITE_PATH', default='./car_hire.db'),
+			busy_timeout=config('DB_SQLITE_BUSY_TIMEOUT', default=5000, cast=int)
+		)
+	# Optionally spread read-only queries over replicas, given as
+	# comma separated database URLs
+	replicas = [
+		backend_from_url(url.strip())
+		for url in config('DB_REPLICAS', default='').split(',') if url.strip()
+	]
+	db_manager = DatabaseManager(
+		**mysql_config,
+		backend=backend,
+		replicas=replicas,
+		replica_selection=config('DB_REPLICA_SELECTION', default='round_robin'),
+		replica_retry_interval=config('DB_REPLICA_RETRY_INTERVAL', default=30, cast=float)
+	)
+
+	# Create DAOs, and Services
+	batch_size = config('DB_BATCH_SIZE', default=500, cast=int)
+	cache_max_size = config('CACHE_MAX_SIZE', default=10000, cast=int)
+	cache_ttl = config('CACHE_TTL', default=300, cast=float)
+
+	# Customers and vehicles are cached by id. Pre-forked workers would
+	# each hold their own copy, which an update in another worker doesn't
+	# invalidate, so there every read and ETag check goes to the database
+	def entity_cache():
+		return LRUCache(cache_max_size, cache_ttl) if background else None
+
+	customer_dao = CustomerDAO(db_manager, batch_size=batch_size, cache=entity_cache())
+	customer_service = CustomerService(customer_dao)
+	vehicle_dao = VehicleDAO(db_manager, batch_size=batch_size, cache=entity_cache())
+	booking_dao = BookingDAO(db_manager, batch_size=batch_size)
+
+	# Optionally answer availability enquiries from memory, loaded on
+	# first use. Pre-forked workers would each hold their own copy, which
+	# can't see the bookings made by the other workers, so it could only
+	# run in verify mode and every enquiry would query the database anyway
+	availability_index = None
+	if background and config('AVAILABILITY_INDEX', default=False, cast=bool):
+		availability_index = AvailabilityIndex(
+			booking_dao,
+			vehicle_dao,
+			verify=config('AVAILABILITY_INDEX_VERIFY', default=False, cast=bool)
+		)
+
+	vehicle_service = VehicleService(vehicle_dao, availability_index)
+	notification_dao = NotificationDAO(db_manager, batch_size=batch_size)
+	booking_service = BookingServices(booking_dao, vehicle_service, availability_index, notification_dao)
+	invoice_dao = InvoiceDAO(db_manager, batch_size=batch_size)
+	rate_dao = RateDAO(db_manager)
+	pricing_engine = PricingEngine(rate_dao)
+	invoice_service = InvoiceService(invoice_dao, booking_dao, booking_service, pricing_engine)
+	utilization_service = UtilizationService(booking_dao, vehicle_dao, invoice_dao)
+	availability_calendar = AvailabilityCalendar(booking_dao, vehicle_dao, config('CALENDAR_DAYS', default=14, cast=int))
+
+	# Serve the daily report from snapshots materialized once a day
+	report_scheduler = DailyReportScheduler(
+		booking_dao,
+		config('REPORT_SNAPSHOT_DIR', default='./snapshots'),
+		run_at=datetime.strptime(config('REPORT_TIME', default='06:00'), '%H:%M').time()
+	)
+	report_snapshots = config('REPORT_SNAPSHOTS', default=False, cast=bool)
+	if report_snapshots:
+		booking_service.add_listener(report_scheduler)
+		if background and config('REPORT_SCHEDULER', default=False, cast=bool):
+			report_scheduler.start()
+
+	# Send the letters queued in the notification outbox from worker threads,
+	# to an SMTP server or, for development, to .eml files
+	if config('NOTIFICATION_SINK', default='file') == 'smtp':
+		notification_sender = SMTPSender(
+			config('SMTP_HOST', default='localhost'),
+			config('SMTP_PORT', default=25, cast=int),
+			username=config('SMTP_USER', default=None),
+			password=config('SMTP_PASSWORD', default=None),
+			use_tls=config('SMTP_TLS', default=False, cast=bool)
+		)
+	else:
+		notification_sender = FileSink(config('NOTIFICATION_DIR', default='./outbox'))
+	notification_dispatcher = NotificationDispatcher(
+		notification_dao,
+		notification_sender,
+		config('NOTIFICATION_SENDER', default='bookings@example.com'),
+		workers=config('NOTIFICATION_WORKERS', default=2, cast=int),
+		batch_size=config('NOTIFICATION_BATCH_SIZE', default=50, cast=int),
+		max_attempts=config('NOTIFICATION_MAX_ATTEMPTS', default=5, cast=int),
+		backoff=config('NOTIFICATION_BACKOFF', default=30, cast=float)
+	)
+	if background and config('NOTIFICATION_DISPATCHER', default=False, cast=bool):
+		notification_dispatcher.start()
+
+	# Count the statements each request runs for the metrics, and report
+	# them in a header so the endpoint tests can assert a query budget
+	app.config['QUERY_COUNT_HEADER'] = config('QUERY_COUNT_HEADER', default=False, cast=bool)
+	# Pre-forked workers each count their own statements, so they share
+	# them through a directory for /metrics to add up
+	shared_metrics = None
+	if not background:
+		shared_metrics = SharedMetrics(
+			config('METRICS_DIR', default='./metrics'),
+			flush_interval=config('METRICS_FLUSH_INTERVAL', default=5, cast=float)
+		)
+	app.config['REPORT_SNAPSHOTS'] = report_snapshots
+	# The Cache-Control header of each entity's GET route. Responses carry
+	# an ETag either way, so no-cache still lets clients revalidate cheaply
+	app.config['CACHE_CONTROL'] = {
+		name: config(f'CACHE_CONTROL_{name.upper()}', default='no-cache')
+		for name in ('customer', 'vehicle', 'booking', 'invoice')
+	}
+
+	app.extensions['car_hire'] = {
+		'db_manager': db_manager,
+		'customer_dao': customer_dao,
+		'customer_service': customer_service,
+		'vehicle_dao': vehicle_dao,
+		'vehicle_service': vehicle_service,
+		'booking_dao': booking_dao,
+		'booking_service': booking_service,
+		'availability_index': availability_index,
+		'notification_dao': notification_dao,
+		'notification_dispatcher': notification_dispatcher,
+		'invoice_dao': invoice_dao,
+		'invoice_service': invoice_service,
+		'rate_dao': rate_dao,
+		'utilization_service': utilization_service,
+		'availability_calendar': availability_calendar,
+		'report_scheduler': report_scheduler,
+		'shared_metrics': shared_metrics
+	}
+	app.register_blueprint(api)
+	return app
+
+
+def cache_stats(components):
+	"""
+	Parameters
+	----------
+	components : dict
+		The app's extensions['car_hire'].
+
+	Returns
+	-------
+	dict
+		Cache name to its stats, for the caches the app has.
+	"""
+	caches = {
+		'customer': components['customer_dao'].cache,
+		'vehicle': components['vehicle_dao'].cache,
+		'statement': BaseDAO.statement_cache
+	}
+	return {name: cache.stats() for name, cache in caches.items() if cache is not None}
+
+
+def publish_metrics(components, force=False):
+	"""
+	Writes this worker's metrics for /metrics to add up, when the app
+	runs in pre-forked workers.
+
+	Parameters
+	----------
+	components : dict
+		The app's extensions['car_hire'].
+	force : bool
+		Write them now, rather than at most every METRICS_FLUSH_INTERVAL.
+	"""
+	shared_metrics = components['shared_metrics']
+	if shared_metrics is not None:
+		db_manager = components['db_manager']
+		shared_metrics.publish(db_manager.metrics, cache_stats(components), db_manager.pool_stats(), force)
+
+
+def _component(name):
+	# The routes below use these proxies to the current app's DAOs and
+	# services, so they read as if the services were module globals
+	return LocalProxy(lambda: current_app.extensions['car_hire'][name])
+
+
+db_manager = _component('db_manager')
+customer_dao = _component('customer_dao')
+customer_service = _component('customer_service')
+vehicle_dao = _component('vehicle_dao')
+vehicle_service = _component('vehicle_service')
+booking_service = _component('booking_service')
+invoice_service = _component('invoice_service')
+rate_dao = _component('rate_dao')
+utilization_service = _component('utilization_service')
+availability_calendar = _component('availability_calendar')
+notification_dispatcher = _component('notification_dispatcher')
+report_scheduler = _component('report_scheduler')
+
+
+@api.before_app_request
+def start_query_count():
+	g.query_count = db_manager.count_queries()
+	g.query_counter = g.query_count.__enter__()
+
+
+@api.after_app_request
+def add_query_count_header(response):
+	if current_app.config['QUERY_COUNT_HEADER'] and 'query_counter' in g:
+		response.headers['X-Query-Count'] = str(g.query_counter.count)
+	return response
+
+
+@api.teardown_app_request
+def stop_query_count(error=None):
+	if 'query_count' in g:
+		g.query_count.__exit__(None, None, None)
+		db_manager.metrics.observe_request(request.endpoint or 'unmatched', g.query_counter.count)
+		publish_metrics(current_app.extensions['car_hire'])
+
+
+@api.route('/')
 def hello_world():
 	return 'Hello World!'
 
 
 # HTTP GET -> an endpoint to get customer
-@app.route('/get-customer/<int:customer_id>', methods=['GET'])
+@api.route('/get-customer/<int:customer_id>', methods=['GET'])
 def get_customer(customer_id):
 	"""
-	Gets customer by customer_id.
+	Gets customer by customer_id, see entity_response.
 
 	Parameters
 	----------
@@ -45,16 +308,100 @@ def get_customer(customer_id):
 	flask.Response
 	    a JSON of the customer object.
 	"""
+	return entity_response(customer_service, 'customer', customer_id)
+
+
+# HTTP GET -> an endpoint to get vehicle
+@api.route('/get-vehicle/<int:vehicle_id>', methods=['GET'])
+def get_vehicle(vehicle_id):
+	"""
+	Gets vehicle by vehicle_id, see entity_response.
+
+	Parameters
+	----------
+	vehicle_id : int
+	    The vehicle_id of the vehicle to be retrieved from database.
+	Returns
+	-------
+	flask.Response
+	    a JSON of the vehicle object.
+	"""
+	return entity_response(vehicle_service, 'vehicle', vehicle_id)
+
+
+# HTTP GET -> an endpoint to get booking
+@api.route('/get-booking/<int:booking_id>', methods=['GET'])
+def get_booking(booking_id):
+	"""
+	Gets booking by booking_id, see entity_response.
+
+	Parameters
+	----------
+	booking_id : int
+	    The booking_id of the booking to be retrieved from database.
+	Returns
+	-------
+	flask.Response
+	    a JSON of the booking object.
+	"""
+	return entity_response(booking_service, 'booking', booking_id)
+
+
+# HTTP GET -> an endpoint to get invoice
+@api.route('/get-invoice/<int:invoice_id>', methods=['GET'])
+def get_invoice(invoice_id):
+	"""
+	Gets invoice by invoice_id, see entity_response.
+
+	Parameters
+	----------
+	invoice_id : int
+	    The invoice_id of the invoice to be retrieved from database.
+	Returns
+	-------
+	flask.Response
+	    a JSON of the invoice object.
+	"""
+	return entity_response(invoice_service, 'invoice', invoice_id)
+
+
+def entity_response(service, name, record_id):
+	"""
+	Serves one record with a strong ETag made from its row version, which
+	every update increments. A request whose If-None-Match holds the
+	current ETag is answered 304 from the version alone, read from the
+	DAO's cache or a primary key lookup, without loading or serializing
+	the record.
+
+	Parameters
+	----------
+	service : BaseService
+	    The service of the entity being served.
+	name : str
+	    The JSON key for the record.
+	record_id : int
+	    The record's id.
+	Returns
+	-------
+	flask.Response
+	    a JSON of the record, or an empty 304 if the client's copy is current.
+	"""
 	try:
-		customer = customer_service.get_customer(customer_id)
-		return jsonify(customer=customer), 200
+		if request.if_none_match:
+			response = not_modified(current_app, request, name, record_id, service.get_record_version(record_id))
+			if response is not None:
+				return response
+		try:
+			record = service.get_record(record_id)
+		except ValueError:
+			raise NotFound()
+		return record_response(current_app, name, record)
 	except HTTPException as error:
-		error.description = f"Customer with id: {customer_id} was not found in the database"
-		return jsonify(error={error.name: error.description}), error.code
+		return error_response(error, f"{name.capitalize()} with id: {record_id} was not found in the database")
 
 
 # HTTP PUT -> an endpoint to update customer
-@app.route('/update-customer/<int:customer_id>', methods=['PUT'])
+@api.route('/update-customer/<int:customer_id>', methods=['PUT'])
 def update_customer(customer_id):
 	"""
 	Updates customer data.
@@ -71,14 +418,14 @@ def update_customer(customer_id):
 	customer_data = request.json
 	try:
 		customer = customer_service.update_customer(customer_id, customer_data)
-		return jsonify(updated_customer=customer), 200
+		# With the new version's ETag, so the client can revalidate its copy
+		return record_response(current_app, 'customer', customer, key='updated_customer'), 200
 	except HTTPException as error:
-		error.description = f"The Customer with {customer_id} could not be updated"
-		return jsonify(error={error.name: error.description}), error.code
+		return error_response(error, f"The Customer with {customer_id} could not be updated")
 
 
 # HTTP POST -> an endpoint to add new customer
-@app.route('/add-customer', methods=['POST'])
+@api.route('/add-customer', methods=['POST'])
 def add_customer():
 	"""
 	Adds customer to database.
@@ -91,14 +438,13 @@ def add_customer():
 	customer_data = request.json
 	try:
 		customer = customer_service.add_customer(customer_data)
-		return jsonify(customer=customer), 200
+		return record_response(current_app, 'customer', customer, key='customer'), 200
 	except HTTPException as error:
-		error.description = f"The Customer could not be added to the database"
-		return jsonify(error={error.name: error.description}), error.code
+		return error_response(error, f"The Customer could not be added to the database")
 
 
 # HTTP DELETE -> an endpoint to delete customer
-@app.route('/delete-customer/<int:customer_id>', methods=['DELETE'])
+@api.route('/delete-customer/<int:customer_id>', methods=['DELETE'])
 def delete_customer(customer_id):
 	"""
 	Deletes customer from database.
@@ -116,9 +462,448 @@ def delete_customer(customer_id):
 		customer_service.delete_customer(customer_id)
 		return jsonify(success='success'), 200
 	except HTTPException as error:
-		error.description = f"Customer with id: {customer_id} could not be deleted"
-		return jsonify(error={error.name: error.description}), error.code
+		return error_response(error, f"Customer with id: {customer_id} could not be deleted")
+
+
+# HTTP GET -> an endpoint to get many customers
+@api.route('/get-customers', methods=['GET'])
+def get_customers():
+	"""
+	Gets many customers by the comma separated customer_ids in the ids
+	query parameter.
+
+	Returns
+	-------
+	flask.Response
+	    a JSON list of the customer objects that were found.
+	"""
+	try:
+		try:
+			customer_ids = [int(customer_id) for customer_id in request.args.get('ids', '').split(',') if customer_id]
+		except ValueError:
+			raise BadRequest()
+		customers = customer_service.get_customers(customer_ids)
+		return jsonify(customers=customers), 200
+	except HTTPException as error:
+		return error_response(error, "The ids parameter must be a comma separated list of customer ids")
+
+
+# HTTP POST -> an endpoint to add many customers
+@api.route('/add-customers', methods=['POST'])
+def add_customers():
+	"""
+	Adds a JSON list of customers to the database in batches.
+
+	Returns
+	-------
+	flask.Response
+	    a JSON of the number of customers added.
+	"""
+	customers_data = request.json
+	try:
+		added = customer_service.add_customers(customers_data)
+		return jsonify(added=added), 200
+	except HTTPException as error:
+		return error_response(error, f"The Customers could not be added to the database")
+
+
+# HTTP PUT -> an endpoint to update many customers
+@api.route('/update-customers', methods=['PUT'])
+def update_customers():
+	"""
+	Updates a JSON list of customers in batches, each customer must
+	include its customer_id.
+
+	Returns
+	-------
+	flask.Response
+	    a JSON of the number of customers updated.
+	"""
+	customers_data = request.json
+	try:
+		updated = customer_service.update_customers(customers_data)
+		return jsonify(updated=updated), 200
+	except HTTPException as error:
+		return error_response(error, f"The Customers could not be updated")
+
+
+# HTTP GET -> endpoints to browse customers, vehicles, bookings and invoices
+@api.route('/customers', methods=['GET'])
+def list_customers():
+	"""
+	Lists customers a page at a time, see list_page.
+
+	Returns
+	-------
+	flask.Response
+	    a JSON of the page of customers and the next page's cursor.
+	"""
+	return list_page(customer_service, 'customers')
+
+
+@api.route('/vehicles', methods=['GET'])
+def list_vehicles():
+	"""
+	Lists vehicles a page at a time, see list_page.
+
+	Returns
+	-------
+	flask.Response
+	    a JSON of the page of vehicles and the next page's cursor.
+	"""
+	return list_page(vehicle_service, 'vehicles')
+
+
+@api.route('/bookings', methods=['GET'])
+def list_bookings():
+	"""
+	Lists bookings a page at a time, see list_page.
+
+	Returns
+	-------
+	flask.Response
+	    a JSON of the page of bookings and the next page's cursor.
+	"""
+	return list_page(booking_service, 'bookings')
+
+
+@api.route('/invoices', methods=['GET'])
+def list_invoices():
+	"""
+	Lists invoices a page at a time, see list_page.
+
+	Returns
+	-------
+	flask.Response
+	    a JSON of the page of invoices and the next page's cursor.
+	"""
+	return list_page(invoice_service, 'invoices')
+
+
+LIST_PARAMETERS = {'sort', 'order', 'cursor', 'limit'}
+
+
+def list_page(service, name):
+	"""
+	Serves one page of a list endpoint. The sort (a column), order (asc
+	or desc), limit and cursor query parameters choose the page, every
+	other query parameter is an equality filter on that column. Pass the
+	returned next_cursor back to get the following page.
+
+	Parameters
+	----------
+	service : BaseService
+	    The service of the entity being listed.
+	name : str
+	    The JSON key for the records.
+	Returns
+	-------
+	flask.Response
+	    a JSON of the page of records and the next page's cursor.
+	"""
+	args = request.args
+	try:
+		try:
+			filters = {key: value for key, value in args.items() if key not in LIST_PARAMETERS}
+			records, next_cursor = service.list_records(
+				filters,
+				args.get('sort'),
+				args.get('order', 'asc'),
+				args.get('cursor'),
+				int(args.get('limit', 50))
+			)
+		except ValueError:
+			raise BadRequest()
+		return jsonify({name: records, 'next_cursor': next_cursor}), 200
+	except HTTPException as error:
+		return error_response(error, "The sort, order, limit, cursor or filter parameters are not valid")
+
+
+# HTTP GET -> an endpoint to find free vehicles
+@api.route('/available-vehicles', methods=['GET'])
+def get_available_vehicles():
+	"""
+	Finds the vehicles that are free between the start and end query
+	parameters (YYYY-MM-DD), optionally filtered by the type parameter.
+
+	Returns
+	-------
+	flask.Response
+	    a JSON list of the free vehicle objects.
+	"""
+	try:
+		try:
+			start_date = date.fromisoformat(request.args['start'])
+			end_date = date.fromisoformat(request.args['end'])
+			vehicles = vehicle_service.find_available_vehicles(request.args.get('type'), start_date, end_date)
+		except (KeyError, ValueError):
+			raise BadRequest()
+		return jsonify(vehicles=vehicles), 200
+	except HTTPException as error:
+		return error_response(error, "The start and end parameters must be dates (YYYY-MM-DD) with start before end")
+
+
+# HTTP GET -> an endpoint to check a vehicle's availability
+@api.route('/vehicle-availability/<int:vehicle_id>', methods=['GET'])
+def get_vehicle_availability(vehicle_id):
+	"""
+	Checks whether a vehicle is free between the start and end query
+	parameters (YYYY-MM-DD).
+
+	Parameters
+	----------
+	vehicle_id : int
+	    The vehicle_id of the vehicle to check.
+	Returns
+	-------
+	flask.Response
+	    a JSON of the vehicle's availability.
+	"""
+	try:
+		try:
+			start_date = date.fromisoformat(request.args['start'])
+			end_date = date.fromisoformat(request.args['end'])
+			available = booking_service.is_vehicle_available(vehicle_id, start_date, end_date)
+		except (KeyError, ValueError):
+			raise BadRequest()
+		return jsonify(vehicle_id=vehicle_id, available=available), 200
+	except HTTPException as error:
+		return error_response(error, "The start and end parameters must be dates (YYYY-MM-DD) with start before end")
+
+
+# HTTP GET -> an endpoint for the fleet's availability calendar
+@api.route('/availability-calendar', methods=['GET'])
+def get_availability_calendar():
+	"""
+	Gets which vehicles in service are booked on each day of the calendar
+	starting on the start query parameter (YYYY-MM-DD, defaults to today),
+	optionally filtered by the type parameter. Each vehicle's days come
+	as one integer in booked, parallel to vehicle_ids, with bit i set if
+	the vehicle is on hire on start + i days. Given free_start and
+	free_end (the return date), the ids of the vehicles free for the
+	whole hire are listed in free.
+
+	Returns
+	-------
+	flask.Response
+	    a JSON of the calendar.
+	"""
+	args = request.args
+	try:
+		try:
+			calendar = availability_calendar.calendar(
+				args.get('type'),
+				date.fromisoformat(args['start']) if 'start' in args else None,
+				date.fromisoformat(args['free_start']) if 'free_start' in args else None,
+				date.fromisoformat(args['free_end']) if 'free_end' in args else None
+			)
+		except ValueError:
+			raise BadRequest()
+		return jsonify(calendar), 200
+	except HTTPException as error:
+		return error_response(error, "The start, free_start and free_end parameters must be dates (YYYY-MM-DD) with the hire inside the calendar")
+
+
+# HTTP POST -> an endpoint to invoice many bookings at once
+@api.route('/generate-invoices', methods=['POST'])
+def generate_invoices():
+	"""
+	Invoices the bookings in a JSON body of either booking_ids, a list of
+	booking ids, or start and end dates (YYYY-MM-DD, end exclusive) to
+	invoice every booking hired in between. Bookings that already have
+	an invoice are skipped.
+
+	Returns
+	-------
+	flask.Response
+	    a JSON of the number of invoices generated and their total amount.
+	"""
+	data = request.json
+	try:
+		try:
+			if not isinstance(data, dict):
+				raise ValueError("Invalid data")
+			if 'booking_ids' in data:
+				if not isinstance(data['booking_ids'], list):
+					raise ValueError("Invalid booking_ids")
+				invoices = invoice_service.generate_invoices([int(booking_id) for booking_id in data['booking_ids']])
+			else:
+				invoices = invoice_service.generate_invoices(
+					start_date=date.fromisoformat(data['start']),
+					end_date=date.fromisoformat(data['end'])
+				)
+		except (KeyError, TypeError, ValueError):
+			raise BadRequest()
+		total_amount = sum(invoice['total_amount'] for invoice in invoices)
+		return jsonify(generated=len(invoices), total_amount=total_amount), 200
+	except HTTPException as error:
+		return error_response(error, "Provide booking_ids or start and end dates (YYYY-MM-DD) with start before end")
+
+
+# HTTP GET -> an endpoint to report fleet utilization
+@api.route('/utilization', methods=['GET'])
+def get_utilization():
+	"""
+	Reports the share of days booked per vehicle, vehicle type and week,
+	with invoiced revenue, between the start and end query parameters
+	(YYYY-MM-DD, end exclusive).
+
+	Returns
+	-------
+	flask.Response
+	    a JSON of the utilization report.
+	"""
+	try:
+		try:
+			start_date = date.fromisoformat(request.args['start'])
+			end_date = date.fromisoformat(request.args['end'])
+			report = utilization_service.utilization_report(start_date, end_date)
+		except (KeyError, ValueError):
+			raise BadRequest()
+		return jsonify(report), 200
+	except HTTPException as error:
+		return error_response(error, "The start and end parameters must be dates (YYYY-MM-DD) with start before end")
+
+
+# HTTP GET -> an endpoint to stream the daily bookings report
+@api.route('/daily-report', methods=['GET'])
+def get_daily_report():
+	"""
+	Gets the bookings for a day, today unless the date query parameter
+	(YYYY-MM-DD) is given, as CSV or NDJSON chosen by the format query
+	parameter. Days with a snapshot are served from it with an ETag,
+	other days are streamed from the database.
+
+	Returns
+	-------
+	flask.Response
+	    a CSV or NDJSON report of the day's bookings.
+	"""
+	report_format = request.args.get('format', 'csv')
+	mimetypes = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+	try:
+		try:
+			report_date = date.fromisoformat(request.args['date']) if 'date' in request.args else date.today()
+			if report_format not in mimetypes:
+				raise ValueError("Invalid report format")
+		except ValueError:
+			raise BadRequest()
+	except HTTPException as error:
+		return error_response(error, "The format parameter must be csv or ndjson and the date parameter a date (YYYY-MM-DD)")
+
+	headers = {}
+	if report_format == 'csv':
+		headers['Content-Disposition'] = f'attachment; filename=daily-report-{report_date}.csv'
+
+	snapshot = report_scheduler.get(report_date) if current_app.config['REPORT_SNAPSHOTS'] else None
+	if snapshot is not None:
+		etag = f'{snapshot.etag}-{report_format}'
+		if request.if_none_match.contains(etag):
+			response = Response(status=304)
+		else:
+			response = Response(snapshot.render(report_format), mimetype=mimetypes[report_format], headers=headers)
+		response.set_etag(etag)
+		return response
+
+	chunks = booking_service.stream_daily_report(report_format, report_date)
+	return Response(stream_with_context(chunks), mimetype=mimetypes[report_format], headers=headers)
+
+
+# HTTP GET -> an endpoint to scrape the query and cache metrics
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+	"""
+	Gets the statement latency histograms, row counts, slow query counts,
+	statements per request, cache stats and connection pool stats in the
+	Prometheus text format.
+
+	Returns
+	-------
+	flask.Response
+	    the metrics page.
+	"""
+	components = current_app.extensions['car_hire']
+	metrics, caches, pools = db_manager.metrics, cache_stats(components), db_manager.pool_stats()
+	if components['shared_metrics'] is not None:
+		# This worker's latest counts, added to every other worker's
+		publish_metrics(components, force=True)
+		metrics, caches, pools = components['shared_metrics'].collect()
+	return Response(metrics.render(caches, pools), mimetype='text/plain; version=0.0.4')
+
+
+@api.cli.command('migrate')
+@click.option('--target', type=int, default=None, help='The version to migrate to, defaults to the latest.')
+def migrate_command(target):
+	"""
+	Creates or upgrades the database schema. Run once per deployment,
+	before starting the workers.
+	"""
+	applied = migrations.migrate(db_manager, target)
+	if applied:
+		click.echo(f"Applied migrations {', '.join(map(str, applied))}")
+	click.echo(f"The database is at version {migrations.current_version(db_manager)}")
+
+
+@api.cli.command('schema-version')
+def schema_version_command():
+	"""
+	Shows the database schema version and the migrations still to apply.
+	"""
+	click.echo(f"The database is at version {migrations.current_version(db_manager)}")
+	for version, description, _ in migrations.pending_migrations(db_manager):
+		click.echo(f"Pending migration {version}: {description}")
+
+
+@api.cli.command('rates')
+def rates_command():
+	"""
+	Shows the daily rate of each vehicle type.
+	"""
+	for vehicle_type, daily_rate in sorted(rate_dao.get_rates().items()):
+		click.echo(f"{vehicle_type}: {daily_rate:.2f}")
+
+
+@api.cli.command('set-rate')
+@click.argument('vehicle_type')
+@click.argument('daily_rate', type=float)
+def set_rate_command(vehicle_type, daily_rate):
+	"""
+	Sets the daily rate invoices charge for a vehicle type. Running
+	servers read the rates once, so restart them to charge the new rate.
+	"""
+	rate_dao.set_rate(vehicle_type, daily_rate)
+	click.echo(f"Set the daily rate of {vehicle_type} to {daily_rate:.2f}")
+
+
+@api.cli.command('check-replicas')
+def check_replicas_command():
+	"""
+	Checks that every read replica can be reached.
+	"""
+	for name, up in db_manager.check_replicas().items():
+		click.echo(f"{name}: {'up' if up else 'down'}")
+
+
+@api.cli.command('generate-daily-report')
+@click.option('--date', 'report_date', default=None, help='The day to report on (YYYY-MM-DD), defaults to today.')
+def generate_daily_report_command(report_date):
+	"""
+	Generates the daily report snapshot, for running from cron at REPORT_TIME.
+	"""
+	report_date = date.fromisoformat(report_date) if report_date else None
+	snapshot = report_scheduler.generate(report_date)
+	click.echo(f"Generated the {snapshot.report_date} report with {len(snapshot.rows)} bookings")
+
+
+@api.cli.command('dispatch-notifications')
+def dispatch_notifications_command():
+	"""
+	Sends every due notification in the outbox, for running from cron
+	instead of the worker threads.
+	"""
+	sent = notification_dispatcher.drain()
+	click.echo(f"Dispatched {sent} notifications")
 
 
 if __name__ == '__main__':
-	app.run(debug=True)
+	create_app().run(debug=True)
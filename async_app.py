@@ -0,0 +1,329 @@
+from datetime import date
+
+from quart import Blueprint, Quart, Response, current_app, jsonify, request
+from quart.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import BadRequest, HTTPException, NotFound
+from werkzeug.local import LocalProxy
+from database.async_db import AsyncDatabaseManager
+from models.async_daos import AsyncCustomerDAO, AsyncVehicleDAO
+from models.cache import LRUCache
+from models.json_provider import record_default
+from responses import error_response, not_modified, record_response
+from services.async_services import AsyncCustomerService, AsyncVehicleService
+from decouple import Config, RepositoryEnv
+
+DOTENV_FILE = './envs.env'
+
+# The async deployment mode: the same endpoints as app.py served by async
+# views on an aiomysql pool, e.g. hypercorn 'async_app:create_app()'.
+# The routes are registered on the app by create_app
+api = Blueprint('api', __name__)
+
+
+class RecordJSONProvider(DefaultJSONProvider):
+	sort_keys = False
+	default = record_default(DefaultJSONProvider.default)
+
+
+def create_app(dotenv_file=DOTENV_FILE):
+	"""
+	Builds the async application from the settings in the dotenv file.
+	The connection pool is opened when the app starts serving.
+
+	Parameters
+	----------
+	dotenv_file : str
+		The settings file.
+
+	Returns
+	-------
+	quart.Quart
+		The application, with its DAOs and services in
+		app.extensions['car_hire'].
+	"""
+	app = Quart(__name__)
+	app.json = RecordJSONProvider(app)
+	config = Config(RepositoryEnv(dotenv_file))
+	mysql_config = {
+		'host': config('DB_HOST'),
+		'user': config('DB_USER'),
+		'password': config('DB_PASSWORD'),
+		'database': config('DB_DATABASE'),
+		'pool_size': config('DB_POOL_SIZE', default=10, cast=int),
+		'idle_timeout': config('DB_POOL_IDLE_TIMEOUT', default=300, cast=float),
+		'slow_query_threshold': config('DB_SLOW_QUERY_THRESHOLD', default=0.5, cast=float)
+	}
+	db_manager = AsyncDatabaseManager(**mysql_config)
+
+	# Create DAOs, and Services
+	batch_size = config('DB_BATCH_SIZE', default=500, cast=int)
+	cache_max_size = config('CACHE_MAX_SIZE', default=10000, cast=int)
+	cache_ttl = config('CACHE_TTL', default=300, cast=float)
+	customer_dao = AsyncCustomerDAO(db_manager, batch_size=batch_size, cache=LRUCache(cache_max_size, cache_ttl))
+	customer_service = AsyncCustomerService(customer_dao)
+	vehicle_dao = AsyncVehicleDAO(db_manager, batch_size=batch_size, cache=LRUCache(cache_max_size, cache_ttl))
+	vehicle_service = AsyncVehicleService(vehicle_dao)
+
+	# The Cache-Control header of each entity's GET route, as in app.py
+	app.config['CACHE_CONTROL'] = {
+		name: config(f'CACHE_CONTROL_{name.upper()}', default='no-cache')
+		for name in ('customer', 'vehicle', 'booking', 'invoice')
+	}
+
+	@app.before_serving
+	async def connect_database():
+		await db_manager.connect()
+
+	@app.after_serving
+	async def close_database():
+		await db_manager.close()
+
+	app.extensions['car_hire'] = {
+		'db_manager': db_manager,
+		'customer_dao': customer_dao,
+		'customer_service': customer_service,
+		'vehicle_dao': vehicle_dao,
+		'vehicle_service': vehicle_service
+	}
+	app.register_blueprint(api)
+	return app
+
+
+def _component(name):
+	# The routes below use these proxies to the current app's DAOs and
+	# services, so they read as if the services were module globals
+	return LocalProxy(lambda: current_app.extensions['car_hire'][name])
+
+
+db_manager = _component('db_manager')
+customer_dao = _component('customer_dao')
+customer_service = _component('customer_service')
+vehicle_dao = _component('vehicle_dao')
+vehicle_service = _component('vehicle_service')
+
+
+@api.route('/')
+async def hello_world():
+	return 'Hello World!'
+
+
+# HTTP GET -> an endpoint to get customer
+@api.route('/get-customer/<int:customer_id>', methods=['GET'])
+async def get_customer(customer_id):
+	"""
+	Gets customer by customer_id.
+
+	Parameters
+	----------
+	customer_id : int
+	    The customer_id of the customer to be retrieved from database.
+	Returns
+	-------
+	quart.Response
+	    a JSON of the customer object.
+	"""
+	return await entity_response(customer_service, 'customer', customer_id)
+
+
+async def entity_response(service, name, record_id):
+	"""
+	Serves one record with the ETag of its row version, answering 304
+	from the version alone when If-None-Match holds the current ETag. The
+	async counterpart of app.entity_response.
+
+	Parameters
+	----------
+	service : AsyncBaseService
+	    The service of the entity being served.
+	name : str
+	    The JSON key for the record.
+	record_id : int
+	    The record's id.
+	Returns
+	-------
+	quart.Response
+	    a JSON of the record, or an empty 304 if the client's copy is current.
+	"""
+	try:
+		if request.if_none_match:
+			response = not_modified(current_app, request, name, record_id, await service.get_record_version(record_id))
+			if response is not None:
+				return response
+		try:
+			record = await service.get_record(record_id)
+		except ValueError:
+			raise NotFound()
+		return record_response(current_app, name, record)
+	except HTTPException as error:
+		return error_response(error, f"{name.capitalize()} with id: {record_id} was not found in the database")
+
+
+# HTTP PUT -> an endpoint to update customer
+@api.route('/update-customer/<int:customer_id>', methods=['PUT'])
+async def update_customer(customer_id):
+	"""
+	Updates customer data.
+
+	Parameters
+	----------
+	customer_id : int
+	    The customer_id of the customer to be updated in the database.
+	Returns
+	-------
+	quart.Response
+	    a JSON of the customer object.
+	"""
+	customer_data = await request.get_json()
+	try:
+		customer = await customer_service.update_customer(customer_id, customer_data)
+		return record_response(current_app, 'customer', customer, key='updated_customer'), 200
+	except HTTPException as error:
+		return error_response(error, f"The Customer with {customer_id} could not be updated")
+
+
+# HTTP POST -> an endpoint to add new customer
+@api.route('/add-customer', methods=['POST'])
+async def add_customer():
+	"""
+	Adds customer to database.
+
+	Returns
+	-------
+	quart.Response
+	    a JSON of the customer object.
+	"""
+	customer_data = await request.get_json()
+	try:
+		customer = await customer_service.add_customer(customer_data)
+		return record_response(current_app, 'customer', customer, key='customer'), 200
+	except HTTPException as error:
+		return error_response(error, f"The Customer could not be added to the database")
+
+
+# HTTP DELETE -> an endpoint to delete customer
+@api.route('/delete-customer/<int:customer_id>', methods=['DELETE'])
+async def delete_customer(customer_id):
+	"""
+	Deletes customer from database.
+
+	Parameters
+	----------
+	customer_id : int
+	    The customer_id of the customer to be deleted in the database.
+	Returns
+	-------
+	quart.Response
+	    a JSON of the customer object.
+	"""
+	try:
+		await customer_service.delete_customer(customer_id)
+		return jsonify(success='success'), 200
+	except HTTPException as error:
+		return error_response(error, f"Customer with id: {customer_id} could not be deleted")
+
+
+# HTTP GET -> an endpoint to get many customers
+@api.route('/get-customers', methods=['GET'])
+async def get_customers():
+	"""
+	Gets many customers by the comma separated customer_ids in the ids
+	query parameter.
+
+	Returns
+	-------
+	quart.Response
+	    a JSON list of the customer objects that were found.
+	"""
+	try:
+		try:
+			customer_ids = [int(customer_id) for customer_id in request.args.get('ids', '').split(',') if customer_id]
+		except ValueError:
+			raise BadRequest()
+		customers = await customer_service.get_customers(customer_ids)
+		return jsonify(customers=customers), 200
+	except HTTPException as error:
+		return error_response(error, "The ids parameter must be a comma separated list of customer ids")
+
+
+# HTTP POST -> an endpoint to add many customers
+@api.route('/add-customers', methods=['POST'])
+async def add_customers():
+	"""
+	Adds a JSON list of customers to the database in batches.
+
+	Returns
+	-------
+	quart.Response
+	    a JSON of the number of customers added.
+	"""
+	customers_data = await request.get_json()
+	try:
+		added = await customer_service.add_customers(customers_data)
+		return jsonify(added=added), 200
+	except HTTPException as error:
+		return error_response(error, f"The Customers could not be added to the database")
+
+
+# HTTP PUT -> an endpoint to update many customers
+@api.route('/update-customers', methods=['PUT'])
+async def update_customers():
+	"""
+	Updates a JSON list of customers in batches, each customer must
+	include its customer_id.
+
+	Returns
+	-------
+	quart.Response
+	    a JSON of the number of customers updated.
+	"""
+	customers_data = await request.get_json()
+	try:
+		updated = await customer_service.update_customers(customers_data)
+		return jsonify(updated=updated), 200
+	except HTTPException as error:
+		return error_response(error, f"The Customers could not be updated")
+
+
+# HTTP GET -> an endpoint to find free vehicles
+@api.route('/available-vehicles', methods=['GET'])
+async def get_available_vehicles():
+	"""
+	Finds the vehicles that are free between the start and end query
+	parameters (YYYY-MM-DD), optionally filtered by the type parameter.
+
+	Returns
+	-------
+	quart.Response
+	    a JSON list of the free vehicle objects.
+	"""
+	try:
+		try:
+			start_date = date.fromisoformat(request.args['start'])
+			end_date = date.fromisoformat(request.args['end'])
+			vehicles = await vehicle_service.find_available_vehicles(request.args.get('type'), start_date, end_date)
+		except (KeyError, ValueError):
+			raise BadRequest()
+		return jsonify(vehicles=vehicles), 200
+	except HTTPException as error:
+		return error_response(error, "The start and end parameters must be dates (YYYY-MM-DD) with start before end")
+
+
+# HTTP GET -> an endpoint to scrape the query and cache metrics
+@api.route('/metrics', methods=['GET'])
+async def get_metrics():
+	"""
+	Gets the statement latency histograms, row counts, slow query counts
+	and cache stats in the Prometheus text format.
+
+	Returns
+	-------
+	quart.Response
+	    the metrics page.
+	"""
+	caches = {'customer': customer_dao.cache, 'vehicle': vehicle_dao.cache, 'statement': AsyncCustomerDAO.statement_cache}
+	stats = {name: cache.stats() for name, cache in caches.items()}
+	return Response(db_manager.metrics.render(stats), mimetype='text/plain; version=0.0.4')
+
+
+if __name__ == '__main__':
+	create_app().run(port=5001)
@@ -0,0 +1,161 @@
+"""
+Stress tests booking creation under contention: many threads book a
+handful of vehicles for random, overlapping windows at once. Every
+attempt either creates a booking or is refused because the vehicle is
+taken, and afterwards the database is checked for overlapping bookings
+of the same vehicle. Exits with status 1 if any are found.
+
+    python -m benchmarks.booking_contention --database car_hire_bench
+    python -m benchmarks.booking_contention --sqlite /tmp/car_hire_bench.db
+
+The vehicles and customer it books are created by each run, so it can
+be pointed at a seeded benchmark database without disturbing it.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+import pymysql
+from decouple import Config, RepositoryEnv
+
+from benchmarks.http_load import summarize
+from database import migrations
+from database.backends import SQLiteBackend
+from database.db import DatabaseManager
+from models.daos import BookingDAO, CustomerDAO, VehicleDAO
+from services.booking_service import BookingServices
+from services.vehicle_service import VehicleService
+
+DOTENV_FILE = './envs.env'
+
+OVERLAP_QUERY = """
+	SELECT COUNT(*)
+	FROM Booking a
+	JOIN Booking b ON b.vehicle_id = a.vehicle_id AND b.booking_id > a.booking_id
+	WHERE a.date_hired < b.return_date
+	AND b.date_hired < a.return_date
+	AND a.vehicle_id IN
+"""
+
+
+def count_double_bookings(db_manager, vehicle_ids):
+	"""
+	Returns
+	-------
+	int
+		The number of pairs of overlapping bookings of the vehicles.
+	"""
+	with db_manager.connection() as conn, conn.cursor() as cursor:
+		sql = OVERLAP_QUERY + f"({', '.join(['%s'] * len(vehicle_ids))})"
+		db_manager.execute(cursor, sql, vehicle_ids)
+		return cursor.fetchone()[0]
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--database', help='The scratch database to use instead of DB_DATABASE.')
+	parser.add_argument('--sqlite', metavar='PATH', help='Run on an SQLite file instead of MySQL.')
+	parser.add_argument('--vehicles', type=int, default=3, help='Vehicles to contend for.')
+	parser.add_argument('--concurrency', type=int, default=16)
+	parser.add_argument('--attempts', type=int, default=2000, help='Booking attempts across all threads.')
+	parser.add_argument('--seed', type=int, default=42)
+	args = parser.parse_args()
+
+	config = Config(RepositoryEnv(DOTENV_FILE))
+	db_manager = DatabaseManager(
+		host=config('DB_HOST'),
+		user=config('DB_USER'),
+		password=config('DB_PASSWORD'),
+		database=args.database or config('DB_DATABASE'),
+		backend=SQLiteBackend(args.sqlite) if args.sqlite else None,
+		pool_size=args.concurrency + 2
+	)
+	migrations.migrate(db_manager)
+
+	vehicle_dao = VehicleDAO(db_manager)
+	booking_service = BookingServices(BookingDAO(db_manager), VehicleService(vehicle_dao))
+	customer = CustomerDAO(db_manager).add({
+		"first_name": "Contention",
+		"last_name": "Test",
+		"email": "contention@example.com",
+		"phone": "07000000000"
+	})
+	vehicle_ids = [
+		vehicle_dao.add({
+			"type": "small car",
+			"model": "Fiesta",
+			"make": "Ford",
+			"year": 2020,
+			"registration_number": f"CT{number:02d} TST",
+			"available": True
+		})['vehicle_id']
+		for number in range(args.vehicles)
+	]
+
+	remaining = iter(range(args.attempts))
+	remaining_lock = threading.Lock()
+	latencies = []
+	outcomes = {"booked": 0, "refused": 0, "deadlocks": 0, "errors": 0}
+	results_lock = threading.Lock()
+
+	def worker(worker_seed):
+		rng = random.Random(worker_seed)
+		while True:
+			with remaining_lock:
+				if next(remaining, None) is None:
+					return
+			start = date.today() + timedelta(days=rng.randint(0, 7))
+			booking = {
+				"customer_id": customer['customer_id'],
+				"vehicle_id": rng.choice(vehicle_ids),
+				"date_hired": start,
+				"return_date": start + timedelta(days=rng.randint(1, 7)),
+				"payment_status": "unpaid"
+			}
+			started = time.perf_counter()
+			try:
+				booking_service.create_booking(booking)
+				outcome = "booked"
+			except ValueError:
+				outcome = "refused"
+			except pymysql.err.OperationalError as error:
+				outcome = "deadlocks" if error.args[0] == 1213 else "errors"
+			except pymysql.err.Error:
+				outcome = "errors"
+			with results_lock:
+				latencies.append(time.perf_counter() - started)
+				outcomes[outcome] += 1
+
+	threads = [
+		threading.Thread(target=worker, args=(args.seed + number,))
+		for number in range(args.concurrency)
+	]
+	started = time.perf_counter()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	elapsed = time.perf_counter() - started
+
+	summary = summarize(latencies, elapsed, outcomes["errors"] + outcomes["deadlocks"])
+	double_bookings = count_double_bookings(db_manager, vehicle_ids)
+	print(
+		f"{args.attempts} attempts on {args.vehicles} vehicles, c={args.concurrency}: "
+		f"{outcomes['booked']} booked, {outcomes['refused']} refused, "
+		f"{outcomes['deadlocks']} deadlocks after retries, {outcomes['errors']} errors"
+	)
+	print(
+		f"{outcomes['booked'] / elapsed:.1f} bookings/s, {summary['throughput']:.1f} attempts/s  "
+		f"p50 {summary['p50_ms']:.2f}  p95 {summary['p95_ms']:.2f}  p99 {summary['p99_ms']:.2f} ms"
+	)
+	print(f"{double_bookings} double bookings")
+	db_manager.close()
+	if double_bookings:
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,57 @@
+"""
+Measures how long a fresh worker process takes to import and create
+the app, and optionally to answer its first request, which is where
+the database connection is now opened.
+
+    python -m benchmarks.boot_time --runs 20
+    python -m benchmarks.boot_time --runs 20 --first-request /get-customer/1
+
+Each run starts a new interpreter, so imports are measured cold.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from benchmarks.http_load import percentile
+
+BOOT = """
+import json, time
+started = time.perf_counter()
+from app import create_app
+app = create_app()
+booted = time.perf_counter()
+first_request = None
+if {path!r}:
+	app.test_client().get({path!r})
+	first_request = time.perf_counter()
+print(json.dumps({{"boot": booted - started, "first_request": first_request and first_request - started}}))
+"""
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--runs', type=int, default=10)
+	parser.add_argument('--first-request', default='', help='A path to request once the app is created.')
+	args = parser.parse_args()
+
+	boots, first_requests = [], []
+	for _ in range(args.runs):
+		output = subprocess.check_output([sys.executable, '-c', BOOT.format(path=args.first_request)], text=True)
+		timings = json.loads(output.strip().splitlines()[-1])
+		boots.append(timings["boot"])
+		if timings["first_request"] is not None:
+			first_requests.append(timings["first_request"])
+
+	for name, samples in (("import + create_app", boots), ("until first response", first_requests)):
+		if samples:
+			samples.sort()
+			print(
+				f"{name:<22} median {statistics.median(samples) * 1000:8.1f} ms  "
+				f"p95 {percentile(samples, 0.95) * 1000:8.1f} ms  over {len(samples)} runs"
+			)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,72 @@
+"""
+Compares two benchmark result files written by benchmarks.run and exits
+with status 1 if any scenario regressed by more than the threshold:
+lower throughput, higher p95 latency, or more statements per request.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+
+def load_results(path):
+	with open(path) as results_file:
+		data = json.load(results_file)
+	return data, {(result["scenario"], result["concurrency"]): result for result in data["results"]}
+
+
+def find_regressions(baseline, candidate, threshold):
+	"""
+	Parameters
+	----------
+	baseline : dict
+		Results keyed by (scenario, concurrency).
+	candidate : dict
+		Results keyed by (scenario, concurrency).
+	threshold : float
+		The tolerated relative change as a fraction, e.g. 0.1.
+
+	Returns
+	-------
+	list
+		(scenario, concurrency, message) for every regression.
+	"""
+	regressions = []
+	for key in sorted(set(baseline) & set(candidate)):
+		old, new = baseline[key], candidate[key]
+		if new["throughput"] < old["throughput"] * (1 - threshold):
+			regressions.append(key + (f"throughput {old['throughput']:.1f} -> {new['throughput']:.1f} ops/s",))
+		if new["p95_ms"] > old["p95_ms"] * (1 + threshold):
+			regressions.append(key + (f"p95 {old['p95_ms']:.2f} -> {new['p95_ms']:.2f} ms",))
+		if new["queries_per_request"] > old["queries_per_request"] + 0.01:
+			regressions.append(key + (
+				f"queries/request {old['queries_per_request']:.2f} -> {new['queries_per_request']:.2f}",))
+	return regressions
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('baseline')
+	parser.add_argument('candidate')
+	parser.add_argument('--threshold', type=float, default=10.0, help='Tolerated change in percent.')
+	args = parser.parse_args()
+
+	baseline_data, baseline = load_results(args.baseline)
+	candidate_data, candidate = load_results(args.candidate)
+	if baseline_data["volumes"] != candidate_data["volumes"]:
+		print(f"Warning: volumes differ {baseline_data['volumes']} vs {candidate_data['volumes']}")
+
+	for key in sorted(set(baseline) & set(candidate)):
+		old, new = baseline[key], candidate[key]
+		change = (new["throughput"] - old["throughput"]) / old["throughput"] * 100 if old["throughput"] else 0.0
+		print(f"{key[0]:<36} c={key[1]:<3} {old['throughput']:9.1f} -> {new['throughput']:9.1f} ops/s ({change:+.1f}%)")
+
+	regressions = find_regressions(baseline, candidate, args.threshold / 100)
+	for scenario, concurrency, message in regressions:
+		print(f"REGRESSION {scenario} c={concurrency}: {message}")
+	sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,48 @@
+"""
+Benchmarks the synchronous (app.py) and async (async_app.py) deployment
+modes side by side on the customer lookup endpoint. Start both servers
+against the same database first, e.g.
+
+    flask --app app run --port 5000
+    hypercorn "async_app:create_app()" --bind 127.0.0.1:5001
+
+then run
+
+    python -m benchmarks.compare_modes --customer-ids 1-100
+"""
+import argparse
+import json
+
+from benchmarks.http_load import run_load
+
+
+def parse_id_range(value):
+	first, _, last = value.partition('-')
+	return list(range(int(first), int(last or first) + 1))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--sync-url', default='http://127.0.0.1:5000')
+	parser.add_argument('--async-url', default='http://127.0.0.1:5001')
+	parser.add_argument('--customer-ids', type=parse_id_range, default=parse_id_range('1-100'))
+	parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50, 200])
+	parser.add_argument('--requests', type=int, default=2000)
+	args = parser.parse_args()
+
+	paths = [f'/get-customer/{customer_id}' for customer_id in args.customer_ids]
+	results = []
+	for concurrency in args.concurrency:
+		for mode, url in (('sync', args.sync_url), ('async', args.async_url)):
+			summary = run_load(url, paths, concurrency, args.requests)
+			results.append({"mode": mode, "concurrency": concurrency, **summary})
+			print(
+				f"{mode:>5} c={concurrency:<4} {summary['throughput']:8.1f} req/s  "
+				f"p50 {summary['p50_ms']:7.2f} ms  p95 {summary['p95_ms']:7.2f} ms  "
+				f"p99 {summary['p99_ms']:7.2f} ms  errors {summary['errors']}"
+			)
+	print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,119 @@
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(samples, fraction):
+	"""
+	Parameters
+	----------
+	samples : list
+		Sorted samples.
+	fraction : float
+		The percentile as a fraction, e.g. 0.95.
+
+	Returns
+	-------
+	float
+		The nearest-rank percentile, or 0 if there are no samples.
+	"""
+	if not samples:
+		return 0.0
+	index = min(len(samples) - 1, max(0, int(round(fraction * len(samples))) - 1))
+	return samples[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+	"""
+	Summarizes a load run.
+
+	Parameters
+	----------
+	latencies : list
+		Per-request latencies in seconds.
+	elapsed : float
+		Wall clock seconds the run took.
+	errors : int
+		The number of failed requests.
+
+	Returns
+	-------
+	dict
+		The request count, errors, throughput and p50/p95/p99 latency in
+		milliseconds.
+	"""
+	latencies = sorted(latencies)
+	return {
+		"requests": len(latencies),
+		"errors": errors,
+		"throughput": len(latencies) / elapsed if elapsed else 0.0,
+		"p50_ms": percentile(latencies, 0.50) * 1000,
+		"p95_ms": percentile(latencies, 0.95) * 1000,
+		"p99_ms": percentile(latencies, 0.99) * 1000
+	}
+
+
+def run_load(base_url, paths, concurrency, total_requests, method="GET"):
+	"""
+	Sends total_requests HTTP requests from concurrency threads, each
+	thread on its own keep-alive connection, cycling through paths.
+
+	Parameters
+	----------
+	base_url : str
+		The server's base URL, e.g. http://127.0.0.1:5000.
+	paths : list
+		The request paths to cycle through.
+	concurrency : int
+		The number of requests in flight at once.
+	total_requests : int
+		The number of requests to send.
+	method : str
+		The HTTP method.
+
+	Returns
+	-------
+	dict
+		The summary of the run, see summarize.
+	"""
+	url = urlsplit(base_url)
+	latencies = []
+	errors = [0]
+	counter = iter(range(total_requests))
+	lock = threading.Lock()
+
+	def worker():
+		connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+		local_latencies = []
+		local_errors = 0
+		while True:
+			with lock:
+				index = next(counter, None)
+			if index is None:
+				break
+			started = time.perf_counter()
+			try:
+				connection.request(method, paths[index % len(paths)])
+				response = connection.getresponse()
+				response.read()
+				if response.status >= 500:
+					local_errors += 1
+			except (OSError, http.client.HTTPException):
+				local_errors += 1
+				connection.close()
+				connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+				continue
+			local_latencies.append(time.perf_counter() - started)
+		connection.close()
+		with lock:
+			latencies.extend(local_latencies)
+			errors[0] += local_errors
+
+	threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+	started = time.perf_counter()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	return summarize(latencies, time.perf_counter() - started, errors[0])
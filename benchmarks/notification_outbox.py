@@ -0,0 +1,165 @@
+"""
+Checks the notification outbox end to end: bookings are enqueued, the
+dispatcher claims and sends them to a FileSink, and a failing sink is
+retried with backoff until the notifications are given up on. Exits
+with status 1 if any step leaves the outbox in the wrong state.
+
+    python -m benchmarks.notification_outbox --sqlite /tmp/car_hire_outbox.db
+    python -m benchmarks.notification_outbox --database car_hire_bench
+
+The customer, vehicle and bookings it notifies about are created by
+each run, and the letters are written to a fresh temporary directory.
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+from decouple import Config, RepositoryEnv
+
+from database import migrations
+from database.backends import SQLiteBackend
+from database.db import DatabaseManager
+from models.daos import BookingDAO, CustomerDAO, NotificationDAO, VehicleDAO
+from services.notifications import BOOKING_CONFIRMATION, FileSink, NotificationDispatcher
+
+DOTENV_FILE = './envs.env'
+
+
+def outbox_state(notification_dao, notification_ids):
+	"""
+	Returns
+	-------
+	dict
+		The notifications as they are now in the database, by id.
+	"""
+	return {
+		notification['notification_id']: notification
+		for notification in notification_dao.get_many(notification_ids)
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--database', help='The scratch database to use instead of DB_DATABASE.')
+	parser.add_argument('--sqlite', metavar='PATH', help='Run on an SQLite file instead of MySQL.')
+	parser.add_argument('--notifications', type=int, default=25, help='Notifications per check.')
+	parser.add_argument('--batch-size', type=int, default=10)
+	args = parser.parse_args()
+
+	config = Config(RepositoryEnv(DOTENV_FILE))
+	db_manager = DatabaseManager(
+		host=config('DB_HOST'),
+		user=config('DB_USER'),
+		password=config('DB_PASSWORD'),
+		database=args.database or config('DB_DATABASE'),
+		backend=SQLiteBackend(args.sqlite) if args.sqlite else None
+	)
+	migrations.migrate(db_manager)
+
+	notification_dao = NotificationDAO(db_manager)
+	booking_dao = BookingDAO(db_manager)
+	customer = CustomerDAO(db_manager).add({
+		"first_name": "Outbox",
+		"last_name": "Test",
+		"email": "outbox@example.com",
+		"phone": "07000000000"
+	})
+	vehicle = VehicleDAO(db_manager).add({
+		"type": "small car",
+		"model": "Fiesta",
+		"make": "Ford",
+		"year": 2020,
+		"registration_number": "OB01 TST",
+		"available": True
+	})
+
+	def enqueue(count):
+		notification_ids = []
+		for number in range(count):
+			start = date.today() + timedelta(days=7 + number)
+			booking = booking_dao.add({
+				"customer_id": customer['customer_id'],
+				"vehicle_id": vehicle['vehicle_id'],
+				"date_hired": start,
+				"return_date": start + timedelta(days=1),
+				"payment_status": "unpaid"
+			})
+			notification_ids.append(notification_dao.enqueue(booking['booking_id'], BOOKING_CONFIRMATION)['notification_id'])
+		return notification_ids
+
+	problems = []
+	with tempfile.TemporaryDirectory() as scratch:
+		# Delivered: every letter is written and its notification SENT.
+		# The sink's directory doesn't exist until the first send
+		directory = os.path.join(scratch, 'outbox')
+		sent_ids = enqueue(args.notifications)
+		dispatcher = NotificationDispatcher(
+			notification_dao, FileSink(directory), "bookings@example.com", batch_size=args.batch_size
+		)
+		claimed = dispatcher.drain()
+		state = outbox_state(notification_dao, sent_ids)
+		unsent = [notification_id for notification_id in sent_ids if state[notification_id]['status'] != NotificationDAO.SENT]
+		missing = [
+			notification_id for notification_id in sent_ids
+			if not os.path.exists(os.path.join(directory, f"notification-{notification_id}.eml"))
+		]
+		print(f"delivered: claimed {claimed}, {len(sent_ids) - len(unsent)} of {len(sent_ids)} SENT, {len(missing)} letters missing")
+		if claimed != len(sent_ids) or unsent or missing:
+			problems.append("delivered notifications were not all sent")
+
+		# Leased: a claimed batch is hidden from other workers
+		leased_ids = enqueue(args.batch_size)
+		first = notification_dao.claim_due(args.batch_size, lease_seconds=300)
+		second = notification_dao.claim_due(args.batch_size, lease_seconds=300)
+		print(f"leased: first claim {len(first)}, second claim {len(second)}")
+		if len(first) != len(leased_ids) or second:
+			problems.append("a claimed batch was claimed again within its lease")
+		notification_dao.mark_sent([notification['notification_id'] for notification in first])
+
+		# Failing: a sink that can't write is retried later, then given up
+		# on after max_attempts
+		blocker = os.path.join(scratch, 'not-a-directory')
+		open(blocker, 'w').close()
+		failed_ids = enqueue(args.batch_size)
+		dispatcher = NotificationDispatcher(
+			notification_dao, FileSink(os.path.join(blocker, 'outbox')), "bookings@example.com",
+			batch_size=args.batch_size, max_attempts=2, backoff=60
+		)
+		dispatcher.drain()
+		state = outbox_state(notification_dao, failed_ids)
+		retrying = [
+			notification_id for notification_id in failed_ids
+			if state[notification_id]['status'] == NotificationDAO.PENDING
+			and state[notification_id]['attempts'] == 1
+			and state[notification_id]['next_attempt_at'] > datetime.now()
+			and state[notification_id]['last_error']
+		]
+		print(f"failing: {len(retrying)} of {len(failed_ids)} PENDING with a retry scheduled")
+		if len(retrying) != len(failed_ids):
+			problems.append("failed notifications were not scheduled for a retry")
+
+		# Bring the retries forward instead of waiting out the backoff
+		notification_dao.update_many([
+			(notification_id, {"next_attempt_at": datetime.now()}) for notification_id in failed_ids
+		])
+		dispatcher.drain()
+		state = outbox_state(notification_dao, failed_ids)
+		given_up = [
+			notification_id for notification_id in failed_ids
+			if state[notification_id]['status'] == NotificationDAO.FAILED and state[notification_id]['attempts'] == 2
+		]
+		print(f"given up: {len(given_up)} of {len(failed_ids)} FAILED after 2 attempts")
+		if len(given_up) != len(failed_ids):
+			problems.append("failed notifications were not given up on after max_attempts")
+
+	db_manager.close()
+	for problem in problems:
+		print(problem)
+	if problems:
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,270 @@
+"""
+Benchmarks every endpoint in app.py and the DAO methods behind them
+against a local stand-in database, at several concurrency levels.
+
+Point it at a scratch database (it is cleared when --seed is given),
+seed it once, then run it on each commit you want to compare:
+
+    python -m benchmarks.run --database car_hire_bench --seed
+    python -m benchmarks.run --database car_hire_bench
+    python -m benchmarks.run --sqlite /tmp/car_hire_bench.db --seed
+    python -m benchmarks.compare benchmarks/results/<old>.json benchmarks/results/<new>.json
+
+Endpoints are driven in-process through Flask's test client, so the
+numbers exclude HTTP parsing but include routing, services, DAOs and
+the database. Each result reports throughput, p50/p95/p99 latency and
+the mean number of statements per request.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from decouple import Config, RepositoryEnv
+
+from app import create_app
+from benchmarks import seed as seeding
+from benchmarks.http_load import summarize
+from database import migrations
+from database.backends import SQLiteBackend
+from database.db import DatabaseManager
+
+DOTENV_FILE = './envs.env'
+VEHICLE_TYPES = seeding.VEHICLE_TYPES
+
+
+def endpoint_scenarios(volumes):
+	"""
+	Returns
+	-------
+	dict
+		Scenario name to a function (client, rng) sending one request.
+	"""
+	customers = volumes["customers"]
+	vehicles = volumes["vehicles"]
+
+	def customer_body(rng):
+		customer_id = rng.randint(1, customers)
+		return {
+			"first_name": f"First{customer_id}",
+			"last_name": f"Last{customer_id}",
+			"email": f"customer{customer_id}@example.com",
+			"phone": f"07{customer_id:09d}"
+		}
+
+	def window(rng):
+		start = date.today() + timedelta(days=rng.randint(0, 7))
+		return start, start + timedelta(days=rng.randint(1, 7))
+
+	def get_customer(client, rng):
+		return client.get(f"/get-customer/{rng.randint(1, customers)}")
+
+	def update_customer(client, rng):
+		return client.put(f"/update-customer/{rng.randint(1, customers)}", json=customer_body(rng))
+
+	def add_customer(client, rng):
+		return client.post("/add-customer", json=customer_body(rng))
+
+	def get_customers(client, rng):
+		ids = ','.join(str(rng.randint(1, customers)) for _ in range(50))
+		return client.get(f"/get-customers?ids={ids}")
+
+	def available_vehicles(client, rng):
+		start, end = window(rng)
+		return client.get(f"/available-vehicles?type={rng.choice(VEHICLE_TYPES)}&start={start}&end={end}")
+
+	def vehicle_availability(client, rng):
+		start, end = window(rng)
+		return client.get(f"/vehicle-availability/{rng.randint(1, vehicles)}?start={start}&end={end}")
+
+	def availability_calendar(client, rng):
+		start, end = window(rng)
+		return client.get(f"/availability-calendar?type={rng.choice(VEHICLE_TYPES)}&free_start={start}&free_end={end}")
+
+	def daily_report(client, rng):
+		return client.get(f"/daily-report?format={rng.choice(('csv', 'ndjson'))}")
+
+	return {
+		"GET /get-customer": get_customer,
+		"PUT /update-customer": update_customer,
+		"POST /add-customer": add_customer,
+		"GET /get-customers": get_customers,
+		"GET /available-vehicles": available_vehicles,
+		"GET /vehicle-availability": vehicle_availability,
+		"GET /availability-calendar": availability_calendar,
+		"GET /daily-report": daily_report
+	}
+
+
+def dao_scenarios(components, volumes):
+	"""
+	Returns
+	-------
+	dict
+		Scenario name to a function (context, rng) making one DAO call.
+	"""
+	customers = volumes["customers"]
+	vehicles = volumes["vehicles"]
+
+	def window(rng):
+		start = date.today() + timedelta(days=rng.randint(0, 7))
+		return start, start + timedelta(days=rng.randint(1, 7))
+
+	return {
+		"CustomerDAO.get": lambda _, rng: components['customer_dao'].get(rng.randint(1, customers)),
+		"CustomerDAO.get_many": lambda _, rng: components['customer_dao'].get_many(
+			[rng.randint(1, customers) for _ in range(50)]),
+		"CustomerDAO.update": lambda _, rng: components['customer_dao'].update(
+			rng.randint(1, customers), {"phone": f"07{rng.randint(0, 999999999):09d}"}),
+		"VehicleDAO.find_available_vehicles": lambda _, rng: components['vehicle_dao'].find_available_vehicles(
+			rng.choice(VEHICLE_TYPES), *window(rng)),
+		"BookingDAO.is_vehicle_available": lambda _, rng: components['booking_dao'].is_vehicle_available(
+			rng.randint(1, vehicles), *window(rng)),
+		"BookingDAO.get_daily_bookings": lambda _, rng: components['booking_dao'].get_daily_bookings(date.today())
+	}
+
+
+def run_scenario(db_manager, operation, concurrency, operations, make_context):
+	"""
+	Runs an operation the given number of times from concurrency threads.
+
+	Returns
+	-------
+	dict
+		The summary of the run plus the mean statements per operation.
+	"""
+	latencies = []
+	queries = []
+	errors = [0]
+	remaining = iter(range(operations))
+	lock = threading.Lock()
+
+	def worker(worker_id):
+		context = make_context()
+		rng = random.Random(worker_id)
+		local_latencies = []
+		local_queries = []
+		local_errors = 0
+		while True:
+			with lock:
+				if next(remaining, None) is None:
+					break
+			with db_manager.count_queries() as counter:
+				started = time.perf_counter()
+				try:
+					result = operation(context, rng)
+					if hasattr(result, 'status_code'):
+						result.get_data()
+						if result.status_code >= 400:
+							local_errors += 1
+				except Exception:
+					local_errors += 1
+				local_latencies.append(time.perf_counter() - started)
+			local_queries.append(counter.count)
+		with lock:
+			latencies.extend(local_latencies)
+			queries.extend(local_queries)
+			errors[0] += local_errors
+
+	threads = [threading.Thread(target=worker, args=(worker_id,)) for worker_id in range(concurrency)]
+	started = time.perf_counter()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	summary = summarize(latencies, time.perf_counter() - started, errors[0])
+	summary["queries_per_request"] = sum(queries) / len(queries) if queries else 0.0
+	return summary
+
+
+def current_commit():
+	try:
+		return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return 'unknown'
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--database', help='The scratch database to use instead of DB_DATABASE.')
+	parser.add_argument('--sqlite', metavar='PATH', help='Run on an SQLite file instead of MySQL.')
+	parser.add_argument('--seed', action='store_true', help='Clear and seed the database first.')
+	parser.add_argument('--customers', type=int, default=1000)
+	parser.add_argument('--vehicles', type=int, default=200)
+	parser.add_argument('--bookings', type=int, default=10000)
+	parser.add_argument('--invoices', type=int, default=5000)
+	parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+	parser.add_argument('--operations', type=int, default=500, help='Operations per scenario and concurrency level.')
+	parser.add_argument('--only', nargs='+', help='Run only the scenarios with these names.')
+	parser.add_argument('--no-cache', action='store_true', help='Disable the entity caches.')
+	parser.add_argument('--output', help='Where to write the JSON results.')
+	args = parser.parse_args()
+
+	config = Config(RepositoryEnv(DOTENV_FILE))
+	# DatabaseManager is a singleton, so configuring it before the app is
+	# created points the app at the benchmark database
+	db_manager = DatabaseManager(
+		host=config('DB_HOST'),
+		user=config('DB_USER'),
+		password=config('DB_PASSWORD'),
+		database=args.database or config('DB_DATABASE'),
+		backend=SQLiteBackend(args.sqlite) if args.sqlite else None,
+		pool_size=max(args.concurrency) + 2
+	)
+	migrations.migrate(db_manager)
+
+	volumes = {
+		"customers": args.customers,
+		"vehicles": args.vehicles,
+		"bookings": args.bookings,
+		"invoices": args.invoices
+	}
+	if args.seed:
+		seeding.clear(db_manager)
+		volumes = seeding.seed(db_manager, **volumes)
+		print(f"Seeded {volumes}")
+
+	app = create_app()
+	components = app.extensions['car_hire']
+	if args.no_cache:
+		components['customer_dao'].cache = None
+		components['vehicle_dao'].cache = None
+
+	scenarios = [(name, operation, app.test_client) for name, operation in endpoint_scenarios(volumes).items()]
+	scenarios += [(name, operation, lambda: None) for name, operation in dao_scenarios(components, volumes).items()]
+	if args.only:
+		scenarios = [scenario for scenario in scenarios if scenario[0] in args.only]
+
+	results = []
+	for name, operation, make_context in scenarios:
+		for concurrency in args.concurrency:
+			summary = run_scenario(db_manager, operation, concurrency, args.operations, make_context)
+			results.append({"scenario": name, "concurrency": concurrency, **summary})
+			print(
+				f"{name:<36} c={concurrency:<3} {summary['throughput']:9.1f} ops/s  "
+				f"p50 {summary['p50_ms']:7.2f}  p95 {summary['p95_ms']:7.2f}  p99 {summary['p99_ms']:7.2f} ms  "
+				f"{summary['queries_per_request']:5.2f} q/op  errors {summary['errors']}"
+			)
+
+	commit = current_commit()
+	output = args.output or os.path.join('benchmarks', 'results', f'{commit}.json')
+	os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+	with open(output, 'w') as results_file:
+		json.dump({
+			"commit": commit,
+			"timestamp": datetime.now().isoformat(timespec='seconds'),
+			"volumes": volumes,
+			"operations": args.operations,
+			"cache": not args.no_cache,
+			"results": results
+		}, results_file, indent=2)
+	print(f"Wrote {output}")
+	db_manager.close()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,123 @@
+import random
+from datetime import date, timedelta
+
+from models.daos import BookingDAO, CustomerDAO, InvoiceDAO, VehicleDAO
+
+VEHICLE_TYPES = ("small car", "family car", "van")
+MAKES = {
+	"small car": (("Ford", "Fiesta"), ("Toyota", "Yaris"), ("Volkswagen", "Polo")),
+	"family car": (("Ford", "Galaxy"), ("Toyota", "Previa"), ("Volkswagen", "Touran")),
+	"van": (("Ford", "Transit"), ("Mercedes", "Sprinter"), ("Renault", "Trafic"))
+}
+
+
+def clear(db_manager):
+	"""
+	Deletes every row from the app's tables, children first.
+	"""
+	with db_manager.transaction() as conn, conn.cursor() as cursor:
+		for table_name in ("Notification", "Invoice", "Booking", "Vehicle", "Customer"):
+			db_manager.execute(cursor, f"DELETE FROM {table_name}")
+
+
+def seed(db_manager, customers=1000, vehicles=200, bookings=10000, invoices=5000, history_days=365,
+		random_seed=42):
+	"""
+	Fills an empty database with deterministic fake data. Primary keys
+	are assigned explicitly from 1, so scenarios can address rows by id.
+	Each vehicle's bookings are laid out back to back without overlaps,
+	ending up to 7 days in the future so today's report and the booking
+	window have data.
+
+	Parameters
+	----------
+	db_manager : DatabaseManager
+		The database to seed.
+	customers : int
+		The number of customers.
+	vehicles : int
+		The number of vehicles.
+	bookings : int
+		The number of bookings.
+	invoices : int
+		The number of invoices, one per booking for the first bookings.
+	history_days : int
+		How many days back the bookings start.
+	random_seed : int
+		The seed for the random generator.
+
+	Returns
+	-------
+	dict
+		The number of rows inserted per table.
+	"""
+	rng = random.Random(random_seed)
+	CustomerDAO(db_manager).add_many([
+		{
+			"customer_id": customer_id,
+			"first_name": f"First{customer_id}",
+			"last_name": f"Last{customer_id}",
+			"email": f"customer{customer_id}@example.com",
+			"phone": f"07{customer_id:09d}"
+		}
+		for customer_id in range(1, customers + 1)
+	])
+
+	vehicle_rows = []
+	for vehicle_id in range(1, vehicles + 1):
+		vehicle_type = VEHICLE_TYPES[vehicle_id % len(VEHICLE_TYPES)]
+		make, model = rng.choice(MAKES[vehicle_type])
+		vehicle_rows.append({
+			"vehicle_id": vehicle_id,
+			"type": vehicle_type,
+			"model": model,
+			"make": make,
+			"year": rng.randint(2015, 2024),
+			"registration_number": f"REG{vehicle_id:06d}",
+			"available": True
+		})
+	VehicleDAO(db_manager).add_many(vehicle_rows)
+
+	first_day = date.today() - timedelta(days=history_days)
+	last_day = date.today() + timedelta(days=7)
+	next_free = {vehicle_id: first_day for vehicle_id in range(1, vehicles + 1)}
+	booking_rows = []
+	booking_id = 1
+	while len(booking_rows) < bookings and next_free:
+		for vehicle_id in list(next_free):
+			date_hired = next_free[vehicle_id] + timedelta(days=rng.randint(0, 3))
+			return_date = date_hired + timedelta(days=rng.randint(1, 7))
+			if return_date > last_day:
+				del next_free[vehicle_id]
+				continue
+			next_free[vehicle_id] = return_date
+			booking_rows.append({
+				"booking_id": booking_id,
+				"customer_id": rng.randint(1, customers),
+				"vehicle_id": vehicle_id,
+				"date_hired": date_hired,
+				"return_date": return_date,
+				"payment_status": "PAID" if booking_id <= invoices else "UNPAID"
+			})
+			booking_id += 1
+			if len(booking_rows) == bookings:
+				break
+	BookingDAO(db_manager).add_many(booking_rows)
+
+	invoice_rows = [
+		{
+			"invoice_id": booking["booking_id"],
+			"booking_id": booking["booking_id"],
+			"total_amount": (booking["return_date"] - booking["date_hired"]).days * 200.75,
+			"payment_date": booking["date_hired"]
+		}
+		for booking in booking_rows[:invoices]
+	]
+	InvoiceDAO(db_manager).add_many(invoice_rows)
+
+	return {
+		"customers": customers,
+		"vehicles": vehicles,
+		"bookings": len(booking_rows),
+		"invoices": len(invoice_rows)
+	}
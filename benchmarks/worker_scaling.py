@@ -0,0 +1,137 @@
+"""
+Measures how the pre-fork server's throughput scales with its number
+of workers. For each worker count it starts gunicorn with the settings
+in gunicorn.conf.py, drives it with a fixed number of in-flight requests
+per worker from several client processes, then stops it gracefully.
+
+Seed a scratch database first, e.g. with benchmarks.run --seed, and
+point a copy of envs.env at it:
+
+    python -m benchmarks.worker_scaling --workers 1 2 4 8
+    python -m benchmarks.worker_scaling --dotenv /tmp/bench.env --paths /get-customer/{id} /customers
+
+Throughput should grow close to linearly until the workers outnumber
+the cores or the database becomes the bottleneck. Keep the client
+processes on other cores, or another machine, when measuring the upper
+end: the load generator competes for the same CPUs.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+
+from benchmarks.http_load import run_load
+
+
+def wait_until_serving(port, process, timeout=30):
+	"""
+	Waits until the server answers a request.
+
+	Raises
+	------
+	RuntimeError
+		If the server exits or doesn't answer within the timeout.
+	"""
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		if process.poll() is not None:
+			raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+		connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+		try:
+			connection.request('GET', '/')
+			connection.getresponse().read()
+			return
+		except OSError:
+			time.sleep(0.1)
+		finally:
+			connection.close()
+	raise RuntimeError("gunicorn did not start serving in time")
+
+
+def client(job):
+	base_url, paths, concurrency, requests = job
+	return run_load(base_url, paths, concurrency, requests)
+
+
+def measure(workers, args, paths):
+	"""
+	Runs gunicorn with the given number of workers and loads it.
+
+	Returns
+	-------
+	dict
+		The worker count, requests, errors, throughput and the worst
+		client's p50/p95/p99 latency in milliseconds.
+	"""
+	command = [
+		sys.executable, '-m', 'gunicorn',
+		'--workers', str(workers),
+		'--bind', f'127.0.0.1:{args.port}',
+		'--max-requests', '0',
+		f"app:create_app({args.dotenv!r}, background=False)"
+	]
+	process = subprocess.Popen(command, stderr=subprocess.DEVNULL)
+	try:
+		wait_until_serving(args.port, process)
+		base_url = f'http://127.0.0.1:{args.port}'
+		concurrency = max(1, workers * args.concurrency_per_worker // args.clients)
+		# Warm every worker's caches and connections before measuring
+		run_load(base_url, paths, workers * args.concurrency_per_worker, len(paths) * workers)
+		jobs = [(base_url, paths, concurrency, args.requests // args.clients)] * args.clients
+		with multiprocessing.Pool(args.clients) as pool:
+			started = time.perf_counter()
+			summaries = pool.map(client, jobs)
+			elapsed = time.perf_counter() - started
+	finally:
+		process.send_signal(signal.SIGTERM)
+		process.wait()
+	requests = sum(summary['requests'] for summary in summaries)
+	return {
+		"workers": workers,
+		"requests": requests,
+		"errors": sum(summary['errors'] for summary in summaries),
+		"throughput": requests / elapsed,
+		"p50_ms": max(summary['p50_ms'] for summary in summaries),
+		"p95_ms": max(summary['p95_ms'] for summary in summaries),
+		"p99_ms": max(summary['p99_ms'] for summary in summaries)
+	}
+
+
+def main():
+	cores = os.cpu_count() or 1
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, 2, 4, cores}))
+	parser.add_argument('--dotenv', default='./envs.env', help='The settings file the app is created from.')
+	parser.add_argument('--paths', nargs='+', default=['/get-customer/{id}'], help='Paths to request, {id} is filled in.')
+	parser.add_argument('--ids', type=int, default=100, help='Fill {id} with 1 to this.')
+	parser.add_argument('--concurrency-per-worker', type=int, default=4)
+	parser.add_argument('--clients', type=int, default=cores, help='Load generating processes.')
+	parser.add_argument('--requests', type=int, default=10000, help='Requests per worker count.')
+	parser.add_argument('--port', type=int, default=8100)
+	args = parser.parse_args()
+
+	rng = random.Random(42)
+	paths = [rng.choice(args.paths).format(id=rng.randint(1, args.ids)) for _ in range(1000)]
+	results = []
+	for workers in args.workers:
+		result = measure(workers, args, paths)
+		baseline = results[0] if results else result
+		speedup = result['throughput'] / baseline['throughput']
+		efficiency = speedup / (workers / baseline['workers'])
+		results.append({**result, "speedup": speedup, "efficiency": efficiency})
+		print(
+			f"workers={workers:<3} {result['throughput']:9.1f} req/s  x{speedup:5.2f} ({efficiency:4.0%} of linear)  "
+			f"p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms  "
+			f"errors {result['errors']}"
+		)
+	print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+	main()
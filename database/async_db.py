@@ -0,0 +1,169 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+import aiomysql
+import pymysql
+from pymysql.constants import CLIENT
+
+from database.backends import MySQLBackend
+from database.instrumentation import QueryMetrics
+
+
+class AsyncDatabaseManager:
+	"""
+	The asyncio counterpart of DatabaseManager for the async deployment
+	mode. Connections come from an aiomysql pool and transactions are
+	tracked per task instead of per thread, so one event loop can keep
+	many requests waiting on the database at once.
+	"""
+
+	def __init__(self, host, user, password, database, pool_size=10, idle_timeout=300, slow_query_threshold=0.5):
+		self.host = host
+		self.user = user
+		self.password = password
+		self.database = database
+		self.pool_size = pool_size
+		self.idle_timeout = idle_timeout
+		# Answers the dialect questions for the DAOs; connections are
+		# opened with aiomysql instead
+		self.backend = MySQLBackend(host, user, password, database)
+		self.pool = None
+		self._pool_lock = asyncio.Lock()
+		self._transaction = ContextVar(f"transaction_{id(self)}", default=None)
+		self.metrics = QueryMetrics(slow_query_threshold)
+
+	async def connect(self):
+		"""
+		Create the connection pool for the app's database.
+		"""
+		if self.pool:
+			return
+		async with self._pool_lock:
+			if not self.pool:
+				# FOUND_ROWS matches DatabaseManager so row counts mean the same
+				self.pool = await aiomysql.create_pool(
+					host=self.host,
+					user=self.user,
+					password=self.password,
+					db=self.database,
+					minsize=0,
+					maxsize=self.pool_size,
+					pool_recycle=self.idle_timeout,
+					autocommit=True,
+					client_flag=CLIENT.FOUND_ROWS
+				)
+
+	@asynccontextmanager
+	async def connection(self):
+		"""
+		Checks a connection out of the pool for the duration of the
+		async with block, or yields the task's transaction connection if
+		it has one open. Connections that fail with a driver level error
+		are closed so the pool replaces them.
+
+		Yields
+		------
+		aiomysql.Connection
+			A pooled connection.
+		"""
+		transaction = self._transaction.get()
+		if transaction is not None:
+			yield transaction["conn"]
+			return
+		await self.connect()
+		conn = await self.pool.acquire()
+		try:
+			yield conn
+		except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+			conn.close()
+			raise
+		finally:
+			self.pool.release(conn)
+
+	@asynccontextmanager
+	async def transaction(self):
+		"""
+		Opens a unit of work on a single pooled connection for the
+		current task, committed once when the outermost block exits or
+		rolled back if it raises. Nested blocks join the outer one.
+
+		Yields
+		------
+		aiomysql.Connection
+			The connection the transaction runs on.
+		"""
+		transaction = self._transaction.get()
+		if transaction is not None:
+			yield transaction["conn"]
+			return
+
+		async with self.connection() as conn:
+			await conn.begin()
+			transaction = {"conn": conn, "after_commit": []}
+			token = self._transaction.set(transaction)
+			try:
+				yield conn
+			except BaseException:
+				try:
+					await conn.rollback()
+				except pymysql.err.Error:
+					pass
+				raise
+			else:
+				await conn.commit()
+			finally:
+				self._transaction.reset(token)
+		for callback in transaction["after_commit"]:
+			callback()
+
+	def in_transaction(self):
+		"""
+		Returns
+		-------
+		bool
+			True if the current task has a transaction open.
+		"""
+		return self._transaction.get() is not None
+
+	def after_commit(self, callback):
+		"""
+		Runs a callback once the current task's writes are committed.
+
+		Parameters
+		----------
+		callback : callable
+			A function taking no arguments.
+		"""
+		transaction = self._transaction.get()
+		if transaction is not None:
+			transaction["after_commit"].append(callback)
+		else:
+			callback()
+
+	async def execute(self, cursor, sql, params=None, many=False):
+		"""
+		Executes and times a statement on a cursor.
+
+		Returns
+		-------
+		int
+			The number of affected (or matched) rows.
+		"""
+		started = time.perf_counter()
+		if many:
+			rows = await cursor.executemany(sql, params)
+		else:
+			rows = await cursor.execute(sql, params)
+		self.metrics.record(sql, time.perf_counter() - started, rows)
+		return rows
+
+	async def close(self):
+		"""
+		Closes the database connection pool.
+		"""
+		if self.pool:
+			self.pool.close()
+			await self.pool.wait_closed()
+			self.pool = None
@@ -1,11 +1,50 @@
-import pymysql
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from database.backends import MySQLBackend
+from database.instrumentation import QueryCounter, QueryMetrics
+from database.pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+	"""
+	A read replica's connection pool and health. A replica that fails to
+	hand out a connection is skipped until retry_at, then tried again.
+	"""
+
+	def __init__(self, name, backend, pool):
+		self.name = name
+		self.backend = backend
+		self.pool = pool
+		self.retry_at = 0.0
+		self.checkouts = 0
+
+	def is_up(self, now=None):
+		return self.retry_at <= (time.monotonic() if now is None else now)
 
 
 class DatabaseManager:
 	"""
-	A Singleton to handle connection to the database. Additionally,
-	this class will create the database tables if they are not yet
-	created.
+	A Singleton to handle connections to the database. Connections are
+	handed out from a bounded, thread-safe pool so concurrent requests
+	each get their own socket. The pool is created, and connections are
+	opened, on first use. The tables are created by the migrations in
+	database.migrations.
+
+	Connections are opened by a storage backend, MySQL unless another
+	one from database.backends is given.
+
+	Given replica backends, read-only DAO calls are spread over the
+	replicas, round robin or to the least loaded, and fall back to the
+	primary while every replica is down. Writes, transactions and every
+	read inside a transaction stay on the primary.
 	"""
 
 	_instance = None
@@ -16,86 +55,402 @@ class DatabaseManager:
 			cls._instance = super(DatabaseManager, cls).__new__(cls)
 		return cls._instance
 
-	def __init__(self, host, user, password, database):
+	def __init__(self, host=None, user=None, password=None, database=None, pool_size=10, idle_timeout=300,
+			health_check_interval=30, pool_timeout=30, slow_query_threshold=0.5, backend=None, replicas=(),
+			replica_selection='round_robin', replica_retry_interval=30):
 		if not hasattr(self, 'initialized'):
 			self.host = host
 			self.user = user
 			self.password = password
 			self.database = database
-			self.conn = None
-			self.cursor = None
+			self.backend = backend or MySQLBackend(host, user, password, database)
+			self.pool_size = pool_size
+			self.idle_timeout = idle_timeout
+			self.health_check_interval = health_check_interval
+			self.pool_timeout = pool_timeout
+			self.replica_backends = list(replicas)
+			if replica_selection not in ('round_robin', 'least_loaded'):
+				raise ValueError("Replica selection must be round_robin or least_loaded")
+			self.replica_selection = replica_selection
+			self.replica_retry_interval = replica_retry_interval
+			self.pool = None
+			self.replicas = []
+			self.primary_checkouts = 0
+			self._replica_turn = itertools.count()
+			self._pool_lock = threading.Lock()
+			self._local = threading.local()
+			self.metrics = QueryMetrics(slow_query_threshold)
 			self.initialized = True
 
-	def get_connection(self):
-		return self.conn
-
 	def connect(self):
 		"""
-		Establish a connection to the app's database.
-		"""
-		if not self.conn:
-			self.conn = pymysql.connect(
-				host=self.host,
-				user=self.user,
-				password=self.password,
-				database=self.database
-			)
-			self.cursor = self.conn.cursor()
-
-	def create_tables(self):
-		"""
-		Create tables for the database if they don't yet exist.
-		"""
-		create_customer_table = """
-        CREATE TABLE IF NOT EXISTS Customer (
-            customer_id INT AUTO_INCREMENT PRIMARY KEY,
-            first_name VARCHAR(50),
-            last_name VARCHAR(50),
-            email VARCHAR(100),
-            phone VARCHAR(20)
-        )
-        """
-		create_vehicle_table = """
-        CREATE TABLE IF NOT EXISTS Vehicle (
-            vehicle_id INT AUTO_INCREMENT PRIMARY KEY,
-            type VARCHAR(50),
-            model VARCHAR(50),
-            make VARCHAR(50),
-            year INT,
-            registration_number VARCHAR(50),
-            available BOOLEAN
-        )
-        """
-		create_booking_table = """
-        CREATE TABLE IF NOT EXISTS Booking (
-            booking_id INT AUTO_INCREMENT PRIMARY KEY,
-            customer_id INT,
-            vehicle_id INT,
-            date_hired DATE,
-            return_date DATE,
-            payment_status VARCHAR(20),
-            FOREIGN KEY (customer_id) REFERENCES Customer(customer_id),
-            FOREIGN KEY (vehicle_id) REFERENCES Vehicle(vehicle_id)
-        )
-        """
-		create_invoice_table = """
-        CREATE TABLE IF NOT EXISTS Invoice (
-            invoice_id INT AUTO_INCREMENT PRIMARY KEY,
-            booking_id INT,
-            total_amount FLOAT,
-            payment_date DATE,
-            FOREIGN KEY (booking_id) REFERENCES Booking(booking_id)
-        )
-        """
-		self.cursor.execute(create_customer_table)
-		self.cursor.execute(create_vehicle_table)
-		self.cursor.execute(create_booking_table)
-		self.cursor.execute(create_invoice_table)
-		self.conn.commit()
+		Create the connection pools for the app's database and its
+		replicas.
+		"""
+		if self.pool:
+			return
+		with self._pool_lock:
+			if not self.pool:
+				self.replicas = [
+					Replica(f"replica-{number}", backend, self._create_pool(backend))
+					for number, backend in enumerate(self.replica_backends)
+				]
+				self.pool = self._create_pool(self.backend)
+
+	def _create_pool(self, backend):
+		return ConnectionPool(
+			backend.connect,
+			max_size=self.pool_size,
+			idle_timeout=self.idle_timeout,
+			health_check_interval=self.health_check_interval,
+			timeout=self.pool_timeout
+		)
+
+	@contextmanager
+	def connection(self, read_only=False):
+		"""
+		Checks a connection out of the pool for the duration of the
+		with block and returns it afterwards. Connections that fail with
+		a driver level error are discarded rather than returned, so the
+		next borrower gets a fresh one.
+
+		If the calling thread has a transaction open, the transaction's
+		connection is yielded instead so reads see its uncommitted writes.
+
+		Parameters
+		----------
+		read_only : bool
+			The block only reads and can tolerate replication lag, so it
+			may run on a replica.
+
+		Yields
+		------
+		pymysql.connections.Connection or SQLiteConnection
+			A pooled connection.
+		"""
+		conn = getattr(self._local, 'conn', None)
+		if conn is not None:
+			yield conn
+			return
+		self.connect()
+		pool, backend, replica, conn = self.pool, self.backend, None, None
+		if read_only and self.replicas:
+			replica = self._choose_replica()
+			if replica is not None:
+				conn = self._acquire_replica(replica)
+		if conn is None:
+			replica = None
+			conn = pool.acquire()
+			self.primary_checkouts += 1
+		else:
+			pool, backend = replica.pool, replica.backend
+		try:
+			yield conn
+		except backend.connection_errors as error:
+			pool.release(conn, discard=True)
+			if replica is not None:
+				self._mark_down(replica, error)
+			raise
+		except BaseException:
+			pool.release(conn)
+			raise
+		else:
+			pool.release(conn)
+
+	def _choose_replica(self):
+		now = time.monotonic()
+		healthy = [replica for replica in self.replicas if replica.is_up(now)]
+		if not healthy:
+			return None
+		if self.replica_selection == 'least_loaded':
+			return min(healthy, key=lambda replica: replica.pool.in_use)
+		return healthy[next(self._replica_turn) % len(healthy)]
+
+	def _acquire_replica(self, replica):
+		# Borrowing pings connections that have been idle, so this doubles
+		# as the replica's health check
+		try:
+			conn = replica.pool.acquire()
+		except Exception as error:
+			self._mark_down(replica, error)
+			return None
+		replica.checkouts += 1
+		return conn
+
+	def _mark_down(self, replica, error):
+		replica.retry_at = time.monotonic() + self.replica_retry_interval
+		logger.warning(
+			"Replica %s is down, reading from the primary for %ss: %s",
+			replica.name, self.replica_retry_interval, error
+		)
+
+	def check_replicas(self):
+		"""
+		Checks out a connection from every replica, including those
+		currently skipped, so a recovered replica is used again straight
+		away and a failed one is skipped before a request finds it.
+
+		Returns
+		-------
+		dict
+			Replica name to True if it is up.
+		"""
+		self.connect()
+		status = {}
+		for replica in self.replicas:
+			conn = self._acquire_replica(replica)
+			if conn is not None:
+				replica.pool.release(conn)
+				replica.retry_at = 0.0
+			status[replica.name] = conn is not None
+		return status
+
+	def pool_stats(self):
+		"""
+		Returns
+		-------
+		dict
+			Pool name (primary or replica-N) to its size, connections in
+			use, whether it is up and how many connections have been
+			checked out of it outside transactions.
+		"""
+		self.connect()
+		stats = {
+			"primary": {
+				"size": self.pool.size,
+				"in_use": self.pool.in_use,
+				"up": 1,
+				"checkouts": self.primary_checkouts
+			}
+		}
+		now = time.monotonic()
+		for replica in self.replicas:
+			stats[replica.name] = {
+				"size": replica.pool.size,
+				"in_use": replica.pool.in_use,
+				"up": int(replica.is_up(now)),
+				"checkouts": replica.checkouts
+			}
+		return stats
+
+	@contextmanager
+	def transaction(self):
+		"""
+		Opens a unit of work on a single pooled connection. Every DAO call
+		made by this thread inside the with block runs on that connection
+		and the work is committed once when the outermost block exits, or
+		rolled back if it raises. Nested blocks join the outer transaction.
+
+		Yields
+		------
+		pymysql.connections.Connection or SQLiteConnection
+			The connection the transaction runs on.
+		"""
+		if getattr(self._local, 'conn', None) is not None:
+			self._local.depth += 1
+			try:
+				yield self._local.conn
+			finally:
+				self._local.depth -= 1
+			return
+
+		with self.connection() as conn:
+			self._count("BEGIN")
+			conn.begin()
+			self._local.conn = conn
+			self._local.depth = 1
+			self._local.after_commit = []
+			try:
+				yield conn
+			except BaseException:
+				try:
+					self._count("ROLLBACK")
+					conn.rollback()
+				except self.backend.error:
+					pass
+				raise
+			else:
+				self._count("COMMIT")
+				conn.commit()
+				callbacks = self._local.after_commit
+			finally:
+				self._local.conn = None
+				self._local.depth = 0
+				self._local.after_commit = []
+		for callback in callbacks:
+			callback()
+
+	def run_in_transaction(self, work, attempts=3, backoff=0.02):
+		"""
+		Runs a function in a transaction, running it again from the start
+		if the database aborts the transaction with a deadlock or lock
+		wait timeout. If the thread is already in a transaction the function
+		just joins it, since only the outermost transaction can be retried.
+
+		Parameters
+		----------
+		work : callable
+			The unit of work, taking no arguments. It may run more than
+			once, so it must not have side effects outside the database.
+		attempts : int
+			The maximum number of times to run it.
+		backoff : float
+			Seconds to wait before the first retry, doubled on each
+			further one, with jitter.
+
+		Returns
+		-------
+		object
+			What the function returned.
+		"""
+		if self.in_transaction():
+			return work()
+		for attempt in range(1, attempts + 1):
+			try:
+				with self.transaction():
+					return work()
+			except self.backend.error as error:
+				if not self.backend.is_retryable(error) or attempt == attempts:
+					raise
+			time.sleep(backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+	def after_commit(self, callback):
+		"""
+		Runs a callback once the calling thread's writes are committed:
+		when its transaction commits, or straight away if it has none
+		open. Callbacks of a transaction that rolls back are dropped.
+
+		Parameters
+		----------
+		callback : callable
+			A function taking no arguments.
+		"""
+		if self.in_transaction():
+			self._local.after_commit.append(callback)
+		else:
+			callback()
+
+	def in_transaction(self):
+		"""
+		Returns
+		-------
+		bool
+			True if the calling thread has a transaction open.
+		"""
+		return getattr(self._local, 'conn', None) is not None
+
+	def unbuffered_cursor(self, conn):
+		"""
+		Opens a server-side cursor that fetches rows as they are iterated
+		instead of buffering the whole result set. The connection cannot
+		run another statement until the cursor is exhausted or closed.
+
+		Parameters
+		----------
+		conn : pymysql.connections.Connection or SQLiteConnection
+			A pooled connection.
+
+		Returns
+		-------
+		pymysql.cursors.SSCursor or SQLiteCursor
+			The unbuffered cursor.
+		"""
+		return self.backend.unbuffered_cursor(conn)
+
+	def execute(self, cursor, sql, params=None, many=False):
+		"""
+		Executes a statement on a cursor. All DAO statements are sent
+		through here so they can be counted and timed. On unbuffered
+		cursors only the time to the first row is measured.
+
+		Parameters
+		----------
+		cursor : pymysql.cursors.Cursor or SQLiteCursor
+			The cursor to execute the statement on.
+		sql : str
+			The statement.
+		params : list
+			The statement parameters, or a list of parameter lists when
+			many is True.
+		many : bool
+			Execute the statement once per parameter list.
+
+		Returns
+		-------
+		int
+			The number of affected (or matched) rows.
+		"""
+		self._count(sql)
+		started = time.perf_counter()
+		if many:
+			rows = cursor.executemany(sql, params)
+		else:
+			rows = cursor.execute(sql, params)
+		# Unbuffered cursors don't know their row count until exhausted
+		known = isinstance(rows, int) and 0 <= rows < 2 ** 63
+		self.metrics.record(sql, time.perf_counter() - started, rows if known else None)
+		return rows
+
+	@contextmanager
+	def count_queries(self):
+		"""
+		Counts the statements the calling thread executes inside the with
+		block, so callers can assert a query budget. Transactions count
+		their BEGIN and COMMIT (or ROLLBACK), each a round trip of its own.
+
+		Yields
+		------
+		QueryCounter
+			The counter for the block.
+		"""
+		counter = QueryCounter()
+		counters = getattr(self._local, 'query_counters', ())
+		self._local.query_counters = counters + (counter,)
+		try:
+			yield counter
+		finally:
+			self._local.query_counters = counters
+
+	def _count(self, sql):
+		for counter in getattr(self._local, 'query_counters', ()):
+			counter.record(sql)
+
+	def after_fork(self):
+		"""
+		Forgets the pools and locks a forked child inherited from its
+		parent, so the child opens its own connections on first use.
+		The inherited connections are dropped rather than closed, since
+		closing them would end the parent's sessions on the server too,
+		and the locks are replaced in case a parent thread held one at
+		the fork. Called in every child process by the fork hook below.
+		"""
+		self.pool = None
+		self.replicas = []
+		self.primary_checkouts = 0
+		self._replica_turn = itertools.count()
+		self._pool_lock = threading.Lock()
+		self._local = threading.local()
+		# Each process reports its own statements
+		self.metrics = QueryMetrics(self.metrics.slow_query_threshold)
 
 	def close(self):
 		"""
-		Closes the database connection.
+		Closes the database connection pools.
 		"""
-		if self.conn:
-			self.conn.close()
+		if self.pool:
+			self.pool.close()
+			self.pool = None
+		for replica in self.replicas:
+			replica.pool.close()
+		self.replicas = []
+
+
+def _after_fork_in_child():
+	if DatabaseManager._instance is not None and hasattr(DatabaseManager._instance, 'initialized'):
+		DatabaseManager._instance.after_fork()
+
+
+# Pre-fork servers import the app, and may create the DatabaseManager,
+# before forking the workers, which must not share its sockets
+if hasattr(os, 'register_at_fork'):
+	os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,572 @@
+import bisect
+import functools
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES_LIST = re.compile(r"VALUES\s*\(\?\)(?:\s*,\s*\(\?\))+", re.IGNORECASE)
+_TABLE_NAME = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN|TABLE)\s+`?(\w+)", re.IGNORECASE)
+
+
+class QueryBudgetExceeded(AssertionError):
+	"""
+	Raised when a block of code runs more statements than its budget.
+	"""
+
+
+class QueryCounter:
+	"""
+	Counts the statements a thread sends to the database while it is
+	active. Created by DatabaseManager.count_queries.
+	"""
+
+	def __init__(self):
+		self.count = 0
+		self.statements = []
+
+	def record(self, sql):
+		"""
+		Records one statement sent to the database.
+
+		Parameters
+		----------
+		sql : str
+			The statement that was executed.
+		"""
+		self.count += 1
+		self.statements.append(' '.join(sql.split()))
+
+	def assert_budget(self, budget):
+		"""
+		Checks the number of statements against a query budget.
+
+		Parameters
+		----------
+		budget : int
+			The maximum number of statements allowed.
+		"""
+		if self.count > budget:
+			statements = '\n'.join(self.statements)
+			raise QueryBudgetExceeded(
+				f"Expected at most {budget} queries but {self.count} were run:\n{statements}"
+			)
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql):
+	"""
+	Normalizes a statement so executions that differ only in literal
+	values, placeholder counts or whitespace group together.
+
+	Parameters
+	----------
+	sql : str
+		The statement.
+
+	Returns
+	-------
+	str
+		The statement with literals replaced by ? and IN lists and
+		multi-row VALUES collapsed.
+	"""
+	sql = ' '.join(sql.split())
+	sql = _STRING_LITERAL.sub('?', sql)
+	sql = _NUMBER_LITERAL.sub('?', sql)
+	sql = sql.replace('%s', '?')
+	sql = _PLACEHOLDER_LIST.sub('(?)', sql)
+	return _VALUES_LIST.sub('VALUES (?)', sql)
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_target(sql):
+	"""
+	Returns
+	-------
+	tuple
+		The statement's operation (SELECT, INSERT, ...) and the first table
+		it reads from or writes to, or "" if none could be found.
+	"""
+	operation = sql.split(None, 1)[0].upper() if sql.strip() else ''
+	match = _TABLE_NAME.search(sql)
+	return operation, match.group(1) if match else ''
+
+
+class Histogram:
+	"""
+	A cumulative histogram with fixed upper bounds, as Prometheus expects.
+	Not thread-safe on its own; QueryMetrics guards it.
+	"""
+
+	def __init__(self, buckets):
+		self.buckets = tuple(buckets)
+		self.counts = [0] * len(self.buckets)
+		self.count = 0
+		self.sum = 0.0
+
+	def observe(self, value):
+		self.count += 1
+		self.sum += value
+		index = bisect.bisect_left(self.buckets, value)
+		if index < len(self.counts):
+			self.counts[index] += 1
+
+	def add(self, counts, count, total):
+		"""
+		Adds another histogram's observations, given as its per bucket
+		counts, count and sum.
+		"""
+		self.counts = [mine + theirs for mine, theirs in zip(self.counts, counts)]
+		self.count += count
+		self.sum += total
+
+	def cumulative(self):
+		"""
+		Returns
+		-------
+		list
+			(upper bound, observations at or below it) per bucket.
+		"""
+		return list(zip(self.buckets, itertools.accumulate(self.counts)))
+
+
+class QueryMetrics:
+	"""
+	Aggregates timing and row counts for every statement the database
+	manager executes, plus the number of statements per HTTP request, and
+	logs statements slower than a threshold. Shared by all threads.
+	"""
+
+	DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+	REQUEST_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+	TOP_STATEMENTS = 20
+
+	def __init__(self, slow_query_threshold=0.5):
+		self.slow_query_threshold = slow_query_threshold
+		self._lock = threading.Lock()
+		self._durations = {}
+		self._rows = {}
+		self._slow = {}
+		self._statements = {}
+		self._requests = {}
+
+	def record(self, sql, seconds, rows=None):
+		"""
+		Records one executed statement, logging it if it was slow.
+
+		Parameters
+		----------
+		sql : str
+			The statement as executed.
+		seconds : float
+			How long the statement took.
+		rows : int
+			The rows it returned or affected, if known.
+		"""
+		normalized = normalize_sql(sql)
+		key = statement_target(normalized)
+		slow = self.slow_query_threshold is not None and seconds >= self.slow_query_threshold
+		with self._lock:
+			self._histogram(self._durations, key, self.DURATION_BUCKETS).observe(seconds)
+			if rows is not None:
+				self._rows[key] = self._rows.get(key, 0) + rows
+			calls, total = self._statements.get(normalized, (0, 0.0))
+			self._statements[normalized] = (calls + 1, total + seconds)
+			if slow:
+				self._slow[key] = self._slow.get(key, 0) + 1
+		if slow:
+			logger.warning("Slow query (%.3fs, %s rows): %s", seconds, '?' if rows is None else rows, normalized)
+
+	def observe_request(self, endpoint, statements):
+		"""
+		Records the number of statements one HTTP request ran.
+
+		Parameters
+		----------
+		endpoint : str
+			The Flask endpoint that handled the request.
+		statements : int
+			The number of statements it ran.
+		"""
+		with self._lock:
+			self._histogram(self._requests, endpoint, self.REQUEST_BUCKETS).observe(statements)
+
+	def snapshot(self):
+		"""
+		Returns
+		-------
+		dict
+			The counters and histograms, in a form json can write and
+			merge can add to another QueryMetrics.
+		"""
+		with self._lock:
+			return {
+				"durations": [
+					[list(key), histogram.counts, histogram.count, histogram.sum]
+					for key, histogram in self._durations.items()
+				],
+				"rows": [[list(key), rows] for key, rows in self._rows.items()],
+				"slow": [[list(key), slow] for key, slow in self._slow.items()],
+				"statements": [[sql, calls, total] for sql, (calls, total) in self._statements.items()],
+				"requests": [
+					[endpoint, histogram.counts, histogram.count, histogram.sum]
+					for endpoint, histogram in self._requests.items()
+				]
+			}
+
+	def merge(self, snapshot):
+		"""
+		Adds a snapshot, e.g. another process's, to these metrics.
+
+		Parameters
+		----------
+		snapshot : dict
+			What snapshot returned.
+		"""
+		with self._lock:
+			for key, counts, count, total in snapshot["durations"]:
+				self._histogram(self._durations, tuple(key), self.DURATION_BUCKETS).add(counts, count, total)
+			for key, rows in snapshot["rows"]:
+				self._rows[tuple(key)] = self._rows.get(tuple(key), 0) + rows
+			for key, slow in snapshot["slow"]:
+				self._slow[tuple(key)] = self._slow.get(tuple(key), 0) + slow
+			for sql, calls, total in snapshot["statements"]:
+				mine_calls, mine_total = self._statements.get(sql, (0, 0.0))
+				self._statements[sql] = (mine_calls + calls, mine_total + total)
+			for endpoint, counts, count, total in snapshot["requests"]:
+				self._histogram(self._requests, endpoint, self.REQUEST_BUCKETS).add(counts, count, total)
+
+	def top_statements(self, limit=None):
+		"""
+		Returns
+		-------
+		list
+			(normalized statement, calls, total seconds), most total time
+			first.
+		"""
+		with self._lock:
+			statements = [(sql, calls, total) for sql, (calls, total) in self._statements.items()]
+		statements.sort(key=lambda statement: statement[2], reverse=True)
+		return statements[:limit or self.TOP_STATEMENTS]
+
+	def render(self, caches=None, pools=None):
+		"""
+		Renders the metrics in the Prometheus text exposition format.
+
+		Parameters
+		----------
+		caches : dict
+			Optional cache name to its stats, as LRUCache.stats returns
+			them.
+		pools : dict
+			Optional connection pool stats, as DatabaseManager.pool_stats
+			returns them.
+
+		Returns
+		-------
+		str
+			The metrics page.
+		"""
+		lines = []
+		with self._lock:
+			lines += _render_histogram(
+				'db_query_duration_seconds', 'Statement latency by operation and table.',
+				{_labels(operation=operation, table=table): histogram
+					for (operation, table), histogram in self._durations.items()}
+			)
+			lines += _render_counter(
+				'db_query_rows_total', 'Rows returned or affected by operation and table.',
+				{_labels(operation=operation, table=table): rows for (operation, table), rows in self._rows.items()}
+			)
+			lines += _render_counter(
+				'db_slow_queries_total', 'Statements slower than the slow query threshold.',
+				{_labels(operation=operation, table=table): slow for (operation, table), slow in self._slow.items()}
+			)
+			lines += _render_histogram(
+				'http_request_queries', 'Statements run per HTTP request by endpoint.',
+				{_labels(endpoint=endpoint): histogram for endpoint, histogram in self._requests.items()}
+			)
+		top = self.top_statements()
+		lines += _render_counter(
+			'db_statement_seconds_total', 'Total time of the slowest normalized statements.',
+			{_labels(statement=sql): total for sql, _, total in top}
+		)
+		lines += _render_counter(
+			'db_statement_calls_total', 'Calls of the slowest normalized statements.',
+			{_labels(statement=sql): calls for sql, calls, _ in top}
+		)
+		if caches:
+			for field, kind in (('hits', 'counter'), ('misses', 'counter'), ('evictions', 'counter'), ('size', 'gauge')):
+				suffix = '_total' if kind == 'counter' else ''
+				lines.append(f'# HELP cache_{field}{suffix} Entity cache {field}.')
+				lines.append(f'# TYPE cache_{field}{suffix} {kind}')
+				lines += [f'cache_{field}{suffix}{_labels(cache=name)} {cache_stats[field]}' for name, cache_stats in caches.items()]
+		if pools:
+			for field, description in (('size', 'Open connections'), ('in_use', 'Connections checked out'),
+					('up', 'Whether the database is in rotation')):
+				lines.append(f'# HELP db_pool_{field} {description} by pool.')
+				lines.append(f'# TYPE db_pool_{field} gauge')
+				lines += [f'db_pool_{field}{_labels(pool=name)} {pool[field]}' for name, pool in pools.items()]
+			lines += _render_counter(
+				'db_pool_checkouts_total', 'Connections checked out of each pool.',
+				{_labels(pool=name): pool['checkouts'] for name, pool in pools.items()}
+			)
+		return '\n'.join(lines) + '\n'
+
+	def _histogram(self, histograms, key, buckets):
+		histogram = histograms.get(key)
+		if histogram is None:
+			histogram = histograms[key] = Histogram(buckets)
+		return histogram
+
+
+class SharedMetrics:
+	"""
+	Adds up the metrics of pre-forked worker processes, so a scrape
+	answered by any worker reports the whole server rather than itself.
+	Each worker writes a snapshot of its metrics, cache and pool stats to
+	a file of its own in the directory, at most every flush_interval
+	seconds and when it exits, and a scrape adds up every file. Scrapes
+	therefore lag the other workers by up to flush_interval.
+
+	When a worker exits the master folds its counters into the retired
+	file, so counters never go backwards as workers are recycled. Gauges
+	(cache and pool sizes, whether a pool is up) only cover the workers
+	still running. The master clears the directory when it starts.
+	"""
+
+	RETIRED = "retired.json"
+	CACHE_COUNTERS = ("hits", "misses", "evictions")
+	POOL_COUNTERS = ("checkouts",)
+
+	def __init__(self, directory, flush_interval=5):
+		"""
+		Parameters
+		----------
+		directory : str
+			The directory the snapshots are written to, created on the
+			first write. Every worker of a server must use the same one.
+		flush_interval : float
+			The least number of seconds between a worker's snapshots,
+			except the one written for a scrape or at exit.
+		"""
+		self.directory = directory
+		self.flush_interval = flush_interval
+		self._pid = None
+		self._path = None
+		self._flushed_at = None
+		self._lock = threading.Lock()
+
+	def publish(self, metrics, caches=None, pools=None, force=False):
+		"""
+		Writes the calling process's snapshot, if flush_interval has
+		passed since its last one or force is set.
+
+		Parameters
+		----------
+		metrics : QueryMetrics
+			The process's metrics.
+		caches : dict
+			Cache name to its stats, as LRUCache.stats returns them.
+		pools : dict
+			Connection pool stats, as DatabaseManager.pool_stats returns
+			them.
+		force : bool
+			Write it now.
+		"""
+		# Another thread already writing it is as good as writing it
+		if not self._lock.acquire(blocking=force):
+			return
+		try:
+			now = time.monotonic()
+			if self._pid != os.getpid():
+				# First write of a newly forked worker. The name is unique to
+				# the process, so a later worker reusing the pid can't
+				# overwrite it before it is retired
+				self._pid = os.getpid()
+				self._path = os.path.join(self.directory, f"worker-{self._pid}-{uuid.uuid4().hex}.json")
+				self._flushed_at = None
+			if not force and self._flushed_at is not None and now - self._flushed_at < self.flush_interval:
+				return
+			self._flushed_at = now
+			os.makedirs(self.directory, exist_ok=True)
+			_write_json(self._path, {
+				"pid": self._pid,
+				"metrics": metrics.snapshot(),
+				"caches": caches or {},
+				"pools": pools or {}
+			})
+		finally:
+			self._lock.release()
+
+	def collect(self):
+		"""
+		Adds up the snapshots of the running and retired workers.
+
+		Returns
+		-------
+		tuple
+			The QueryMetrics, cache stats and pool stats of the server.
+		"""
+		while True:
+			retired = self._retired()
+			workers = []
+			for name in self._worker_files():
+				if name not in retired["absorbed"]:
+					snapshot = _read_json(os.path.join(self.directory, name))
+					if snapshot is not None:
+						workers.append(snapshot)
+			# A worker retired while the files were read may have been
+			# missed, or counted twice, so read them again
+			if self._retired()["generation"] == retired["generation"]:
+				break
+
+		metrics = QueryMetrics(None)
+		metrics.merge(retired["metrics"])
+		caches = _add_counters({}, retired["caches"], self.CACHE_COUNTERS)
+		pools = _add_counters({}, retired["pools"], self.POOL_COUNTERS)
+		for snapshot in workers:
+			metrics.merge(snapshot["metrics"])
+			_add_counters(caches, snapshot["caches"], self.CACHE_COUNTERS)
+			_add_counters(pools, snapshot["pools"], self.POOL_COUNTERS)
+			if not _is_running(snapshot["pid"]):
+				continue
+			for name, stats in snapshot["caches"].items():
+				caches[name]["size"] = caches[name].get("size", 0) + stats["size"]
+			for name, stats in snapshot["pools"].items():
+				pool = pools[name]
+				pool["size"] = pool.get("size", 0) + stats["size"]
+				pool["in_use"] = pool.get("in_use", 0) + stats["in_use"]
+				pool["up"] = min(pool.get("up", 1), stats["up"])
+		for name, stats in caches.items():
+			stats.setdefault("size", 0)
+		for name, stats in pools.items():
+			stats.setdefault("size", 0)
+			stats.setdefault("in_use", 0)
+			stats.setdefault("up", 0)
+		return metrics, caches, pools
+
+	def retire(self, pid):
+		"""
+		Folds the counters of an exited worker into the retired file and
+		removes its snapshot. Only the master calls this, once the worker
+		has exited, so retired is never written by two processes at once.
+
+		Parameters
+		----------
+		pid : int
+			The exited worker's process id.
+		"""
+		names = [name for name in self._worker_files() if name.startswith(f"worker-{pid}-")]
+		if not names:
+			return
+		retired = self._retired()
+		metrics = QueryMetrics(None)
+		metrics.merge(retired["metrics"])
+		for name in names:
+			snapshot = _read_json(os.path.join(self.directory, name))
+			if snapshot is not None:
+				metrics.merge(snapshot["metrics"])
+				_add_counters(retired["caches"], snapshot["caches"], self.CACHE_COUNTERS)
+				_add_counters(retired["pools"], snapshot["pools"], self.POOL_COUNTERS)
+		present = set(self._worker_files())
+		_write_json(os.path.join(self.directory, self.RETIRED), {
+			"generation": retired["generation"] + 1,
+			# Scrapes skip these files until they are removed below
+			"absorbed": [name for name in retired["absorbed"] if name in present] + names,
+			"metrics": metrics.snapshot(),
+			"caches": retired["caches"],
+			"pools": retired["pools"]
+		})
+		for name in names:
+			os.remove(os.path.join(self.directory, name))
+
+	def clear(self):
+		"""
+		Removes every snapshot, when the server starts.
+		"""
+		for name in self._worker_files() + [self.RETIRED]:
+			try:
+				os.remove(os.path.join(self.directory, name))
+			except FileNotFoundError:
+				pass
+
+	def _retired(self):
+		retired = _read_json(os.path.join(self.directory, self.RETIRED))
+		if retired is None:
+			retired = {"generation": 0, "absorbed": [], "metrics": QueryMetrics(None).snapshot(), "caches": {}, "pools": {}}
+		return retired
+
+	def _worker_files(self):
+		try:
+			return [name for name in os.listdir(self.directory) if name.startswith("worker-") and name.endswith(".json")]
+		except FileNotFoundError:
+			return []
+
+
+def _write_json(path, data):
+	# Written aside and renamed into place, so readers never see half a file
+	temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+	with open(temporary, 'w') as file:
+		json.dump(data, file)
+	os.replace(temporary, path)
+
+
+def _read_json(path):
+	try:
+		with open(path) as file:
+			return json.load(file)
+	except FileNotFoundError:
+		return None
+
+
+def _add_counters(totals, stats, fields):
+	for name, values in stats.items():
+		entry = totals.setdefault(name, {})
+		for field in fields:
+			entry[field] = entry.get(field, 0) + values.get(field, 0)
+	return totals
+
+
+def _is_running(pid):
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		pass
+	return True
+
+
+def _labels(**labels):
+	escaped = []
+	for name, value in labels.items():
+		value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+		escaped.append(f'{name}="{value}"')
+	return '{' + ','.join(escaped) + '}'
+
+
+def _render_counter(name, description, samples):
+	lines = [f'# HELP {name} {description}', f'# TYPE {name} counter']
+	return lines + [f'{name}{labels} {value}' for labels, value in samples.items()]
+
+
+def _render_histogram(name, description, histograms):
+	lines = [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+	for labels, histogram in histograms.items():
+		prefix = labels[:-1] + ',' if labels != '{}' else '{'
+		for bound, count in histogram.cumulative():
+			lines.append(f'{name}_bucket{prefix}le="{bound}"}} {count}')
+		lines.append(f'{name}_bucket{prefix}le="+Inf"}} {histogram.count}')
+		lines.append(f'{name}_sum{labels} {histogram.sum}')
+		lines.append(f'{name}_count{labels} {histogram.count}')
+	return lines
@@ -0,0 +1,255 @@
+"""
+Versioned schema migrations. Each migration is a function that takes
+the storage backend and a cursor and is applied once, in version
+order, by migrate(); the versions applied so far are recorded in the
+schema_version table.
+
+Add a migration by writing a new function at the bottom of this module
+and appending it to MIGRATIONS with the next version number. Never
+change a migration that has been released, since databases that have
+already applied it will not run it again. MySQL commits DDL as it runs,
+so write each migration so that it can be re-run if it fails halfway.
+Migrations are written in MySQL's dialect, which the SQLite backend
+translates.
+"""
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_TABLE = """
+	CREATE TABLE IF NOT EXISTS schema_version (
+		version INT PRIMARY KEY,
+		description VARCHAR(255),
+		applied_at DATETIME
+	)
+"""
+
+
+def current_version(db_manager):
+	"""
+	Parameters
+	----------
+	db_manager : DatabaseManager
+		The database.
+
+	Returns
+	-------
+	int
+		The latest version applied to the database, 0 if none.
+	"""
+	with db_manager.connection() as conn, conn.cursor() as cursor:
+		cursor.execute(SCHEMA_VERSION_TABLE)
+		cursor.execute("SELECT MAX(version) FROM schema_version")
+		return cursor.fetchone()[0] or 0
+
+
+def pending_migrations(db_manager):
+	"""
+	Returns
+	-------
+	list
+		The (version, description, migration) tuples not yet applied to
+		the database, in order.
+	"""
+	version = current_version(db_manager)
+	return [migration for migration in MIGRATIONS if migration[0] > version]
+
+
+def migrate(db_manager, target=None):
+	"""
+	Applies the pending migrations up to and including the target
+	version, recording each one as it completes. Concurrent callers
+	wait for each other, so every migration runs once.
+
+	Parameters
+	----------
+	db_manager : DatabaseManager
+		The database to migrate.
+	target : int
+		The version to stop at, defaults to the latest.
+
+	Returns
+	-------
+	list
+		The versions applied, empty if the database was up to date.
+	"""
+	applied = []
+	backend = db_manager.backend
+	with db_manager.connection() as conn, conn.cursor() as cursor, backend.migration_lock(cursor):
+		cursor.execute(SCHEMA_VERSION_TABLE)
+		cursor.execute("SELECT MAX(version) FROM schema_version")
+		version = cursor.fetchone()[0] or 0
+		for migration_version, description, migration in MIGRATIONS:
+			if migration_version <= version or (target is not None and migration_version > target):
+				continue
+			logger.info("Applying migration %d: %s", migration_version, description)
+			migration(backend, cursor)
+			cursor.execute(
+				"INSERT INTO schema_version (version, description, applied_at) VALUES (%s, %s, %s)",
+				(migration_version, description, datetime.now())
+			)
+			applied.append(migration_version)
+	return applied
+
+
+def initial_schema(backend, cursor):
+	create_customer_table = """
+        CREATE TABLE IF NOT EXISTS Customer (
+            customer_id INT AUTO_INCREMENT PRIMARY KEY,
+            first_name VARCHAR(50),
+            last_name VARCHAR(50),
+            email VARCHAR(100),
+            phone VARCHAR(20)
+        )
+        """
+	create_vehicle_table = """
+        CREATE TABLE IF NOT EXISTS Vehicle (
+            vehicle_id INT AUTO_INCREMENT PRIMARY KEY,
+            type VARCHAR(50),
+            model VARCHAR(50),
+            make VARCHAR(50),
+            year INT,
+            registration_number VARCHAR(50),
+            available BOOLEAN
+        )
+        """
+	create_booking_table = """
+        CREATE TABLE IF NOT EXISTS Booking (
+            booking_id INT AUTO_INCREMENT PRIMARY KEY,
+            customer_id INT,
+            vehicle_id INT,
+            date_hired DATE,
+            return_date DATE,
+            payment_status VARCHAR(20),
+            FOREIGN KEY (customer_id) REFERENCES Customer(customer_id),
+            FOREIGN KEY (vehicle_id) REFERENCES Vehicle(vehicle_id)
+        )
+        """
+	create_invoice_table = """
+        CREATE TABLE IF NOT EXISTS Invoice (
+            invoice_id INT AUTO_INCREMENT PRIMARY KEY,
+            booking_id INT,
+            total_amount FLOAT,
+            payment_date DATE,
+            FOREIGN KEY (booking_id) REFERENCES Booking(booking_id)
+        )
+        """
+	create_rate_table = """
+        CREATE TABLE IF NOT EXISTS Rate (
+            vehicle_type VARCHAR(50) PRIMARY KEY,
+            daily_rate FLOAT
+        )
+        """
+	create_notification_table = """
+        CREATE TABLE IF NOT EXISTS Notification (
+            notification_id INT AUTO_INCREMENT PRIMARY KEY,
+            booking_id INT,
+            kind VARCHAR(50),
+            status VARCHAR(20),
+            attempts INT DEFAULT 0,
+            next_attempt_at DATETIME,
+            last_error VARCHAR(255),
+            sent_at DATETIME,
+            FOREIGN KEY (booking_id) REFERENCES Booking(booking_id)
+        )
+        """
+	cursor.execute(create_customer_table)
+	cursor.execute(create_vehicle_table)
+	cursor.execute(create_booking_table)
+	cursor.execute(create_invoice_table)
+	cursor.execute(create_rate_table)
+	cursor.execute(create_notification_table)
+	# Availability searches seek on the vehicle's bookings by date
+	# and filter the fleet by type, window loads range over the
+	# bookings that have not yet been returned and the daily report
+	# seeks on the day of hire
+	backend.create_index(cursor, "Booking", "idx_booking_vehicle_dates", "vehicle_id, date_hired, return_date")
+	backend.create_index(cursor, "Booking", "idx_booking_return_date", "return_date, date_hired, vehicle_id")
+	backend.create_index(cursor, "Booking", "idx_booking_date_hired", "date_hired")
+	backend.create_index(cursor, "Vehicle", "idx_vehicle_type", "type")
+	backend.create_index(cursor, "Customer", "idx_customer_last_name", "last_name")
+	backend.create_index(cursor, "Customer", "idx_customer_email", "email")
+	backend.create_index(cursor, "Notification", "idx_notification_due", "status, next_attempt_at")
+
+
+def row_versions(backend, cursor):
+	# Bumped by every update through BaseDAO, so the HTTP layer can derive
+	# ETags from it
+	for table_name in ("Customer", "Vehicle", "Booking", "Invoice"):
+		backend.add_column(cursor, table_name, "version", "INT NOT NULL DEFAULT 1")
+
+
+def invoice_per_booking(backend, cursor):
+	# Concurrent invoicing runs insert with INSERT IGNORE, so the unique
+	# key keeps a booking from being invoiced twice. Invoicing used to
+	# allow that, so the key can only be added once each booking is down
+	# to one invoice: the paid one if there is one, otherwise the first.
+	# The others move to InvoiceDuplicate rather than being lost
+	cursor.execute(
+		"""
+		SELECT invoice_id, booking_id, payment_date
+		FROM Invoice
+		WHERE booking_id IN (SELECT booking_id FROM Invoice GROUP BY booking_id HAVING COUNT(*) > 1)
+		ORDER BY booking_id, invoice_id
+		"""
+	)
+	invoices = {}
+	for invoice_id, booking_id, payment_date in cursor.fetchall():
+		invoices.setdefault(booking_id, []).append((payment_date is None, invoice_id))
+	duplicate_ids = [
+		invoice_id
+		for booking_invoices in invoices.values()
+		for _, invoice_id in sorted(booking_invoices)[1:]
+	]
+	if duplicate_ids:
+		logger.warning(
+			"Moving %d duplicate invoices of bookings %s to InvoiceDuplicate",
+			len(duplicate_ids), ", ".join(str(booking_id) for booking_id in invoices)
+		)
+		cursor.execute(
+			"""
+			CREATE TABLE IF NOT EXISTS InvoiceDuplicate (
+				invoice_id INT PRIMARY KEY,
+				booking_id INT,
+				total_amount FLOAT,
+				payment_date DATE,
+				version INT NOT NULL DEFAULT 1
+			)
+			"""
+		)
+		placeholders = ", ".join(["%s"] * len(duplicate_ids))
+		# INSERT IGNORE, so a re-run after MySQL failed between the two
+		# statements copies only what is still left to move
+		cursor.execute(
+			f"""
+			INSERT IGNORE INTO InvoiceDuplicate (invoice_id, booking_id, total_amount, payment_date, version)
+			SELECT invoice_id, booking_id, total_amount, payment_date, version
+			FROM Invoice
+			WHERE invoice_id IN ({placeholders})
+			""",
+			duplicate_ids
+		)
+		cursor.execute(f"DELETE FROM Invoice WHERE invoice_id IN ({placeholders})", duplicate_ids)
+	backend.create_index(cursor, "Invoice", "uq_invoice_booking", "booking_id", unique=True)
+
+
+def default_rates(backend, cursor):
+	# Every type starts at the flat rate charged before the rate table, so
+	# prices don't change until a rate is set with the set-rate command
+	for vehicle_type in ("small car", "family car", "van"):
+		cursor.execute(
+			"INSERT IGNORE INTO Rate (vehicle_type, daily_rate) VALUES (%s, %s)",
+			(vehicle_type, 200.75)
+		)
+
+
+# (version, description, migration) in the order they are applied. The
+# initial schema only creates what is missing, so databases set up
+# before migrations were versioned adopt it as version 1.
+MIGRATIONS = (
+	(1, "Create the tables and indexes", initial_schema),
+	(2, "Add row versions to the entity tables", row_versions),
+	(3, "Allow one invoice per booking", invoice_per_booking),
+	(4, "Add a daily rate for each vehicle type", default_rates),
+)
@@ -0,0 +1,176 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolExhaustedError(Exception):
+	"""
+	Raised when no connection could be checked out of the pool before
+	the timeout expired.
+	"""
+
+
+class ConnectionPool:
+	"""
+	A bounded, thread-safe pool of database connections.
+
+	Connections are created lazily up to max_size and handed out
+	last-in-first-out so the warmest connection is reused first. Idle
+	connections older than idle_timeout are closed instead of being
+	handed out, and connections that have been idle for longer than
+	health_check_interval are pinged (and reconnected if the server
+	dropped them) before they are returned to the caller.
+	"""
+
+	def __init__(self, connect, max_size=10, idle_timeout=300, health_check_interval=30, timeout=30):
+		"""
+		Parameters
+		----------
+		connect : callable
+			A factory returning a new DB-API connection.
+		max_size : int
+			The maximum number of open connections.
+		idle_timeout : float
+			Seconds a connection may sit idle before it is closed.
+		health_check_interval : float
+			Seconds a connection may sit idle before it is pinged on borrow.
+		timeout : float
+			Seconds to wait for a free connection before giving up.
+		"""
+		if max_size < 1:
+			raise ValueError("Pool max_size must be at least 1")
+		self._connect = connect
+		self.max_size = max_size
+		self.idle_timeout = idle_timeout
+		self.health_check_interval = health_check_interval
+		self.timeout = timeout
+		self._idle = deque()
+		self._size = 0
+		self._closed = False
+		self._cond = threading.Condition()
+
+	@property
+	def size(self):
+		"""
+		The number of connections currently open (idle or checked out).
+		"""
+		return self._size
+
+	@property
+	def in_use(self):
+		"""
+		The number of connections currently checked out.
+		"""
+		with self._cond:
+			return self._size - len(self._idle)
+
+	def acquire(self, timeout=None):
+		"""
+		Checks a connection out of the pool, opening a new one if the
+		pool has not reached max_size.
+
+		Parameters
+		----------
+		timeout : float
+			Seconds to wait for a free connection, defaults to the pool's
+			timeout.
+
+		Returns
+		-------
+		Connection
+			A healthy DB-API connection.
+		"""
+		timeout = self.timeout if timeout is None else timeout
+		deadline = time.monotonic() + timeout
+		stale = []
+		conn = None
+		last_used = None
+		with self._cond:
+			while True:
+				if self._closed:
+					raise PoolExhaustedError("Connection pool is closed")
+				now = time.monotonic()
+				while self._idle:
+					candidate, candidate_last_used = self._idle.pop()
+					if now - candidate_last_used > self.idle_timeout:
+						self._size -= 1
+						stale.append(candidate)
+						continue
+					conn, last_used = candidate, candidate_last_used
+					break
+				if conn is not None or self._size < self.max_size:
+					break
+				remaining = deadline - now
+				if remaining <= 0:
+					raise PoolExhaustedError(
+						f"No database connection became available within {timeout} seconds"
+					)
+				self._cond.wait(remaining)
+			if conn is None:
+				# Reserve the slot before connecting outside the lock
+				self._size += 1
+
+		for candidate in stale:
+			self._close_quietly(candidate)
+
+		if conn is None:
+			try:
+				return self._connect()
+			except Exception:
+				self._forget()
+				raise
+
+		if time.monotonic() - last_used > self.health_check_interval:
+			try:
+				conn.ping(reconnect=True)
+			except Exception:
+				self._close_quietly(conn)
+				self._forget()
+				raise
+		return conn
+
+	def release(self, conn, discard=False):
+		"""
+		Returns a connection to the pool.
+
+		Parameters
+		----------
+		conn : Connection
+			A connection previously returned by acquire.
+		discard : bool
+			Close the connection instead of keeping it, used when the
+			connection is broken or in an unknown state.
+		"""
+		with self._cond:
+			if not discard and not self._closed:
+				self._idle.append((conn, time.monotonic()))
+				self._cond.notify()
+				return
+		self._close_quietly(conn)
+		self._forget()
+
+	def close(self):
+		"""
+		Closes every idle connection and refuses further checkouts.
+		Connections still checked out are closed when released.
+		"""
+		with self._cond:
+			self._closed = True
+			idle = [conn for conn, _ in self._idle]
+			self._idle.clear()
+			self._size -= len(idle)
+			self._cond.notify_all()
+		for conn in idle:
+			self._close_quietly(conn)
+
+	def _forget(self):
+		with self._cond:
+			self._size -= 1
+			self._cond.notify()
+
+	@staticmethod
+	def _close_quietly(conn):
+		try:
+			conn.close()
+		except Exception:
+			pass
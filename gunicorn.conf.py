@@ -0,0 +1,78 @@
+"""
+The production server: gunicorn runs the app in pre-forked worker
+processes, each with its own connection pools. Start it from the
+repository root, where gunicorn picks this file up:
+
+    gunicorn
+
+The settings are read from envs.env. The master loads the app once,
+then forks the workers, so they boot fast and share its memory; no
+connection is opened before the fork, and DatabaseManager forgets any
+that were in every child. Each worker handles one request at a time, so
+it needs a single connection and the database sees at most WEB_WORKERS
+of them per server (plus replicas). Run it behind a buffering proxy
+such as nginx so slow clients don't hold workers.
+
+Signals go to the master: HUP starts fresh workers with the reloaded
+settings and lets the old ones finish their requests within
+WEB_GRACEFUL_TIMEOUT, TTIN and TTOU add or remove a worker, and TERM
+stops gracefully. To deploy new code, send USR2 to start a new master
+beside the old one, then QUIT to the old master. Workers are recycled
+after WEB_MAX_REQUESTS requests, with some jitter so they don't all
+restart at once.
+
+The report scheduler and notification dispatcher threads are not
+started, as they would not survive the fork; run the
+generate-daily-report and dispatch-notifications commands from cron.
+The customer and vehicle caches and the availability index are off,
+whatever their settings: each worker's copy would not see the writes
+the others make, and would serve stale records and ETags or offer
+vehicles that are already booked.
+
+Each worker writes its metrics to METRICS_DIR at most every
+METRICS_FLUSH_INTERVAL seconds, and /metrics adds up every worker's, so
+Prometheus sees the whole server whichever worker answers the scrape.
+"""
+import os
+
+from decouple import Config, RepositoryEnv
+
+from database.instrumentation import SharedMetrics
+
+DOTENV_FILE = './envs.env'
+
+settings = Config(RepositoryEnv(DOTENV_FILE))
+
+wsgi_app = 'app:create_app(background=False)'
+preload_app = True
+bind = settings('WEB_BIND', default='127.0.0.1:8000')
+# One worker per core unless set
+workers = settings('WEB_WORKERS', default=0, cast=int) or os.cpu_count() or 1
+threads = settings('WEB_THREADS', default=1, cast=int)
+max_requests = settings('WEB_MAX_REQUESTS', default=10000, cast=int)
+max_requests_jitter = settings('WEB_MAX_REQUESTS_JITTER', default=1000, cast=int)
+timeout = settings('WEB_TIMEOUT', default=30, cast=int)
+graceful_timeout = settings('WEB_GRACEFUL_TIMEOUT', default=30, cast=int)
+keepalive = settings('WEB_KEEPALIVE', default=5, cast=int)
+
+# The workers' metrics, added up by /metrics whichever worker answers
+shared_metrics = SharedMetrics(settings('METRICS_DIR', default='./metrics'))
+
+
+def on_starting(server):
+	shared_metrics.clear()
+
+
+def child_exit(server, worker):
+	# Keep the exited worker's counts, so counters never go backwards
+	shared_metrics.retire(worker.pid)
+
+
+def worker_exit(server, worker):
+	# End the worker's database sessions cleanly when it is recycled or
+	# stopped, rather than leaving the server to time them out
+	app = getattr(worker, 'wsgi', None)
+	if app is not None:
+		from app import publish_metrics
+		publish_metrics(app.extensions['car_hire'], force=True)
+		app.extensions['car_hire']['db_manager'].close()
@@ -0,0 +1,291 @@
+from models.daos import BaseDAO, CustomerDAO, VehicleDAO
+
+
+class AsyncBaseDAO(BaseDAO):
+	"""
+	The asyncio counterpart of BaseDAO, used with AsyncDatabaseManager.
+	It builds the same SQL and shares the caching and row helpers of
+	BaseDAO, but every method that talks to the database is a coroutine.
+	"""
+
+	async def add(self, data):
+		"""
+		Inserts record into database and returns the newly inserted record.
+
+		Parameters
+		----------
+		data : dict
+			A dictionary containing the record data.
+
+		Returns
+		-------
+		dict
+			A dictionary containing the record that was just inserted into
+			the database.
+		"""
+		data = self._writable(data)
+		sql = self._insert_sql(tuple(data.keys()))
+		async with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			await self._execute(cursor, sql, list(data.values()))
+			record_id = cursor.lastrowid
+		self._invalidate([record_id])
+		return self._inserted(record_id, data)
+
+	async def update(self, identifier, data):
+		"""
+		Updates existing record in database and returns the newly updated
+		record, rebuilt from the data rather than read back.
+
+		Parameters
+		----------
+		identifier : int
+			Primary key id for record.
+		data : dict
+			A dictionary containing the record data.
+
+		Returns
+		-------
+		dict
+			A dictionary containing the record that was just updated in
+			the database, with its new version if the table is versioned,
+			or None if no record has that id.
+		"""
+		data = self._writable(data)
+		sql = self._update_sql(tuple(data.keys()), returning=self.VERSIONED)
+		async with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			matched = await self._execute(cursor, sql, list(data.values()) + [identifier])
+			if self.VERSIONED:
+				version = self.db_manager.backend.returned_value(cursor)
+				matched = version is not None
+		self._invalidate([identifier])
+		if not matched:
+			return None
+		record = {self.id_name: identifier, **data}
+		if self.VERSIONED:
+			record['version'] = version
+		return record
+
+	async def delete(self, identifier):
+		"""
+		Deletes existing record from database.
+
+		Parameters
+		----------
+		identifier : int
+			Primary key id for record.
+
+		Returns
+		-------
+		bool
+			True if a record was deleted, False if no record has that id.
+		"""
+		async with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			deleted = await self._execute(cursor, self._delete_sql(), (identifier,))
+		self._invalidate([identifier])
+		return deleted > 0
+
+	async def get(self, identifier):
+		"""
+		Retrieves existing record in database.
+
+		Parameters
+		----------
+		identifier : int
+			Primary key id for record.
+
+		Returns
+		-------
+		dict
+			A dictionary containing the record that was just retrieved from
+			the database.
+		"""
+		token = None
+		if self._cache_enabled():
+			record = self.cache.get((self.table_name, identifier))
+			if record is not None:
+				return record
+			token = self.cache.token()
+		async with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			await self._execute(cursor, self._select_sql(), (identifier,))
+			row = await cursor.fetchone()
+			if row:
+				record = self._record_type(cursor)._make(row)
+				self._cache_records([record], token)
+				return record
+		return None
+
+	async def add_many(self, records):
+		"""
+		Inserts many records using multi-row INSERT statements, one
+		statement and commit per chunk of batch_size records.
+
+		Parameters
+		----------
+		records : list
+			A list of dictionaries containing the record data.
+
+		Returns
+		-------
+		int
+			The number of records inserted.
+		"""
+		inserted = 0
+		for chunk in self._chunks(records):
+			columns = list(chunk[0].keys())
+			if any(set(record.keys()) != set(columns) for record in chunk):
+				raise ValueError("All records in a batch must have the same fields")
+			sql = self._insert_sql(tuple(columns), len(chunk))
+			params = [record[column] for record in chunk for column in columns]
+			async with self.db_manager.connection() as conn, conn.cursor() as cursor:
+				inserted += await self._execute(cursor, sql, params)
+		return inserted
+
+	async def update_many(self, updates):
+		"""
+		Updates many records, one transaction and commit per chunk of
+		batch_size records.
+
+		Parameters
+		----------
+		updates : list
+			A list of (identifier, data) tuples.
+
+		Returns
+		-------
+		int
+			The number of rows matched.
+		"""
+		updated = 0
+		for chunk in self._chunks(updates):
+			grouped = {}
+			for identifier, data in chunk:
+				data = self._writable(data)
+				grouped.setdefault(tuple(data.keys()), []).append(list(data.values()) + [identifier])
+			async with self.db_manager.transaction() as conn, conn.cursor() as cursor:
+				for columns, params in grouped.items():
+					updated += await self._execute(cursor, self._update_sql(columns), params, many=True)
+			self._invalidate([identifier for identifier, _ in chunk])
+		return updated
+
+	async def get_version(self, identifier):
+		"""
+		Looks up a record's version, from the cache if it holds the
+		record, otherwise by reading the version column alone.
+
+		Parameters
+		----------
+		identifier : int
+			Primary key id for record.
+
+		Returns
+		-------
+		int
+			The record's version, or None if no record has that id.
+		"""
+		if self._cache_enabled():
+			record = self.cache.get((self.table_name, identifier))
+			if record is not None:
+				return record['version']
+		sql = self._statement(
+			('version',), lambda: f"SELECT version FROM {self.table_name} WHERE {self.id_name} = %s")
+		async with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			await self._execute(cursor, sql, (identifier,))
+			row = await cursor.fetchone()
+		return row[0] if row else None
+
+	async def get_many(self, identifiers):
+		"""
+		Retrieves many records with WHERE id IN (...) queries, one query
+		per chunk of batch_size identifiers.
+
+		Parameters
+		----------
+		identifiers : list
+			Primary key ids for the records.
+
+		Returns
+		-------
+		list
+			A list of dictionaries containing the records that were found,
+			in the order their ids were given.
+		"""
+		unique_ids = list(dict.fromkeys(identifiers))
+		found = {}
+		missing = unique_ids
+		token = None
+		if self._cache_enabled():
+			missing = []
+			for identifier in unique_ids:
+				record = self.cache.get((self.table_name, identifier))
+				if record is None:
+					missing.append(identifier)
+				else:
+					found[identifier] = record
+			token = self.cache.token()
+		for chunk in self._chunks(missing):
+			async with self.db_manager.connection() as conn, conn.cursor() as cursor:
+				await self._execute(cursor, self._select_sql(len(chunk)), chunk)
+				records = list(map(self._record_type(cursor)._make, await cursor.fetchall()))
+			for record in records:
+				found[record[self.id_name]] = record
+			self._cache_records(records, token)
+		return [found[identifier] for identifier in unique_ids if identifier in found]
+
+	async def list(self, filters=None, sort=None, descending=False, after=None, limit=50):
+		sql, params = self._list_query(filters, sort, descending, after, limit)
+		async with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			await self._execute(cursor, sql, params)
+			return list(map(self._record_type(cursor)._make, await cursor.fetchall()))
+
+	async def _execute(self, cursor, sql, params=None, many=False):
+		return await self.db_manager.execute(cursor, sql, params, many=many)
+
+
+class AsyncCustomerDAO(AsyncBaseDAO):
+	VERSIONED = CustomerDAO.VERSIONED
+	LIST_FILTERS = CustomerDAO.LIST_FILTERS
+	LIST_SORTS = CustomerDAO.LIST_SORTS
+
+	def __init__(self, db_manager, **kwargs):
+		super().__init__(db_manager, "Customer", "customer_id", **kwargs)
+
+
+class AsyncVehicleDAO(AsyncBaseDAO):
+	VERSIONED = VehicleDAO.VERSIONED
+	FLEET_QUERY = VehicleDAO.FLEET_QUERY
+	LIST_FILTERS = VehicleDAO.LIST_FILTERS
+	LIST_SORTS = VehicleDAO.LIST_SORTS
+	_available_vehicles_query = VehicleDAO._available_vehicles_query
+
+	def __init__(self, db_manager, **kwargs):
+		super().__init__(db_manager, "Vehicle", "vehicle_id", **kwargs)
+
+	async def find_available_vehicles(self, vehicle_type, start_date, end_date):
+		"""
+		Finds every vehicle in service that has no booking overlapping
+		the date range, with a single anti-join against Booking.
+
+		Returns
+		-------
+		list
+			A list of dictionaries containing the free vehicles.
+		"""
+		sql, params = self._available_vehicles_query(vehicle_type, start_date, end_date)
+		async with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			await self._execute(cursor, sql, params)
+			return list(map(self._record_type(cursor)._make, await cursor.fetchall()))
+
+	async def get_fleet(self):
+		"""
+		Retrieves the id, type and in-service flag of every vehicle.
+
+		Returns
+		-------
+		list
+			A list of dictionaries containing the vehicle_id, type and
+			available fields.
+		"""
+		async with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			await self._execute(cursor, self.FLEET_QUERY)
+			return list(map(self._record_type(cursor)._make, await cursor.fetchall()))
+
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+	"""
+	A thread-safe in-process cache with least-recently-used eviction and
+	a time-to-live per entry. Any object with the same get, set,
+	invalidate and token methods can be plugged into a DAO instead.
+
+	Writers call invalidate, readers take a token before going to the
+	database and pass it to set, so a value read before an invalidation
+	is never stored after it.
+	"""
+
+	def __init__(self, max_size=1024, ttl=60):
+		"""
+		Parameters
+		----------
+		max_size : int
+			The maximum number of entries kept.
+		ttl : float
+			Seconds an entry stays valid after it is stored.
+		"""
+		self.max_size = max_size
+		self.ttl = ttl
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._entries = OrderedDict()
+		self._invalidations = 0
+		self._lock = threading.Lock()
+
+	def get(self, key):
+		"""
+		Parameters
+		----------
+		key : hashable
+			The entry key.
+
+		Returns
+		-------
+		object
+			The cached value, or None if it is missing or expired.
+		"""
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				self.misses += 1
+				return None
+			value, expires_at = entry
+			if expires_at < time.monotonic():
+				del self._entries[key]
+				self.misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return value
+
+	def token(self):
+		"""
+		Returns
+		-------
+		int
+			A token to pass to set for a value about to be read.
+		"""
+		return self._invalidations
+
+	def set(self, key, value, token=None):
+		"""
+		Stores a value, evicting the least recently used entry if the
+		cache is full.
+
+		Parameters
+		----------
+		key : hashable
+			The entry key.
+		value : object
+			The value to cache.
+		token : int
+			The token taken before the value was read. The value is not
+			stored if anything was invalidated since.
+		"""
+		with self._lock:
+			if token is not None and token != self._invalidations:
+				return
+			self._entries[key] = (value, time.monotonic() + self.ttl)
+			self._entries.move_to_end(key)
+			while len(self._entries) > self.max_size:
+				self._entries.popitem(last=False)
+				self.evictions += 1
+
+	def invalidate(self, key):
+		"""
+		Removes an entry.
+
+		Parameters
+		----------
+		key : hashable
+			The entry key.
+		"""
+		with self._lock:
+			self._invalidations += 1
+			self._entries.pop(key, None)
+
+	def clear(self):
+		"""
+		Removes every entry.
+		"""
+		with self._lock:
+			self._invalidations += 1
+			self._entries.clear()
+
+	def stats(self):
+		"""
+		Returns
+		-------
+		dict
+			The cache's size, limits and hit/miss/eviction counters.
+		"""
+		with self._lock:
+			return {
+				"size": len(self._entries),
+				"max_size": self.max_size,
+				"ttl": self.ttl,
+				"hits": self.hits,
+				"misses": self.misses,
+				"evictions": self.evictions
+			}
@@ -1,48 +1,82 @@
+from datetime import date, datetime, timedelta
+
+from models.cache import LRUCache
+from models.models import record_type
+
+
 class BaseDAO:
 	"""
 	A base DAO class to be called by the child DAO's. The relevant
 	CRUD operations will be handled dynamically by the child DAO
 	injecting its manager class, table name and id name on
-	initialization.
+	initialization. Bulk operations are split into chunks of
+	batch_size rows, each chunk written with a single statement and
+	committed once. Single statement writes run on an autocommit
+	connection, or join the caller's transaction if one is open, so they
+	cost one round trip rather than BEGIN, the statement and COMMIT. If
+	a cache is injected, reads by id are served from it and writes
+	invalidate it.
+
+	Reads return records (see models.models.Record), slotted read-only
+	mappings whose type is built once per result column set. The
+	generated SQL is memoized per table, operation and column set in
+	statement_cache, which all DAOs share.
 	"""
 
-	def __init__(self, db_manager, table_name, id_name):
+	statement_cache = LRUCache(max_size=1024, ttl=float('inf'))
+
+	# Columns list may filter on, with the function that parses a value,
+	# and may sort on besides the id. Sort columns need an index and must
+	# not be NULL for keyset pagination to work.
+	LIST_FILTERS = {}
+	LIST_SORTS = ()
+
+	# Whether the table has a version column, which every update bumps
+	# so the HTTP layer can derive ETags from it
+	VERSIONED = False
+
+	def __init__(self, db_manager, table_name, id_name, batch_size=500, cache=None):
 		self.db_manager = db_manager
 		self.table_name = table_name
 		self.id_name = id_name
+		self.batch_size = batch_size
+		self.cache = cache
 
-	def add(self, data):
+	def add(self, data, ignore_duplicates=False):
 		"""
 		Inserts record into database and returns the newly inserted record.
+		The record is rebuilt from the data and the last insert id rather
+		than read back, so the insert is a single round trip.
 
 		Parameters
 		----------
 		data : dict
 			A dictionary containing the record data.
+		ignore_duplicates : bool
+			Skip the record, rather than fail, if it would duplicate a
+			unique key.
 
 		Returns
 		-------
 		dict
 			A dictionary containing the record that was just inserted into
-			the database.
+			the database, or None if it was skipped as a duplicate.
 		"""
-		conn = self.db_manager.get_connection()
-		cursor = conn.cursor()
-		columns = ', '.join(data.keys())
-		values = ', '.join(['%s'] * len(data))
-		sql = f"INSERT INTO {self.table_name} ({columns}) VALUES ({values})"
-		cursor.execute(sql, list(data.values()))
-		conn.commit()
-		# Get the ID of the last inserted row
-		record_id = cursor.lastrowid
-		# Fetch the newly inserted object from the database
-		record = self.get(record_id)
-		cursor.close()
-		return record
+		data = self._writable(data)
+		sql = self._insert_sql(tuple(data.keys()), ignore=ignore_duplicates)
+		with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			inserted = self._execute(cursor, sql, list(data.values()))
+			# Get the ID of the last inserted row
+			record_id = cursor.lastrowid
+		if not inserted:
+			return None
+		self._invalidate([record_id])
+		return self._inserted(record_id, data)
 
 	def update(self, identifier, data):
 		"""
-		Updates existing record in database and returns the newly updated record.
+		Updates existing record in database and returns the newly updated
+		record, rebuilt from the data rather than read back.
 
 		Parameters
 		----------
@@ -55,16 +89,22 @@ class BaseDAO:
 		-------
 		dict
 			A dictionary containing the record that was just updated in
-			the database.
+			the database, with its new version if the table is versioned,
+			or None if no record has that id.
 		"""
-		conn = self.db_manager.get_connection()
-		cursor = conn.cursor()
-		set_clause = ', '.join([f"{key} = %s" for key in data.keys()])
-		sql = f"UPDATE {self.table_name} SET {set_clause} WHERE {self.id_name} = %s"
-		cursor.execute(sql, list(data.values()) + [identifier])
-		conn.commit()
-		record = self.get(identifier)
-		cursor.close()
+		data = self._writable(data)
+		sql = self._update_sql(tuple(data.keys()), returning=self.VERSIONED)
+		with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			matched = self._execute(cursor, sql, list(data.values()) + [identifier])
+			if self.VERSIONED:
+				version = self.db_manager.backend.returned_value(cursor)
+				matched = version is not None
+		self._invalidate([identifier])
+		if not matched:
+			return None
+		record = {self.id_name: identifier, **data}
+		if self.VERSIONED:
+			record['version'] = version
 		return record
 
 	def delete(self, identifier):
@@ -75,13 +115,17 @@ class BaseDAO:
 		----------
 		identifier : int
 			Primary key id for record.
+
+		Returns
+		-------
+		bool
+			True if a record was deleted, False if no record has that id.
 		"""
-		conn = self.db_manager.get_connection()
-		cursor = conn.cursor()
-		sql = f"DELETE FROM {self.table_name} WHERE {self.id_name} = %s"
-		cursor.execute(sql, (identifier,))
-		conn.commit()
-		cursor.close()
+		sql = self._delete_sql()
+		with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			deleted = self._execute(cursor, sql, (identifier,))
+		self._invalidate([identifier])
+		return deleted > 0
 
 	def get(self, identifier):
 		"""
@@ -98,86 +142,836 @@ class BaseDAO:
 			A dictionary containing the record that was just retrieved from
 			the database.
 		"""
-		conn = self.db_manager.get_connection()
-		cursor = conn.cursor()
-		sql = f"SELECT * FROM {self.table_name} WHERE {self.id_name} = %s"
-		cursor.execute(sql, (identifier,))
-		row = cursor.fetchone()
-		cursor.close()
-		if row:
-			return self.row_to_dict(row, cursor.description)
+		token = None
+		if self._cache_enabled():
+			record = self.cache.get((self.table_name, identifier))
+			if record is not None:
+				return record
+			token = self.cache.token()
+		# Rows that will be cached are read from the primary, so a lagging
+		# replica's stale copy can't be cached for the whole TTL
+		sql = self._select_sql()
+		with self.db_manager.connection(read_only=token is None) as conn, conn.cursor() as cursor:
+			self._execute(cursor, sql, (identifier,))
+			row = cursor.fetchone()
+			if row:
+				record = self._record_type(cursor)._make(row)
+				self._cache_records([record], token)
+				return record
 		return None
 
-	def row_to_dict(self, row, column_descriptions):
+	def add_many(self, records, ignore_duplicates=False):
 		"""
-		Utility method to create dict from database row.
+		Inserts many records using multi-row INSERT statements, one
+		statement and commit per chunk of batch_size records.
 
 		Parameters
 		----------
-		row : list
-			A database row fetched from the cursor.
-		column_descriptions : list
-			Descriptions of the columns obtained from the cursor
+		records : list
+			A list of dictionaries containing the record data. Records in a
+			chunk must share the same columns.
+		ignore_duplicates : bool
+			Skip the records, rather than fail, that would duplicate a
+			unique key.
 
 		Returns
 		-------
-		dict
-			A dictionary containing the row data.
+		int
+			The number of records inserted.
+		"""
+		inserted = 0
+		for chunk in self._chunks(records):
+			columns = list(chunk[0].keys())
+			if any(set(record.keys()) != set(columns) for record in chunk):
+				raise ValueError("All records in a batch must have the same fields")
+			sql = self._insert_sql(tuple(columns), len(chunk), ignore_duplicates)
+			params = [record[column] for record in chunk for column in columns]
+			with self.db_manager.connection() as conn, conn.cursor() as cursor:
+				inserted += self._execute(cursor, sql, params)
+		return inserted
+
+	def update_many(self, updates):
+		"""
+		Updates many records, one transaction and commit per chunk of
+		batch_size records. Records with the same set of columns are sent
+		with a single executemany call.
+
+		Parameters
+		----------
+		updates : list
+			A list of (identifier, data) tuples.
+
+		Returns
+		-------
+		int
+			The number of rows matched.
+		"""
+		updated = 0
+		for chunk in self._chunks(updates):
+			grouped = {}
+			for identifier, data in chunk:
+				data = self._writable(data)
+				columns = tuple(data.keys())
+				grouped.setdefault(columns, []).append(list(data.values()) + [identifier])
+			with self.db_manager.transaction() as conn, conn.cursor() as cursor:
+				for columns, params in grouped.items():
+					sql = self._update_sql(columns)
+					updated += self._execute(cursor, sql, params, many=True)
+			self._invalidate([identifier for identifier, _ in chunk])
+		return updated
+
+	def get_version(self, identifier):
+		"""
+		Looks up a record's version, from the cache if it holds the
+		record, otherwise by reading the version column alone.
+
+		Parameters
+		----------
+		identifier : int
+			Primary key id for record.
+
+		Returns
+		-------
+		int
+			The record's version, or None if no record has that id.
+		"""
+		if self._cache_enabled():
+			record = self.cache.get((self.table_name, identifier))
+			if record is not None:
+				return record['version']
+		sql = self._statement(
+			('version',), lambda: f"SELECT version FROM {self.table_name} WHERE {self.id_name} = %s")
+		# From the primary, since a lagging replica's old version would
+		# tell a client its stale copy is current
+		with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			self._execute(cursor, sql, (identifier,))
+			row = cursor.fetchone()
+		return row[0] if row else None
+
+	def get_many(self, identifiers):
+		"""
+		Retrieves many records with WHERE id IN (...) queries, one query
+		per chunk of batch_size identifiers.
+
+		Parameters
+		----------
+		identifiers : list
+			Primary key ids for the records.
+
+		Returns
+		-------
+		list
+			A list of dictionaries containing the records that were found,
+			in the order their ids were given.
+		"""
+		unique_ids = list(dict.fromkeys(identifiers))
+		found = {}
+		missing = unique_ids
+		token = None
+		if self._cache_enabled():
+			missing = []
+			for identifier in unique_ids:
+				record = self.cache.get((self.table_name, identifier))
+				if record is None:
+					missing.append(identifier)
+				else:
+					found[identifier] = record
+			token = self.cache.token()
+		for chunk in self._chunks(missing):
+			sql = self._select_sql(len(chunk))
+			with self.db_manager.connection(read_only=token is None) as conn, conn.cursor() as cursor:
+				self._execute(cursor, sql, chunk)
+				records = list(map(self._record_type(cursor)._make, cursor.fetchall()))
+			for record in records:
+				found[record[self.id_name]] = record
+			self._cache_records(records, token)
+		return [found[identifier] for identifier in unique_ids if identifier in found]
+
+	def list(self, filters=None, sort=None, descending=False, after=None, limit=50):
+		"""
+		Retrieves a page of records with keyset pagination: the page
+		starts right after the (sort value, id) of the previous page's
+		last record instead of skipping rows with OFFSET, so every page
+		costs the same however deep it is.
+
+		Parameters
+		----------
+		filters : dict
+			Column to value equality filters, columns from LIST_FILTERS.
+		sort : str
+			The column to order by, the id or one of LIST_SORTS. Ties are
+			broken by id.
+		descending : bool
+			Order from the highest value down.
+		after : tuple
+			The (sort value, id) of the previous page's last record, or
+			None for the first page.
+		limit : int
+			The maximum number of records to return.
+
+		Returns
+		-------
+		list
+			The page of records.
+		"""
+		sql, params = self._list_query(filters, sort, descending, after, limit)
+		with self.db_manager.connection(read_only=True) as conn, conn.cursor() as cursor:
+			self._execute(cursor, sql, params)
+			return list(map(self._record_type(cursor)._make, cursor.fetchall()))
+
+	def _insert_sql(self, columns, row_count=1, ignore=False):
+		def build():
+			row_placeholder = f"({', '.join(['%s'] * len(columns))})"
+			values = ', '.join([row_placeholder] * row_count)
+			verb = "INSERT IGNORE" if ignore else "INSERT"
+			return f"{verb} INTO {self.table_name} ({', '.join(columns)}) VALUES {values}"
+		return self._statement(('insert', columns, row_count, ignore), build)
+
+	def _update_sql(self, columns, returning=False):
+		"""
+		Builds the UPDATE of one record by id. With returning, the new
+		version is made readable with the backend's returned_value.
+		"""
+		backend = self.db_manager.backend
+
+		def build():
+			set_clause = ', '.join([f"{key} = %s" for key in columns])
+			suffix = ""
+			if self.VERSIONED:
+				increment, suffix = backend.increment_returning("version") if returning else ("version = version + 1", "")
+				set_clause += f", {increment}"
+			return f"UPDATE {self.table_name} SET {set_clause} WHERE {self.id_name} = %s{suffix}"
+		return self._statement(('update', columns, returning and backend.name), build)
+
+	def _inserted(self, record_id, data):
+		record = {self.id_name: record_id, **data}
+		if self.VERSIONED:
+			# New rows start at the column's default
+			record['version'] = 1
+		return record
+
+	def _writable(self, data):
+		# The version is maintained by update, never written by callers
+		if self.VERSIONED and 'version' in data:
+			return {key: value for key, value in data.items() if key != 'version'}
+		return data
+
+	def _delete_sql(self):
+		return self._statement(('delete',), lambda: f"DELETE FROM {self.table_name} WHERE {self.id_name} = %s")
+
+	def _select_sql(self, id_count=None):
+		def build():
+			if id_count is None:
+				return f"SELECT * FROM {self.table_name} WHERE {self.id_name} = %s"
+			placeholders = ', '.join(['%s'] * id_count)
+			return f"SELECT * FROM {self.table_name} WHERE {self.id_name} IN ({placeholders})"
+		return self._statement(('select', id_count), build)
+
+	def _list_query(self, filters, sort, descending, after, limit):
+		filters = filters or {}
+		sort = sort or self.id_name
+		if sort != self.id_name and sort not in self.LIST_SORTS:
+			raise ValueError(f"Cannot sort {self.table_name} by {sort}")
+		params = []
+		for column, value in filters.items():
+			if column not in self.LIST_FILTERS:
+				raise ValueError(f"Cannot filter {self.table_name} by {column}")
+			params.append(self.LIST_FILTERS[column](value))
+		if after is not None:
+			sort_value, last_id = after
+			params += [last_id] if sort == self.id_name else [sort_value, sort_value, last_id]
+		params.append(limit)
+
+		def build():
+			direction, operator = ('DESC', '<') if descending else ('ASC', '>')
+			clauses = [f"{column} = %s" for column in filters]
+			order = f"{self.id_name} {direction}"
+			if sort != self.id_name:
+				order = f"{sort} {direction}, {order}"
+			if after is not None and sort == self.id_name:
+				clauses.append(f"{self.id_name} {operator} %s")
+			elif after is not None:
+				clauses.append(f"({sort} {operator} %s OR ({sort} = %s AND {self.id_name} {operator} %s))")
+			where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+			return f"SELECT * FROM {self.table_name} {where}ORDER BY {order} LIMIT %s"
+		key = ('list', tuple(filters), sort, descending, after is not None)
+		return self._statement(key, build), params
+
+	def _statement(self, key, build):
+		"""
+		Returns the SQL for a key, building and caching it on a miss.
+		Columns in the key must be a tuple, in the order they are bound.
+		"""
+		key = (self.table_name,) + key
+		sql = self.statement_cache.get(key)
+		if sql is None:
+			sql = build()
+			self.statement_cache.set(key, sql)
+		return sql
+
+	def _cache_enabled(self):
+		# Transactions bypass the cache so they always see their own writes
+		return self.cache is not None and not self.db_manager.in_transaction()
+
+	def _cache_records(self, records, token):
+		if self._cache_enabled():
+			for record in records:
+				self.cache.set((self.table_name, record[self.id_name]), record, token)
+
+	def _invalidate(self, identifiers):
 		"""
-		dictionary = {}
-		for column, value in zip(column_descriptions, row):
-			dictionary[column[0]] = value
-		return dictionary
+		Drops records from the cache now and again once the write is
+		committed, so a concurrent reader cannot cache the old row in
+		between.
+		"""
+		if self.cache is None:
+			return
+		keys = [(self.table_name, identifier) for identifier in identifiers]
+
+		def invalidate():
+			for key in keys:
+				self.cache.invalidate(key)
+
+		invalidate()
+		self.db_manager.after_commit(invalidate)
+
+	def _execute(self, cursor, sql, params=None, many=False):
+		return self.db_manager.execute(cursor, sql, params, many=many)
+
+	def _chunks(self, items):
+		items = list(items)
+		for start in range(0, len(items), self.batch_size):
+			yield items[start:start + self.batch_size]
+
+	def _record_type(self, cursor):
+		"""
+		Returns the record type for the cursor's result columns. Types are
+		created once per column set, so hydrating a row is a single call.
+		"""
+		return record_type(tuple(column[0] for column in cursor.description))
+
+
+def parse_flag(value):
+	"""
+	Parses a boolean filter value such as true, false, 1 or 0.
+	"""
+	if isinstance(value, bool):
+		return value
+	if str(value).lower() in ("true", "1"):
+		return True
+	if str(value).lower() in ("false", "0"):
+		return False
+	raise ValueError(f"Invalid flag {value}")
 
 
 class CustomerDAO(BaseDAO):
-	def __init__(self, db_manager):
-		super().__init__(db_manager, "Customer", "customer_id")
+	VERSIONED = True
+	LIST_FILTERS = {"email": str, "last_name": str}
+	LIST_SORTS = ("last_name",)
+
+	def __init__(self, db_manager, **kwargs):
+		super().__init__(db_manager, "Customer", "customer_id", **kwargs)
 
 
 class VehicleDAO(BaseDAO):
-	def __init__(self, db_manager):
-		super().__init__(db_manager, "Vehicle", "vehicle_id")
+	VERSIONED = True
+	FLEET_QUERY = "SELECT vehicle_id, type, available FROM Vehicle ORDER BY vehicle_id"
+	LOCK_QUERY = "SELECT vehicle_id, available FROM Vehicle WHERE vehicle_id = %s FOR UPDATE"
+
+	LIST_FILTERS = {"type": str, "make": str, "available": parse_flag}
+	LIST_SORTS = ("type",)
+
+	def __init__(self, db_manager, **kwargs):
+		super().__init__(db_manager, "Vehicle", "vehicle_id", **kwargs)
+
+	def find_available_vehicles(self, vehicle_type, start_date, end_date):
+		"""
+		Finds every vehicle in service that has no booking overlapping
+		the date range, with a single anti-join against Booking.
+
+		Parameters
+		----------
+		vehicle_type : str
+			The vehicle type to search, or None for every type.
+		start_date : datetime.date
+			The first day of hire.
+		end_date : datetime.date
+			The return date.
+
+		Returns
+		-------
+		list
+			A list of dictionaries containing the free vehicles.
+		"""
+		sql, params = self._available_vehicles_query(vehicle_type, start_date, end_date)
+		with self.db_manager.connection(read_only=True) as conn, conn.cursor() as cursor:
+			self._execute(cursor, sql, params)
+			return list(map(self._record_type(cursor)._make, cursor.fetchall()))
+
+	def lock_vehicle(self, vehicle_id):
+		"""
+		Locks a vehicle's row until the current transaction ends, so
+		concurrent bookings of the same vehicle are serialized while
+		bookings of other vehicles carry on. Must be called inside a
+		transaction, before the transaction reads the vehicle's bookings.
+
+		Parameters
+		----------
+		vehicle_id : int
+			The vehicle's id.
+
+		Returns
+		-------
+		dict
+			The vehicle_id and available flag of the vehicle, or None if it
+			does not exist.
+		"""
+		with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			self._execute(cursor, self.LOCK_QUERY, (vehicle_id,))
+			row = cursor.fetchone()
+			return self._record_type(cursor)._make(row) if row else None
+
+	def get_fleet(self):
+		"""
+		Retrieves the id, type and in-service flag of every vehicle.
+
+		Returns
+		-------
+		list
+			A list of dictionaries containing the vehicle_id, type and
+			available fields.
+		"""
+		with self.db_manager.connection(read_only=True) as conn, conn.cursor() as cursor:
+			self._execute(cursor, self.FLEET_QUERY)
+			return list(map(self._record_type(cursor)._make, cursor.fetchall()))
+
+	def _available_vehicles_query(self, vehicle_type, start_date, end_date):
+		type_clause = "AND v.type = %s" if vehicle_type is not None else ""
+		sql = f"""
+		    SELECT v.*
+		    FROM Vehicle v
+		    WHERE v.available = TRUE
+		    {type_clause}
+		    AND NOT EXISTS (
+		        SELECT 1
+		        FROM Booking b
+		        WHERE b.vehicle_id = v.vehicle_id
+		        AND b.return_date > %s
+		        AND b.date_hired < %s
+		    )
+		    ORDER BY v.vehicle_id
+		"""
+		params = ([vehicle_type] if vehicle_type is not None else []) + [start_date, end_date]
+		return sql, params
 
 
 class BookingDAO(BaseDAO):
-	def __init__(self, db_manager):
-		super().__init__(db_manager, "Booking", "booking_id")
+	VERSIONED = True
+	LIST_FILTERS = {
+		"customer_id": int,
+		"vehicle_id": int,
+		"payment_status": str,
+		"date_hired": date.fromisoformat
+	}
+	LIST_SORTS = ("date_hired",)
+
+	REPORT_COLUMNS = (
+		"booking_id", "date_hired", "return_date", "payment_status",
+		"customer_id", "first_name", "last_name", "email", "phone",
+		"vehicle_id", "type", "make", "model", "registration_number"
+	)
+
+	AVAILABILITY_QUERY = """
+	    SELECT COUNT(*)
+	    FROM Booking
+	    WHERE vehicle_id = %s
+	    AND return_date > %s
+	    AND date_hired < %s
+	"""
+
+	REPORT_QUERY = """
+	    SELECT b.booking_id, b.date_hired, b.return_date, b.payment_status,
+	        c.customer_id, c.first_name, c.last_name, c.email, c.phone,
+	        v.vehicle_id, v.type, v.make, v.model, v.registration_number
+	    FROM Booking b
+	    JOIN Customer c ON c.customer_id = b.customer_id
+	    JOIN Vehicle v ON v.vehicle_id = b.vehicle_id
+	"""
+
+	def __init__(self, db_manager, **kwargs):
+		super().__init__(db_manager, "Booking", "booking_id", **kwargs)
+
+	def is_vehicle_available(self, vehicle_id, start_date, end_date, exclude_booking_id=None):
+		sql, params = self.AVAILABILITY_QUERY, [vehicle_id, start_date, end_date]
+		if exclude_booking_id is not None:
+			sql += "AND booking_id <> %s"
+			params.append(exclude_booking_id)
+		with self.db_manager.connection(read_only=True) as conn, conn.cursor() as cursor:
+			self._execute(cursor, sql, params)
+			count = cursor.fetchone()[0]
+
+		return count == 0
+
+	def get_bookings_between(self, start_date, end_date):
+		"""
+		Retrieves the dates of every booking that overlaps the date range.
 
-	def is_vehicle_available(self, vehicle_id, start_date, end_date):
-		conn = self.db_manager.get_connection()
-		cursor = conn.cursor()
+		Parameters
+		----------
+		start_date : datetime.date
+			The first day of the range.
+		end_date : datetime.date
+			The day after the last day of the range.
 
+		Returns
+		-------
+		list
+			A list of dictionaries containing the booking_id, vehicle_id,
+			date_hired and return_date fields.
+		"""
 		sql = """
-		    SELECT COUNT(*)
+		    SELECT booking_id, vehicle_id, date_hired, return_date
 		    FROM Booking
-		    WHERE vehicle_id = %s
-		    AND return_date > %s
+		    WHERE return_date > %s
 		    AND date_hired < %s
 		"""
-		cursor.execute(sql, (vehicle_id, start_date, end_date))
-		count = cursor.fetchone()[0]
+		with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			self._execute(cursor, sql, (start_date, end_date))
+			return list(map(self._record_type(cursor)._make, cursor.fetchall()))
 
-		cursor.close()
-		conn.close()
+	def get_booking_day_offsets(self, start_date, end_date):
+		"""
+		Retrieves the vehicle and dates of every booking that overlaps the
+		date range, with the dates as day offsets from start_date so they
+		can be loaded straight into an integer array.
 
-		return count == 0
+		Parameters
+		----------
+		start_date : datetime.date
+			The first day of the range, day 0.
+		end_date : datetime.date
+			The day after the last day of the range.
+
+		Returns
+		-------
+		list
+			A list of (vehicle_id, date_hired offset, return_date offset)
+			tuples. Offsets may fall outside the range.
+		"""
+		sql = """
+		    SELECT vehicle_id, DATEDIFF(date_hired, %s), DATEDIFF(return_date, %s)
+		    FROM Booking
+		    WHERE return_date > %s
+		    AND date_hired < %s
+		"""
+		with self.db_manager.connection(read_only=True) as conn, conn.cursor() as cursor:
+			self._execute(cursor, sql, (start_date, start_date, start_date, end_date))
+			return cursor.fetchall()
+
+	def get_billable_bookings(self, booking_ids=None, start_date=None, end_date=None):
+		"""
+		Retrieves the bookings that have no invoice yet, with their
+		vehicle's type for pricing, either by id (one query per chunk of
+		batch_size ids) or hired within a date range (one query).
+
+		Parameters
+		----------
+		booking_ids : list
+			The bookings' ids, or None to select by date.
+		start_date : datetime.date
+			The first day of hire of the range.
+		end_date : datetime.date
+			The day after the last day of hire of the range.
+
+		Returns
+		-------
+		list
+			Records with the booking_id, date_hired, return_date and type
+			of each booking.
+		"""
+		sql = """
+		    SELECT b.booking_id, b.date_hired, b.return_date, v.type
+		    FROM Booking b
+		    JOIN Vehicle v ON v.vehicle_id = b.vehicle_id
+		    LEFT JOIN Invoice i ON i.booking_id = b.booking_id
+		    WHERE i.invoice_id IS NULL
+		"""
+		if booking_ids is None:
+			chunks = [(sql + "AND b.date_hired >= %s AND b.date_hired < %s", (start_date, end_date))]
+		else:
+			chunks = [
+				(sql + f"AND b.booking_id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+				for chunk in self._chunks(dict.fromkeys(booking_ids))
+			]
+		bookings = []
+		with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			for chunk_sql, params in chunks:
+				self._execute(cursor, chunk_sql, params)
+				bookings += map(self._record_type(cursor)._make, cursor.fetchall())
+		return bookings
+
+	def iter_daily_bookings(self, report_date):
+		"""
+		Streams the bookings that start on a day, joined with their
+		customer and vehicle details, through an unbuffered server-side
+		cursor so rows are yielded as they arrive instead of being read
+		into memory first. The pooled connection is held until the
+		generator is exhausted or closed.
 
-	def get_daily_bookings(self):
-		conn = self.db_manager.get_connection()
-		cursor = conn.cursor()
-		sql = f"WHERE DATE(date_hired) = CURDATE();"
-		cursor.execute(sql)
-		rows = cursor.fetchone()
-		cursor.close()
-		if rows:
-			bookings = []
-			for row in rows:
-				bookings.append(self.row_to_dict(row, cursor.description))
-			return bookings
+		Parameters
+		----------
+		report_date : datetime.date
+			The day of hire to report on.
+
+		Yields
+		------
+		dict
+			A dictionary with the REPORT_COLUMNS of one booking.
+		"""
+		sql = self.REPORT_QUERY + """
+		    WHERE b.date_hired = %s
+		    ORDER BY b.booking_id
+		"""
+		make = record_type(self.REPORT_COLUMNS)._make
+		with self.db_manager.connection(read_only=True) as conn, self.db_manager.unbuffered_cursor(conn) as cursor:
+			self._execute(cursor, sql, (report_date,))
+			for row in cursor:
+				yield make(row)
+
+	def get_report_row(self, booking_id):
+		"""
+		Retrieves one booking joined with its customer and vehicle
+		details, as it appears in the daily report.
+
+		Parameters
+		----------
+		booking_id : int
+			The booking's id.
+
+		Returns
+		-------
+		dict
+			A dictionary with the REPORT_COLUMNS of the booking, or None if
+			it does not exist.
+		"""
+		sql = self.REPORT_QUERY + "WHERE b.booking_id = %s"
+		with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			self._execute(cursor, sql, (booking_id,))
+			row = cursor.fetchone()
+		if row:
+			return record_type(self.REPORT_COLUMNS)._make(row)
 		return None
 
+	def get_daily_bookings(self, report_date):
+		"""
+		Retrieves the bookings that start on a day with their customer
+		and vehicle details.
+
+		Parameters
+		----------
+		report_date : datetime.date
+			The day of hire to report on.
+
+		Returns
+		-------
+		list
+			A list of dictionaries with the REPORT_COLUMNS of each booking.
+		"""
+		return list(self.iter_daily_bookings(report_date))
+
 
 class InvoiceDAO(BaseDAO):
-	def __init__(self, db_manager):
-		super().__init__(db_manager, "Invoice", "invoice_id")
+	VERSIONED = True
+	LIST_FILTERS = {"booking_id": int}
+
+	def __init__(self, db_manager, **kwargs):
+		super().__init__(db_manager, "Invoice", "invoice_id", **kwargs)
+
+	def get_revenue_by_vehicle(self, start_date, end_date):
+		"""
+		Sums the invoiced amounts of the bookings hired in the date range
+		per vehicle.
+
+		Parameters
+		----------
+		start_date : datetime.date
+			The first day of the range.
+		end_date : datetime.date
+			The day after the last day of the range.
+
+		Returns
+		-------
+		dict
+			The revenue keyed by vehicle_id, vehicles without invoices are
+			left out.
+		"""
+		sql = """
+		    SELECT b.vehicle_id, SUM(i.total_amount)
+		    FROM Invoice i
+		    JOIN Booking b ON b.booking_id = i.booking_id
+		    WHERE b.date_hired >= %s
+		    AND b.date_hired < %s
+		    GROUP BY b.vehicle_id
+		"""
+		with self.db_manager.connection(read_only=True) as conn, conn.cursor() as cursor:
+			self._execute(cursor, sql, (start_date, end_date))
+			return {vehicle_id: float(revenue) for vehicle_id, revenue in cursor.fetchall()}
+
+
+class RateDAO(BaseDAO):
+	def __init__(self, db_manager, **kwargs):
+		super().__init__(db_manager, "Rate", "vehicle_type", **kwargs)
+
+	def get_rates(self):
+		"""
+		Retrieves the whole rate table.
+
+		Returns
+		-------
+		dict
+			The daily rate keyed by vehicle type.
+		"""
+		with self.db_manager.connection() as conn, conn.cursor() as cursor:
+			self._execute(cursor, "SELECT vehicle_type, daily_rate FROM Rate")
+			return dict(cursor.fetchall())
+
+	def set_rate(self, vehicle_type, daily_rate):
+		"""
+		Sets the daily rate of a vehicle type, adding the type if it has
+		no rate yet.
+
+		Parameters
+		----------
+		vehicle_type : str
+			The vehicle type.
+		daily_rate : float
+			The daily rate.
+		"""
+		with self.db_manager.transaction():
+			if self.update(vehicle_type, {"daily_rate": daily_rate}) is None:
+				self.add({"vehicle_type": vehicle_type, "daily_rate": daily_rate})
+
+
+class NotificationDAO(BaseDAO):
+	"""
+	The outbox of customer notifications. Rows are written PENDING with
+	the change that caused them and claimed by the dispatcher workers.
+	"""
+
+	PENDING = "PENDING"
+	SENT = "SENT"
+	FAILED = "FAILED"
+
+	# SKIP LOCKED (MySQL 8) lets concurrent workers claim different rows
+	# instead of queueing behind each other
+	CLAIM_QUERY = """
+	    SELECT n.notification_id, n.kind, n.attempts,
+	        b.booking_id, b.date_hired, b.return_date,
+	        c.first_name, c.last_name, c.email,
+	        v.make, v.model, v.registration_number
+	    FROM Notification n
+	    JOIN Booking b ON b.booking_id = n.booking_id
+	    JOIN Customer c ON c.customer_id = b.customer_id
+	    JOIN Vehicle v ON v.vehicle_id = b.vehicle_id
+	    WHERE n.status = %s
+	    AND n.next_attempt_at <= %s
+	    ORDER BY n.next_attempt_at
+	    LIMIT %s
+	    FOR UPDATE OF n SKIP LOCKED
+	"""
+
+	def __init__(self, db_manager, **kwargs):
+		super().__init__(db_manager, "Notification", "notification_id", **kwargs)
+
+	def enqueue(self, booking_id, kind):
+		"""
+		Adds a pending notification, in the caller's transaction if one
+		is open.
+
+		Parameters
+		----------
+		booking_id : int
+			The booking the notification is about.
+		kind : str
+			The kind of notification, e.g. booking_confirmation.
+
+		Returns
+		-------
+		dict
+			The notification that was added.
+		"""
+		return self.add({
+			"booking_id": booking_id,
+			"kind": kind,
+			"status": self.PENDING,
+			"attempts": 0,
+			"next_attempt_at": datetime.now()
+		})
+
+	def claim_due(self, limit, lease_seconds):
+		"""
+		Claims up to limit pending notifications that are due, with the
+		booking, customer and vehicle details needed to send them. Claimed
+		rows are pushed lease_seconds into the future so no other worker
+		picks them up while they are being sent; if the worker dies they
+		become due again when the lease runs out.
+
+		Parameters
+		----------
+		limit : int
+			The maximum number of notifications to claim.
+		lease_seconds : float
+			How long the claim lasts.
+
+		Returns
+		-------
+		list
+			The claimed notifications.
+		"""
+		now = datetime.now()
+		with self.db_manager.transaction() as conn, conn.cursor() as cursor:
+			self._execute(cursor, self.CLAIM_QUERY, (self.PENDING, now, limit))
+			notifications = list(map(self._record_type(cursor)._make, cursor.fetchall()))
+			if notifications:
+				ids = [notification['notification_id'] for notification in notifications]
+				sql = f"""
+				    UPDATE Notification SET next_attempt_at = %s
+				    WHERE notification_id IN ({', '.join(['%s'] * len(ids))})
+				"""
+				self._execute(cursor, sql, [now + timedelta(seconds=lease_seconds)] + ids)
+		return notifications
+
+	def mark_sent(self, notification_ids):
+		"""
+		Marks notifications as sent.
+
+		Parameters
+		----------
+		notification_ids : list
+			The sent notifications' ids.
+		"""
+		sent_at = datetime.now()
+		self.update_many([
+			(notification_id, {"status": self.SENT, "sent_at": sent_at, "last_error": None})
+			for notification_id in notification_ids
+		])
+
+	def mark_failed(self, failures):
+		"""
+		Records failed attempts, scheduling the next one or giving up.
+
+		Parameters
+		----------
+		failures : list
+			(notification_id, attempts so far, next_attempt_at or None to
+			give up, error message) tuples.
+		"""
+		self.update_many([
+			(notification_id, {
+				"status": self.PENDING if next_attempt_at is not None else self.FAILED,
+				"attempts": attempts,
+				"next_attempt_at": next_attempt_at,
+				"last_error": error[:255]
+			})
+			for notification_id, attempts, next_attempt_at, error in failures
+		])
@@ -1,37 +1,135 @@
+from collections.abc import Mapping
+from operator import attrgetter
 
-class Customer:
-    def __init__(self, customer_id, first_name, last_name, email, phone):
+
+class Record(Mapping):
+    """
+    Base class for the rows the DAOs return. A record keeps its values in
+    __slots__ instead of a per-instance dict and reads like an immutable
+    dict keyed by column name, so record['email'], record.get('email'),
+    dict(record) and {**record} all work as they did on plain dicts.
+
+    Subclasses list their columns in _fields, in the order the database
+    returns them, and get a _make(row) constructor generated once.
+    """
+
+    __slots__ = ()
+    _fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = cls._fields
+        cls._field_set = frozenset(fields)
+        getter = attrgetter(*fields) if fields else (lambda record: ())
+        cls._values = staticmethod(getter if len(fields) != 1 else (lambda record: (getter(record),)))
+        # Unpacking a row into slots in one statement is much faster than
+        # setting the attributes one by one in a loop
+        targets = ''.join(f'record.{field}, ' for field in fields)
+        source = f"def _make(row):\n    record = new(cls)\n    {targets}= row\n    return record\n"
+        if not fields:
+            source = "def _make(row):\n    return new(cls)\n"
+        namespace = {'new': object.__new__, 'cls': cls}
+        exec(source, namespace)
+        cls._make = staticmethod(namespace['_make'])
+
+    def _asdict(self):
+        return dict(zip(self._fields, self._values(self)))
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        values = ', '.join(f'{field}={value!r}' for field, value in zip(self._fields, self._values(self)))
+        return f'{type(self).__name__}({values})'
+
+
+class Customer(Record):
+    __slots__ = _fields = ('customer_id', 'first_name', 'last_name', 'email', 'phone', 'version')
+
+    def __init__(self, customer_id, first_name, last_name, email, phone, version=1):
         self.customer_id = customer_id
         self.first_name = first_name
         self.last_name = last_name
         self.email = email
         self.phone = phone
+        self.version = version
+
 
+class Vehicle(Record):
+    __slots__ = _fields = ('vehicle_id', 'type', 'model', 'make', 'year', 'registration_number', 'available', 'version')
 
-class Vehicle:
-    def __init__(self, vehicle_id, vehicle_type, model, make, year, registration_number, available):
+    def __init__(self, vehicle_id, vehicle_type, model, make, year, registration_number, available, version=1):
         self.vehicle_id = vehicle_id
-        self.vehicle_type = vehicle_type
+        self.type = vehicle_type
         self.model = model
         self.make = make
         self.year = year
         self.registration_number = registration_number
         self.available = available
+        self.version = version
+
+    @property
+    def vehicle_type(self):
+        return self.type
 
 
-class Booking:
-    def __init__(self, booking_id, customer_id, vehicle_id, date_hired, return_date, payment_status):
+class Booking(Record):
+    __slots__ = _fields = (
+        'booking_id', 'customer_id', 'vehicle_id', 'date_hired', 'return_date', 'payment_status', 'version'
+    )
+
+    def __init__(self, booking_id, customer_id, vehicle_id, date_hired, return_date, payment_status, version=1):
         self.booking_id = booking_id
         self.customer_id = customer_id
         self.vehicle_id = vehicle_id
         self.date_hired = date_hired
         self.return_date = return_date
         self.payment_status = payment_status
+        self.version = version
+
 
+class Invoice(Record):
+    __slots__ = _fields = ('invoice_id', 'booking_id', 'total_amount', 'payment_date', 'version')
 
-class Invoice:
-    def __init__(self, invoice_id, booking_id, total_amount, payment_date):
+    def __init__(self, invoice_id, booking_id, total_amount, payment_date, version=1):
         self.invoice_id = invoice_id
         self.booking_id = booking_id
         self.total_amount = total_amount
-        self.payment_date = payment_date
\ No newline at end of file
+        self.payment_date = payment_date
+        self.version = version
+
+
+_record_types = {model._fields: model for model in (Customer, Vehicle, Booking, Invoice)}
+
+
+def record_type(columns):
+    """
+    Returns the record type for a result set's columns, created once per
+    distinct column tuple. Full rows of a table map to its model class,
+    other column sets (joins, projections) to a generated Row type.
+
+    Parameters
+    ----------
+    columns : tuple
+        The column names, in the order of the row values.
+
+    Returns
+    -------
+    type
+        A Record subclass whose _make builds a record from a row.
+    """
+    model = _record_types.get(columns)
+    if model is None:
+        if len(set(columns)) != len(columns):
+            raise ValueError(f"Duplicate column names in {columns}")
+        model = type('Row', (Record,), {'__slots__': columns, '_fields': columns})
+        _record_types[columns] = model
+    return model
@@ -0,0 +1,103 @@
+"""
+The HTTP responses app.py and async_app.py share, so the sync and async
+modes answer the same endpoints the same way. They only use the parts of
+the app, request and response API that Flask and Quart have in common;
+the views fetch the records, awaiting the services in async mode.
+"""
+from werkzeug.exceptions import NotFound
+
+
+def record_etag(name, record_id, version):
+	"""
+	Builds the strong ETag of one version of a record, shared by the
+	reads that serve it and the writes that change it.
+
+	Returns
+	-------
+	str
+	    The ETag, without quotes.
+	"""
+	return f"{name}-{record_id}-{version}"
+
+
+def not_modified(app, request, name, record_id, version):
+	"""
+	Answers a conditional GET from the record's version alone, without
+	loading or serializing the record.
+
+	Parameters
+	----------
+	app : flask.Flask or quart.Quart
+	    The current app.
+	request : flask.Request or quart.Request
+	    The request, with an If-None-Match header.
+	name : str
+	    The entity's name.
+	record_id : int
+	    The record's id.
+	version : int
+	    The record's current version, None if there is no such record.
+	Returns
+	-------
+	flask.Response or quart.Response
+	    an empty 304 if the client's copy is current, otherwise None.
+	Raises
+	------
+	werkzeug.exceptions.NotFound
+	    If there is no such record.
+	"""
+	if version is None:
+		raise NotFound()
+	etag = record_etag(name, record_id, version)
+	if not request.if_none_match.contains_weak(etag):
+		return None
+	response = app.response_class(status=304)
+	response.set_etag(etag)
+	response.headers['Cache-Control'] = app.config['CACHE_CONTROL'][name]
+	return response
+
+
+def record_response(app, name, record, key=None):
+	"""
+	Serves one record with the ETag of its version. Reads leave key
+	unset and also get the entity's Cache-Control header.
+
+	Parameters
+	----------
+	app : flask.Flask or quart.Quart
+	    The current app.
+	name : str
+	    The entity's name, its id is the record's <name>_id field.
+	record : dict
+	    The record, with its version.
+	key : str
+	    The JSON key for the record written, None for a read.
+	Returns
+	-------
+	flask.Response or quart.Response
+	    a JSON of the record.
+	"""
+	response = app.json.response({key or name: record})
+	response.set_etag(record_etag(name, record[f'{name}_id'], record['version']))
+	if key is None:
+		response.headers['Cache-Control'] = app.config['CACHE_CONTROL'][name]
+	return response
+
+
+def error_response(error, description):
+	"""
+	Describes an HTTP error to the client.
+
+	Parameters
+	----------
+	error : werkzeug.exceptions.HTTPException
+	    The error.
+	description : str
+	    What could not be done.
+	Returns
+	-------
+	tuple
+	    a JSON body with the error's name and description, and its status.
+	"""
+	error.description = description
+	return {"error": {error.name: error.description}}, error.code
@@ -0,0 +1,80 @@
+from services.base_service import BaseService
+from services.customer_service import CustomerService
+from services.vehicle_service import VehicleService
+
+
+class AsyncBaseService(BaseService):
+	"""
+	The asyncio counterpart of BaseService, used with the async DAOs. Its
+	methods only await the DAO calls; the validation before them and the
+	checks after them are BaseService's helpers, so both modes accept and
+	reject the same input.
+
+	Entity services are made async by listing the synchronous service
+	before this class, e.g. class AsyncCustomerService(CustomerService,
+	AsyncBaseService). The entity service's super() calls then resolve
+	here and return coroutines. Entity methods that do more than call
+	super(), such as the writes that notify listeners, need async
+	overrides. Listeners are not supported in async mode: add_listener
+	raises rather than leave them silently uncalled.
+	"""
+
+	def add_listener(self, listener):
+		raise NotImplementedError("Listeners are not supported in async mode")
+
+	async def create_record(self, data):
+		return await self.dao.add(self._validated(data))
+
+	async def update_record(self, record_id, data):
+		return self._found(await self.dao.update(record_id, self._validated(data)))
+
+	async def delete_record(self, record_id):
+		self._found(await self.dao.delete(record_id))
+
+	async def get_record(self, record_id):
+		return self._found(await self.dao.get(record_id))
+
+	async def get_record_version(self, record_id):
+		return await self.dao.get_version(record_id)
+
+	async def create_records(self, records):
+		return await self.dao.add_many(self._validated_records(records))
+
+	async def update_records(self, records):
+		return await self.dao.update_many(self._updates(records))
+
+	async def get_records(self, record_ids):
+		return await self.dao.get_many(record_ids)
+
+	async def list_records(self, filters=None, sort=None, order='asc', cursor=None, limit=50):
+		sort, descending, after = self._page_request(sort, order, cursor, limit)
+		records = await self.dao.list(filters, sort, descending, after, limit + 1)
+		return self._page(records, sort, descending, limit)
+
+
+class AsyncCustomerService(CustomerService, AsyncBaseService):
+	"""
+	CustomerService running on AsyncCustomerDAO, its methods return
+	coroutines.
+	"""
+
+
+class AsyncVehicleService(VehicleService, AsyncBaseService):
+	"""
+	VehicleService running on AsyncVehicleDAO, its methods return
+	coroutines. The writes are overridden because the synchronous ones
+	notify listeners with the result, and the availability index and
+	listeners are not supported in async mode.
+	"""
+
+	def __init__(self, vehicle_dao):
+		super().__init__(vehicle_dao)
+
+	async def add_vehicle(self, vehicle_data):
+		return await AsyncBaseService.create_record(self, vehicle_data)
+
+	async def update_vehicle(self, vehicle_id, vehicle_data):
+		return await AsyncBaseService.update_record(self, vehicle_id, vehicle_data)
+
+	async def delete_vehicle(self, vehicle_id):
+		await AsyncBaseService.delete_record(self, vehicle_id)
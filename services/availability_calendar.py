@@ -0,0 +1,125 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from services.utilization_service import occupancy_matrix
+
+# Each vehicle's days are packed into one int64, so a calendar spans at
+# most 63 days
+MAX_DAYS = 63
+
+
+class AvailabilityCalendar:
+	"""
+	A service for the fleet's availability grid, which vehicles are booked
+	on which of the coming days. The bookings overlapping the window are
+	loaded in one query and each vehicle's days are packed into an integer
+	bitmask, bit i set when the vehicle is on hire on day i, so finding the
+	vehicles free for a range of days is one vectorized AND over the fleet.
+	"""
+
+	def __init__(self, booking_dao, vehicle_dao, days=14):
+		"""
+		Parameters
+		----------
+		booking_dao : BookingDAO
+			The bookings.
+		vehicle_dao : VehicleDAO
+			The fleet.
+		days : int
+			The number of days the calendar shows.
+		"""
+		if not 1 <= days <= MAX_DAYS:
+			raise ValueError(f"The calendar must span 1 to {MAX_DAYS} days")
+		self.booking_dao = booking_dao
+		self.vehicle_dao = vehicle_dao
+		self.days = days
+
+	def calendar(self, vehicle_type=None, start_date=None, free_start=None, free_end=None):
+		"""
+		Builds the calendar of the vehicles in service, optionally of one
+		type, and finds the ones free for a range of its days.
+
+		Parameters
+		----------
+		vehicle_type : str
+			The vehicle type, or None for every type.
+		start_date : datetime.date
+			The calendar's first day, defaults to today.
+		free_start : datetime.date
+			The first day of hire to find free vehicles for, or None.
+		free_end : datetime.date
+			The return date to find free vehicles for, or None. The range
+			must lie inside the calendar.
+
+		Returns
+		-------
+		dict
+			The calendar's start and days, the vehicle_ids in ascending
+			order and, for each of them, its booked day mask (bit i set if
+			the vehicle is on hire on start + i days). With a range, also
+			the ids of the vehicles free for all of it.
+		"""
+		start_date = start_date or date.today()
+		fleet = self.vehicle_dao.get_fleet()
+		vehicle_ids = np.array(sorted(
+			vehicle['vehicle_id'] for vehicle in fleet
+			if vehicle['available'] and (vehicle_type is None or vehicle['type'] == vehicle_type)
+		), dtype=np.int64)
+		offsets = self.booking_dao.get_booking_day_offsets(start_date, start_date + timedelta(days=self.days))
+		booked = day_masks(occupancy_matrix(vehicle_ids, offsets, self.days))
+
+		calendar = {
+			"start": start_date,
+			"days": self.days,
+			"vehicle_ids": vehicle_ids.tolist(),
+			"booked": booked.tolist()
+		}
+		if free_start is not None or free_end is not None:
+			if free_start is None or free_end is None:
+				raise ValueError("Both the first day of hire and the return date are needed")
+			first, last = (free_start - start_date).days, (free_end - start_date).days
+			if not 0 <= first < last <= self.days:
+				raise ValueError("The date range must lie inside the calendar")
+			calendar["free"] = vehicle_ids[free_for(booked, first, last)].tolist()
+		return calendar
+
+
+def day_masks(booked):
+	"""
+	Packs a boolean vehicles x days matrix into one bitmask per vehicle.
+
+	Parameters
+	----------
+	booked : numpy.ndarray
+		The occupancy matrix, at most MAX_DAYS columns.
+
+	Returns
+	-------
+	numpy.ndarray
+		An int64 per row with bit i set where column i is True.
+	"""
+	weights = np.left_shift(np.int64(1), np.arange(booked.shape[1], dtype=np.int64))
+	return booked.astype(np.int64) @ weights
+
+
+def free_for(masks, first, last):
+	"""
+	Finds the vehicles with no booked day in a range.
+
+	Parameters
+	----------
+	masks : numpy.ndarray
+		The vehicles' booked day masks.
+	first : int
+		The first day of the range.
+	last : int
+		The day after the last day of the range.
+
+	Returns
+	-------
+	numpy.ndarray
+		A boolean per vehicle, True where it is free for every day.
+	"""
+	days = ((1 << (last - first)) - 1) << first
+	return (masks & np.int64(days)) == 0
@@ -0,0 +1,296 @@
+import logging
+import threading
+from bisect import bisect_left, insort
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class VehicleIntervals:
+	"""
+	The bookings of one vehicle as half-open [date_hired, return_date)
+	intervals sorted by start, with a running maximum of the end dates
+	so an overlap check is a single bisect.
+	"""
+
+	def __init__(self):
+		self.intervals = []
+		self.starts = []
+		self.max_ends = []
+
+	def add(self, start, end, booking_id):
+		insort(self.intervals, (start, end, booking_id))
+		self._rebuild()
+
+	def remove(self, start, end, booking_id):
+		self.intervals.remove((start, end, booking_id))
+		self._rebuild()
+
+	def overlaps(self, start, end):
+		"""
+		Parameters
+		----------
+		start : datetime.date
+			The first day of the range.
+		end : datetime.date
+			The day after the last day of the range.
+
+		Returns
+		-------
+		bool
+			True if any interval overlaps [start, end).
+		"""
+		# Intervals starting before the range ends are the only candidates,
+		# and one of them overlaps if the latest end among them is after start
+		candidates = bisect_left(self.starts, end)
+		return candidates > 0 and self.max_ends[candidates - 1] > start
+
+	def _rebuild(self):
+		self.starts = [interval[0] for interval in self.intervals]
+		self.max_ends = []
+		latest = None
+		for _, end, _ in self.intervals:
+			latest = end if latest is None or end > latest else latest
+			self.max_ends.append(latest)
+
+
+class AvailabilityIndex:
+	"""
+	An optional in-process index of the bookings that overlap the
+	booking window (today until today + window_days, the furthest a
+	7 day booking made 7 days in advance can reach). Availability
+	queries inside the window are answered from memory, anything
+	outside it falls back to the database.
+
+	The index is loaded on first use, reloaded when the day rolls over
+	and kept current by listening to the booking and vehicle services.
+	It only sees writes made through this process, so it can only answer
+	alone when one process serves the app. Under the pre-fork server
+	every worker would hold its own copy, which misses the bookings made
+	by the other workers, so create_app(background=False) doesn't build
+	one. In verify mode every answer is compared against the database,
+	mismatches are logged and the database answer wins; it checks the
+	index rather than saving any queries.
+	"""
+
+	def __init__(self, booking_dao, vehicle_dao, window_days=14, verify=False):
+		self.booking_dao = booking_dao
+		self.vehicle_dao = vehicle_dao
+		self.window_days = window_days
+		self.verify = verify
+		self.window_start = None
+		self.window_end = None
+		self._vehicles = {}
+		self._bookings = {}
+		self._fleet = {}
+		self._lock = threading.RLock()
+
+	def load(self):
+		"""
+		Loads the fleet and every booking overlapping the window from
+		the database, replacing the current contents.
+		"""
+		window_start = date.today()
+		window_end = window_start + timedelta(days=self.window_days)
+		fleet = {vehicle['vehicle_id']: vehicle for vehicle in self.vehicle_dao.get_fleet()}
+		bookings = self.booking_dao.get_bookings_between(window_start, window_end)
+		vehicles, booking_map = self._build(bookings)
+		with self._lock:
+			self.window_start = window_start
+			self.window_end = window_end
+			self._fleet = fleet
+			self._vehicles = vehicles
+			self._bookings = booking_map
+
+	def covers(self, start_date, end_date):
+		"""
+		Returns
+		-------
+		bool
+			True if the date range lies inside the indexed window.
+		"""
+		self._ensure_current()
+		return self.window_start <= start_date and end_date <= self.window_end
+
+	def is_vehicle_available(self, vehicle_id, start_date, end_date):
+		"""
+		Checks a single vehicle for bookings overlapping the date range.
+
+		Parameters
+		----------
+		vehicle_id : int
+			The vehicle's id.
+		start_date : datetime.date
+			The first day of hire.
+		end_date : datetime.date
+			The return date.
+
+		Returns
+		-------
+		bool
+			True if the vehicle has no overlapping booking.
+		"""
+		if not self.covers(start_date, end_date):
+			return self.booking_dao.is_vehicle_available(vehicle_id, start_date, end_date)
+		with self._lock:
+			intervals = self._vehicles.get(vehicle_id)
+			available = intervals is None or not intervals.overlaps(start_date, end_date)
+		if self.verify:
+			expected = self.booking_dao.is_vehicle_available(vehicle_id, start_date, end_date)
+			if expected != available:
+				logger.warning(
+					"Availability index mismatch for vehicle %s between %s and %s: index %s, database %s",
+					vehicle_id, start_date, end_date, available, expected
+				)
+			return expected
+		return available
+
+	def available_vehicle_ids(self, vehicle_type, start_date, end_date):
+		"""
+		Finds every vehicle in service of a type that is free for the
+		whole date range.
+
+		Parameters
+		----------
+		vehicle_type : str
+			The vehicle type, or None for every type.
+		start_date : datetime.date
+			The first day of hire.
+		end_date : datetime.date
+			The return date.
+
+		Returns
+		-------
+		list
+			The ids of the free vehicles in ascending order.
+		"""
+		if not self.covers(start_date, end_date):
+			vehicles = self.vehicle_dao.find_available_vehicles(vehicle_type, start_date, end_date)
+			return [vehicle['vehicle_id'] for vehicle in vehicles]
+		with self._lock:
+			available = [
+				vehicle_id for vehicle_id, vehicle in sorted(self._fleet.items())
+				if vehicle['available'] and (vehicle_type is None or vehicle['type'] == vehicle_type)
+				and not (vehicle_id in self._vehicles and self._vehicles[vehicle_id].overlaps(start_date, end_date))
+			]
+		if self.verify:
+			vehicles = self.vehicle_dao.find_available_vehicles(vehicle_type, start_date, end_date)
+			expected = [vehicle['vehicle_id'] for vehicle in vehicles]
+			if expected != available:
+				logger.warning(
+					"Availability index mismatch for %s vehicles between %s and %s: index %s, database %s",
+					vehicle_type or "all", start_date, end_date, available, expected
+				)
+			return expected
+		return available
+
+	def check_consistency(self):
+		"""
+		Compares the index against a fresh read of the database.
+
+		Returns
+		-------
+		list
+			The ids of the vehicles whose bookings differ.
+		"""
+		self._ensure_current()
+		with self._lock:
+			window_start, window_end = self.window_start, self.window_end
+			indexed = {vehicle_id: list(intervals.intervals) for vehicle_id, intervals in self._vehicles.items()}
+		vehicles, _ = self._build(self.booking_dao.get_bookings_between(window_start, window_end))
+		expected = {vehicle_id: intervals.intervals for vehicle_id, intervals in vehicles.items()}
+		mismatched = [
+			vehicle_id for vehicle_id in sorted(set(indexed) | set(expected))
+			if indexed.get(vehicle_id, []) != expected.get(vehicle_id, [])
+		]
+		if mismatched:
+			logger.warning("Availability index out of sync for vehicles %s", mismatched)
+		return mismatched
+
+	def booking_saved(self, booking):
+		"""
+		Adds or moves a booking after it was created or updated.
+
+		Parameters
+		----------
+		booking : dict
+			The booking record.
+		"""
+		with self._lock:
+			if self.window_start is None:
+				return
+			self._remove_booking(booking['booking_id'])
+			self._add_booking(booking)
+
+	def booking_deleted(self, booking_id):
+		"""
+		Removes a booking after it was deleted.
+
+		Parameters
+		----------
+		booking_id : int
+			The booking's id.
+		"""
+		with self._lock:
+			self._remove_booking(booking_id)
+
+	def vehicle_saved(self, vehicle):
+		"""
+		Adds or updates a vehicle after it was created or updated.
+
+		Parameters
+		----------
+		vehicle : dict
+			The vehicle record.
+		"""
+		with self._lock:
+			if self.window_start is not None:
+				self._fleet[vehicle['vehicle_id']] = {
+					"vehicle_id": vehicle['vehicle_id'],
+					"type": vehicle['type'],
+					"available": vehicle['available']
+				}
+
+	def vehicle_deleted(self, vehicle_id):
+		"""
+		Removes a vehicle after it was deleted.
+
+		Parameters
+		----------
+		vehicle_id : int
+			The vehicle's id.
+		"""
+		with self._lock:
+			self._fleet.pop(vehicle_id, None)
+			self._vehicles.pop(vehicle_id, None)
+
+	def _ensure_current(self):
+		if self.window_start != date.today():
+			self.load()
+
+	def _build(self, bookings):
+		vehicles = {}
+		booking_map = {}
+		for booking in bookings:
+			interval = (booking['date_hired'], booking['return_date'], booking['booking_id'])
+			vehicles.setdefault(booking['vehicle_id'], VehicleIntervals()).add(*interval)
+			booking_map[booking['booking_id']] = (booking['vehicle_id'],) + interval
+		return vehicles, booking_map
+
+	def _add_booking(self, booking):
+		start, end = booking['date_hired'], booking['return_date']
+		if end <= self.window_start or start >= self.window_end:
+			return
+		vehicle_id = booking['vehicle_id']
+		self._vehicles.setdefault(vehicle_id, VehicleIntervals()).add(start, end, booking['booking_id'])
+		self._bookings[booking['booking_id']] = (vehicle_id, start, end, booking['booking_id'])
+
+	def _remove_booking(self, booking_id):
+		entry = self._bookings.pop(booking_id, None)
+		if entry is None:
+			return
+		vehicle_id, start, end, _ = entry
+		intervals = self._vehicles[vehicle_id]
+		intervals.remove(start, end, booking_id)
+		if not intervals.intervals:
+			del self._vehicles[vehicle_id]
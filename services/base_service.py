@@ -1,7 +1,26 @@
+from services.pagination import decode_cursor, encode_cursor
+
+
 class BaseService:
+	MAX_PAGE_SIZE = 500
+
 	def __init__(self, dao, required_fields):
 		self.dao = dao
 		self.required_fields = required_fields
+		self.listeners = []
+
+	def add_listener(self, listener):
+		"""
+		Registers an object to be told about committed changes. The
+		service calls the listener's method named after the event, if it
+		has one.
+
+		Parameters
+		----------
+		listener : object
+			The listener.
+		"""
+		self.listeners.append(listener)
 
 	def create_record(self, data):
 		"""
@@ -19,9 +38,7 @@ class BaseService:
 			A dictionary containing the data from the record that was just
 			inserted into the database.
 		"""
-		if not self._is_valid_data(data):
-			raise ValueError("Invalid data")
-		return self.dao.add(data)
+		return self.dao.add(self._validated(data))
 
 
 	def update_record(self, record_id, data):
@@ -42,11 +59,7 @@ class BaseService:
 			A dictionary containing the data from the record that was just
 			updated in the database.
 		"""
-		if not self._is_valid_data(data):
-			raise ValueError("Invalid data")
-		if not self.dao.get(record_id):
-			raise ValueError("Record does not exist")
-		return self.dao.update(record_id, data)
+		return self._found(self.dao.update(record_id, self._validated(data)))
 
 	def delete_record(self, record_id):
 		"""
@@ -58,9 +71,7 @@ class BaseService:
 		record_id : int
 			The record_id
 		"""
-		if not self.dao.get(record_id):
-			raise ValueError("Record does not exist")
-		return self.dao.delete(record_id)
+		self._found(self.dao.delete(record_id))
 
 	def get_record(self, record_id):
 		"""
@@ -77,10 +88,195 @@ class BaseService:
 			A dictionary containing the data from the record that was retrieved
 			from the database.
 		"""
-		if not self.dao.get(record_id):
-			raise ValueError("Record does not exist")
-		return self.dao.get(record_id)
+		return self._found(self.dao.get(record_id))
+
+	def get_record_version(self, record_id):
+		"""
+		Gets the version of a record, which every update increments, without
+		reading the rest of the record.
+
+		Parameters
+		----------
+		record_id : int
+			The records id.
+
+		Returns
+		-------
+		int
+			The record's version, or None if the record does not exist.
+		"""
+		return self.dao.get_version(record_id)
+
+
+	def create_records(self, records):
+		"""
+		Validates every record then sends them to the DAO to be inserted
+		in batches.
+
+		Parameters
+		----------
+		records : list
+			A list of dictionaries containing the data.
+
+		Returns
+		-------
+		int
+			The number of records inserted.
+		"""
+		return self.dao.add_many(self._validated_records(records))
+
+	def update_records(self, records):
+		"""
+		Validates every record then sends them to the DAO to be updated
+		in batches. Each record must include its primary key id.
+
+		Parameters
+		----------
+		records : list
+			A list of dictionaries containing the record data and id.
+
+		Returns
+		-------
+		int
+			The number of records updated.
+		"""
+		return self.dao.update_many(self._updates(records))
+
+	def get_records(self, record_ids):
+		"""
+		Gets many records from the database, ids that do not exist are
+		left out of the result.
+
+		Parameters
+		----------
+		record_ids : list
+			The records' ids.
+
+		Returns
+		-------
+		list
+			A list of dictionaries containing the records that were
+			retrieved from the database.
+		"""
+		return self.dao.get_many(record_ids)
+
+	def list_records(self, filters=None, sort=None, order='asc', cursor=None, limit=50):
+		"""
+		Gets a page of records with keyset pagination.
+
+		Parameters
+		----------
+		filters : dict
+			Column to value equality filters.
+		sort : str
+			The column to order by, the id by default.
+		order : str
+			asc or desc.
+		cursor : str
+			The next_cursor of the previous page, or None for the first.
+		limit : int
+			The page size, at most MAX_PAGE_SIZE.
+
+		Returns
+		-------
+		tuple
+			The page of records and the cursor for the next page, which is
+			None on the last page.
+		"""
+		sort, descending, after = self._page_request(sort, order, cursor, limit)
+		records = self.dao.list(filters, sort, descending, after, limit + 1)
+		return self._page(records, sort, descending, limit)
+
+	def _page_request(self, sort, order, cursor, limit):
+		if order not in ('asc', 'desc'):
+			raise ValueError("Invalid order")
+		if not 1 <= limit <= self.MAX_PAGE_SIZE:
+			raise ValueError("Invalid limit")
+		sort = sort or self.dao.id_name
+		descending = order == 'desc'
+		after = decode_cursor(cursor, sort, descending) if cursor else None
+		return sort, descending, after
 
+	def _page(self, records, sort, descending, limit):
+		# One extra record is fetched to tell whether there is a next page
+		if len(records) <= limit:
+			return records, None
+		records = records[:limit]
+		last = records[-1]
+		return records, encode_cursor(sort, descending, last[sort], last[self.dao.id_name])
+
+	def transaction(self):
+		"""
+		Opens a transaction on the service's database so several DAO
+		writes, possibly across services, are committed once and
+		atomically.
+
+		Returns
+		-------
+		contextlib.AbstractContextManager
+			The DatabaseManager transaction context.
+		"""
+		return self.dao.db_manager.transaction()
+
+	def run_in_transaction(self, work):
+		"""
+		Runs a unit of work in a transaction on the service's database,
+		running it again if MySQL aborts it with a deadlock.
+
+		Parameters
+		----------
+		work : callable
+			The unit of work, taking no arguments.
+
+		Returns
+		-------
+		object
+			What the unit of work returned.
+		"""
+		return self.dao.db_manager.run_in_transaction(work)
+
+	def _notify(self, event, *args):
+		"""
+		Calls the event method on every listener once the current
+		transaction, if any, has committed.
+		"""
+		def notify():
+			for listener in self.listeners:
+				handler = getattr(listener, event, None)
+				if handler is not None:
+					handler(*args)
+
+		if self.listeners:
+			self.dao.db_manager.after_commit(notify)
+
+	# The checks around the DAO calls, shared with AsyncBaseService so
+	# both modes validate and fail alike
+
+	def _validated(self, data):
+		if not self._is_valid_data(data):
+			raise ValueError("Invalid data")
+		return data
+
+	def _validated_records(self, records):
+		if not isinstance(records, list) or not all(self._is_valid_data(data) for data in records):
+			raise ValueError("Invalid data")
+		return records
+
+	def _updates(self, records):
+		# (id, data) pairs for update_many, from records carrying their id
+		if not isinstance(records, list) or not all(
+				self._is_valid_data(data) and self.dao.id_name in data for data in records):
+			raise ValueError("Invalid data")
+		return [
+			(data[self.dao.id_name], {key: value for key, value in data.items() if key != self.dao.id_name})
+			for data in records
+		]
+
+	def _found(self, result):
+		# The DAOs return None, or False from delete, when no record matched
+		if result is None or result is False:
+			raise ValueError("Record does not exist")
+		return result
 
 	def _is_valid_data(self, data):
 		"""
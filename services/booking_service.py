@@ -1,5 +1,7 @@
 from datetime import datetime
 from services.base_service import BaseService
+from services.notifications import BOOKING_CONFIRMATION
+from services.report_formats import csv_chunks, ndjson_chunks
 
 
 class BookingServices(BaseService):
@@ -8,7 +10,7 @@ class BookingServices(BaseService):
 	the Booking DAO to perform CRUD operations.
 	"""
 
-	def __init__(self, booking_dao, vehicle_service):
+	def __init__(self, booking_dao, vehicle_service, availability_index=None, notification_dao=None):
 		required_fields = {
 			"customer_id",
 			"vehicle_id",
@@ -18,11 +20,20 @@ class BookingServices(BaseService):
 		}
 		super().__init__(booking_dao, required_fields)
 		self.vehicle_service = vehicle_service
+		self.availability_index = availability_index
+		self.notification_dao = notification_dao
+		if availability_index is not None:
+			self.add_listener(availability_index)
 
 	def create_booking(self, booking_data):
 		"""
 		Validates booking data then sends it to the booking DAO to add
-		to the database.
+		to the database. Advance bookings queue a confirmation letter in
+		the same transaction.
+
+		The check and the insert run in one transaction holding the
+		vehicle's row lock, so two concurrent bookings of the same vehicle
+		cannot both see it free. The transaction is retried on deadlock.
 
 		Parameters
 		----------
@@ -35,13 +46,24 @@ class BookingServices(BaseService):
 			A dictionary containing the data from the record that was just
 			inserted into the database.
 		"""
-		self.run_all_validation(booking_data)
-		return super().create_record(booking_data)
+		create_record = super().create_record
+
+		def reserve():
+			self.run_all_validation(booking_data)
+			booking = create_record(booking_data)
+			if booking['date_hired'] > datetime.now().date():
+				self.send_confirmation_email(booking)
+			return booking
+
+		booking = self.run_in_transaction(reserve)
+		self._notify('booking_saved', booking)
+		return booking
 
 	def update_booking(self, booking_id, booking_data):
 		"""
 		Validates input then sends it to the booking DAO to update the
-		booking record with booking_id.
+		booking record with booking_id, under the same vehicle lock as
+		create_booking. The booking does not conflict with itself.
 
 		Parameters
 		----------
@@ -56,8 +78,39 @@ class BookingServices(BaseService):
 			A dictionary containing the data from the record that was just
 			updated in the database.
 		"""
-		self.run_all_validation(booking_data)
-		return super().update_record(booking_id, booking_data)
+		update_record = super().update_record
+
+		def reschedule():
+			self.run_all_validation(booking_data, booking_id)
+			return update_record(booking_id, booking_data)
+
+		booking = self.run_in_transaction(reschedule)
+		self._notify('booking_saved', booking)
+		return booking
+
+	def mark_paid(self, booking_id):
+		"""
+		Sets the booking's payment_status to PAID. Joins the caller's
+		transaction, if one is open, and tells the listeners once it
+		commits.
+
+		Parameters
+		----------
+		booking_id : int
+			The booking id
+
+		Returns
+		-------
+		dict
+			A dictionary containing the booking as updated.
+		"""
+		with self.transaction():
+			booking = self.dao.get(booking_id)
+			if booking is None:
+				raise ValueError("No booking with that booking_id was found")
+			booking = {**booking, **self.dao.update(booking_id, {"payment_status": "PAID"})}
+		self._notify('booking_saved', booking)
+		return booking
 
 	def delete_booking(self, booking_id):
 		"""
@@ -69,7 +122,8 @@ class BookingServices(BaseService):
 		booking_id : int
 			The booking id
 		"""
-		return super().delete_record(booking_id)
+		super().delete_record(booking_id)
+		self._notify('booking_deleted', booking_id)
 
 	def get_booking(self, booking_id):
 		"""
@@ -88,20 +142,52 @@ class BookingServices(BaseService):
 		"""
 		return super().get_record(booking_id)
 
-	def run_all_validation(self, booking_data):
+	def is_vehicle_available(self, vehicle_id, start_date, end_date):
+		"""
+		Answers an availability enquiry for a vehicle, from the
+		availability index when one is configured.
+
+		Parameters
+		----------
+		vehicle_id : int
+			The vehicle's id.
+		start_date : datetime.date
+			The first day of hire.
+		end_date : datetime.date
+			The return date.
+
+		Returns
+		-------
+		bool
+			True if the vehicle has no booking overlapping the date range.
+		"""
+		if start_date >= end_date:
+			raise ValueError("The return date must be after the hire date")
+		if self.availability_index is not None:
+			return self.availability_index.is_vehicle_available(vehicle_id, start_date, end_date)
+		return self.dao.is_vehicle_available(vehicle_id, start_date, end_date)
+
+	def run_all_validation(self, booking_data, booking_id=None):
 		"""
 		Checks booking duration to make sure it does not exceed 7 days
 		and the booking is not more than 7 days in advance. This then
 		makes sure the requested vehicle is available in the given time
 		frame and validates required fields.
 
+		The availability check locks the vehicle's row, so it only
+		guards against double bookings when run in the transaction that
+		writes the booking.
+
 		Parameters
 		----------
 		booking_data : dict
 			The booking record.
+		booking_id : int
+			The id of the booking being changed, which is left out of the
+			availability check.
 		"""
 		self._validate_booking_duration(booking_data)
-		self._validate_vehicle_availability(booking_data)
+		self._validate_vehicle_availability(booking_data, booking_id)
 
 	def _validate_booking_duration(self, booking_data):
 		date_hired = booking_data.get('date_hired')
@@ -112,18 +198,73 @@ class BookingServices(BaseService):
 		elif (date_hired - datetime.now().date()).days > 7:
 			raise ValueError("Booking cannot be made more than 7 days in advance")
 
-	def _validate_vehicle_availability(self, booking_data):
+	def _validate_vehicle_availability(self, booking_data, booking_id=None):
 		vehicle_id = booking_data.get('vehicle_id')
 		date_hired = booking_data.get('date_hired')
 		return_date = booking_data.get('return_date')
 
-		if self.vehicle_service.get_vehicle(vehicle_id) is None:
-			return ValueError("A vehicle with that vehicle_id does not exist")
-		elif not self.dao.is_vehicle_available(vehicle_id, start_date=date_hired, end_date=return_date):
+		# Lock the vehicle before reading its bookings: the transaction's
+		# snapshot is taken by its first read, so it then includes every
+		# booking committed by the previous holder of the lock
+		if self.vehicle_service.dao.lock_vehicle(vehicle_id) is None:
+			raise ValueError("A vehicle with that vehicle_id does not exist")
+		elif not self.dao.is_vehicle_available(
+				vehicle_id, start_date=date_hired, end_date=return_date, exclude_booking_id=booking_id):
 			raise ValueError("Vehicle is not available for booking during that time frame")
 
-	def generate_daily_report(self):
-		return self.dao.get_daily_bookings()
+	REPORT_FORMATS = {"csv", "ndjson"}
+
+	def generate_daily_report(self, report_date=None):
+		"""
+		Streams the bookings that start on a day, with their customer and
+		vehicle details.
+
+		Parameters
+		----------
+		report_date : datetime.date
+			The day to report on, defaults to today.
+
+		Returns
+		-------
+		generator
+			A generator of dictionaries, one per booking.
+		"""
+		return self.dao.iter_daily_bookings(report_date or datetime.now().date())
+
+	def stream_daily_report(self, report_format, report_date=None):
+		"""
+		Encodes the daily report as it is streamed from the database.
 
-	def send_confirmation_email(self):
-		pass
+		Parameters
+		----------
+		report_format : str
+			Either csv or ndjson.
+		report_date : datetime.date
+			The day to report on, defaults to today.
+
+		Returns
+		-------
+		generator
+			A generator of encoded chunks of the report.
+		"""
+		if report_format not in self.REPORT_FORMATS:
+			raise ValueError(f"Report format must be one of {', '.join(sorted(self.REPORT_FORMATS))}")
+		bookings = self.generate_daily_report(report_date)
+		if report_format == "csv":
+			return csv_chunks(bookings, self.dao.REPORT_COLUMNS)
+		return ndjson_chunks(bookings)
+
+	def send_confirmation_email(self, booking):
+		"""
+		Queues a confirmation letter for a booking in the notification
+		outbox, for the NotificationDispatcher to send. The letter is only
+		sent if the surrounding transaction commits. Does nothing if the
+		service has no outbox.
+
+		Parameters
+		----------
+		booking : dict
+			The booking to confirm.
+		"""
+		if self.notification_dao is not None:
+			self.notification_dao.enqueue(booking['booking_id'], BOOKING_CONFIRMATION)
@@ -83,3 +83,54 @@ class CustomerService(BaseService):
 			from the database.
 		"""
 		return super().get_record(customer_id)
+
+	def add_customers(self, customers):
+		"""
+		Validates a batch of customers then sends it to the customer DAO
+		to add to the database.
+
+		Parameters
+		----------
+		customers : list
+			A list of dictionaries containing the customer data.
+
+		Returns
+		-------
+		int
+			The number of customers inserted.
+		"""
+		return super().create_records(customers)
+
+	def update_customers(self, customers):
+		"""
+		Validates a batch of customers then sends it to the customer DAO
+		to update. Each customer must include its customer_id.
+
+		Parameters
+		----------
+		customers : list
+			A list of dictionaries containing the customer data.
+
+		Returns
+		-------
+		int
+			The number of customers updated.
+		"""
+		return super().update_records(customers)
+
+	def get_customers(self, customer_ids):
+		"""
+		Gets many customers from the database.
+
+		Parameters
+		----------
+		customer_ids : list
+			The customers' ids
+
+		Returns
+		-------
+		list
+			A list of dictionaries containing the customers that were
+			retrieved from the database.
+		"""
+		return super().get_records(customer_ids)
@@ -1,9 +1,10 @@
 from datetime import datetime
 from services.base_service import BaseService
+from services.pricing_engine import DEFAULT_DAILY_RATE, PricingEngine
 
 
 class InvoiceService(BaseService):
-	def __init__(self, invoice_dao, booking_dao, booking_service):
+	def __init__(self, invoice_dao, booking_dao, booking_service, pricing_engine=None):
 		required_fields = {
 			"booking_id",
 			"total_amount",
@@ -12,6 +13,7 @@ class InvoiceService(BaseService):
 		super().__init__(invoice_dao, required_fields)
 		self.booking_dao = booking_dao
 		self.booking_service = booking_service
+		self.pricing_engine = pricing_engine or PricingEngine()
 
 	def generate_invoice(self, booking_id):
 		"""
@@ -28,17 +30,51 @@ class InvoiceService(BaseService):
 			A dictionary containing the data from the invoice that was added
 			to the database.
 		"""
-		booking = self.booking_dao.get(booking_id)
-		if not booking:
-			raise ValueError("Invalid booking_id")
-
-		total_amount = calculate_total_amount(booking)
-		invoice_data = {
-			"booking_id": booking_id,
-			"total_amount": total_amount,
+		bookings = self.booking_dao.get_billable_bookings([booking_id])
+		invoice = self.dao.add(self._invoice_data(bookings[0]), ignore_duplicates=True) if bookings else None
+		if invoice is None:
+			raise ValueError("Invalid booking_id or the booking is already invoiced")
+		return invoice
+
+	def generate_invoices(self, booking_ids=None, start_date=None, end_date=None):
+		"""
+		Invoices many bookings at once, either by id or every booking
+		hired in a date range. Bookings that already have an invoice are
+		skipped. The bookings are read and their invoices inserted in
+		batches, so the number of queries does not grow per booking.
+
+		A booking can have only one invoice. If a concurrent run invoices
+		a booking between the read and the insert, the insert skips it.
+		The booking is still in the returned list, with the same amount
+		the other run charged.
+
+		Parameters
+		----------
+		booking_ids : list
+			The bookings' ids, or None to invoice by date.
+		start_date : datetime.date
+			The first day of hire of the range.
+		end_date : datetime.date
+			The day after the last day of hire of the range.
+
+		Returns
+		-------
+		list
+			The data of the invoices that were added.
+		"""
+		if booking_ids is None and (start_date is None or end_date is None or start_date >= end_date):
+			raise ValueError("Either booking ids or a start and end date are required")
+		bookings = self.booking_dao.get_billable_bookings(booking_ids, start_date, end_date)
+		invoices = [self._invoice_data(booking) for booking in bookings]
+		self.dao.add_many(invoices, ignore_duplicates=True)
+		return invoices
+
+	def _invoice_data(self, booking):
+		return {
+			"booking_id": booking['booking_id'],
+			"total_amount": self.pricing_engine.price(booking, booking['type']),
 			"payment_date": None
 		}
-		return self.dao.add(invoice_data)
 
 	def update_invoice(self, invoice_id, invoice):
 		"""
@@ -58,7 +94,7 @@ class InvoiceService(BaseService):
 			A dictionary containing the data from the record that was just
 			updated in the database.
 		"""
-		super().update_record(invoice_id, invoice)
+		return super().update_record(invoice_id, invoice)
 
 	def get_invoice(self, invoice_id):
 		"""
@@ -75,7 +111,7 @@ class InvoiceService(BaseService):
 			A dictionary containing the data from the record that was retrieved
 			from the database.
 		"""
-		super().get_record(invoice_id)
+		return super().get_record(invoice_id)
 
 	def delete_invoice(self, invoice_id):
 		"""
@@ -93,7 +129,7 @@ class InvoiceService(BaseService):
 		"""
 		Handles payment of the invoice by including a payment_date to
 		the invoice, then marks the booking payment_status field as PAID.
-		Finally, it updates the records in the database to reflect this.
+		Both updates run in one transaction so they are committed together.
 
 		Parameters
 		----------
@@ -106,23 +142,20 @@ class InvoiceService(BaseService):
 			A dictionary containing the data from the invoice that was
 			updated in the database.
 		"""
-		invoice = self.dao.get(invoice_id)
-		booking_id = invoice['booking_id']
-		booking = self.booking_dao.get(booking_id)
-
-		if invoice is None:
-			raise ValueError("Invoice not found")
+		with self.transaction():
+			invoice = self.dao.get(invoice_id)
+			if invoice is None:
+				raise ValueError("Invoice not found")
 
-		if booking is None:
-			raise ValueError("No booking with that invoice_id was found")
+			# Through the booking service, so the report snapshot and the
+			# availability index hear about the change
+			self.booking_service.mark_paid(invoice['booking_id'])
 
-		invoice['payment_date'] = datetime.now().date()
-		booking['payment_status'] = 'PAID'
-		self.booking_service.update_booking(booking_id, booking)
-		return self.update_invoice(invoice_id, invoice)
+			paid = self.dao.update(invoice_id, {"payment_date": datetime.now().date()})
+			return {**invoice, **paid}
 
 
-def calculate_total_amount(booking, daily_rate=200.75):
+def calculate_total_amount(booking, daily_rate=DEFAULT_DAILY_RATE):
 	# total amount = number of days * daily rate
 	date_hired = booking.get('date_hired')
 	return_date = booking.get('return_date')
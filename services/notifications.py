@@ -0,0 +1,257 @@
+import logging
+import os
+import random
+import smtplib
+import threading
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+logger = logging.getLogger(__name__)
+
+BOOKING_CONFIRMATION = "booking_confirmation"
+
+
+def confirmation_letter(notification, sender):
+	"""
+	Writes the confirmation letter for an advance booking.
+
+	Parameters
+	----------
+	notification : dict
+		A claimed notification with its booking, customer and vehicle
+		details.
+	sender : str
+		The From address.
+
+	Returns
+	-------
+	email.message.EmailMessage
+		The letter.
+	"""
+	message = EmailMessage()
+	message['From'] = sender
+	message['To'] = notification['email']
+	message['Subject'] = f"Your booking {notification['booking_id']} is confirmed"
+	message.set_content(
+		f"Dear {notification['first_name']} {notification['last_name']},\n\n"
+		f"This confirms your booking of the {notification['make']} {notification['model']} "
+		f"({notification['registration_number']}) from {notification['date_hired']} "
+		f"until {notification['return_date']}.\n\n"
+		"Payment is taken at the time of hire.\n"
+	)
+	return message
+
+
+class FileSink:
+	"""
+	Delivers letters by writing each one to an .eml file, for development
+	and for testing the outbox without a mail server.
+	"""
+
+	def __init__(self, directory):
+		self.directory = directory
+
+	def send(self, messages):
+		"""
+		Parameters
+		----------
+		messages : list
+			(notification_id, EmailMessage) tuples.
+
+		Returns
+		-------
+		dict
+			The error per notification_id that could not be delivered.
+		"""
+		# Created on first delivery, so building the app touches no disk
+		try:
+			os.makedirs(self.directory, exist_ok=True)
+		except OSError as error:
+			return {notification_id: error for notification_id, _ in messages}
+		failures = {}
+		for notification_id, message in messages:
+			try:
+				with open(os.path.join(self.directory, f"notification-{notification_id}.eml"), 'wb') as letter:
+					letter.write(message.as_bytes())
+			except OSError as error:
+				failures[notification_id] = error
+		return failures
+
+
+class SMTPSender:
+	"""
+	Delivers letters over SMTP, one connection per batch. For local
+	testing point it at a stand-in server, e.g.
+	python -m aiosmtpd -n -l localhost:1025.
+	"""
+
+	def __init__(self, host, port=25, username=None, password=None, use_tls=False, timeout=30):
+		self.host = host
+		self.port = port
+		self.username = username
+		self.password = password
+		self.use_tls = use_tls
+		self.timeout = timeout
+
+	def send(self, messages):
+		"""
+		Parameters
+		----------
+		messages : list
+			(notification_id, EmailMessage) tuples.
+
+		Returns
+		-------
+		dict
+			The error per notification_id the server refused. Connection
+			errors are raised and fail the whole batch.
+		"""
+		failures = {}
+		with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+			if self.use_tls:
+				smtp.starttls()
+			if self.username:
+				smtp.login(self.username, self.password)
+			for notification_id, message in messages:
+				try:
+					smtp.send_message(message)
+				except smtplib.SMTPException as error:
+					failures[notification_id] = error
+		return failures
+
+
+class NotificationDispatcher:
+	"""
+	Drains the notification outbox with a pool of worker threads. Each
+	worker claims a batch of due notifications, sends them and records
+	the outcome. Failed notifications are retried with exponential
+	backoff and jitter until max_attempts, then marked FAILED.
+	"""
+
+	def __init__(self, notification_dao, sender, sender_address, workers=2, batch_size=50,
+			poll_interval=5, max_attempts=5, backoff=30, max_backoff=3600, lease=300):
+		"""
+		Parameters
+		----------
+		notification_dao : NotificationDAO
+			The outbox.
+		sender : FileSink or SMTPSender
+			Delivers the letters.
+		sender_address : str
+			The From address of the letters.
+		workers : int
+			The number of worker threads.
+		batch_size : int
+			The number of notifications a worker claims at once.
+		poll_interval : float
+			Seconds an idle worker waits before looking again.
+		max_attempts : int
+			Attempts before a notification is given up on.
+		backoff : float
+			Seconds before the first retry, doubled on each further one.
+		max_backoff : float
+			The longest wait between retries.
+		lease : float
+			Seconds a claimed batch is hidden from other workers.
+		"""
+		self.notification_dao = notification_dao
+		self.sender = sender
+		self.sender_address = sender_address
+		self.workers = workers
+		self.batch_size = batch_size
+		self.poll_interval = poll_interval
+		self.max_attempts = max_attempts
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self.lease = lease
+		self._stop = threading.Event()
+		self._threads = []
+
+	def dispatch_batch(self):
+		"""
+		Claims and sends one batch of due notifications.
+
+		Returns
+		-------
+		int
+			The number of notifications claimed, 0 if none were due.
+		"""
+		notifications = self.notification_dao.claim_due(self.batch_size, self.lease)
+		if not notifications:
+			return 0
+		messages = [
+			(notification['notification_id'], confirmation_letter(notification, self.sender_address))
+			for notification in notifications
+		]
+		try:
+			failures = self.sender.send(messages)
+		except (OSError, smtplib.SMTPException) as error:
+			failures = {notification_id: error for notification_id, _ in messages}
+
+		sent = [notification['notification_id'] for notification in notifications
+			if notification['notification_id'] not in failures]
+		if sent:
+			self.notification_dao.mark_sent(sent)
+		if failures:
+			self.notification_dao.mark_failed([
+				self._failure(notification, failures[notification['notification_id']])
+				for notification in notifications
+				if notification['notification_id'] in failures
+			])
+			logger.warning("%d of %d notifications failed to send", len(failures), len(notifications))
+		return len(notifications)
+
+	def drain(self):
+		"""
+		Sends batches until nothing is due.
+
+		Returns
+		-------
+		int
+			The number of notifications claimed.
+		"""
+		total = 0
+		while not self._stop.is_set():
+			claimed = self.dispatch_batch()
+			if not claimed:
+				break
+			total += claimed
+		return total
+
+	def start(self):
+		"""
+		Starts the worker threads.
+		"""
+		if not self._threads:
+			self._stop.clear()
+			self._threads = [
+				threading.Thread(target=self._run, name=f"notification-dispatcher-{number}", daemon=True)
+				for number in range(self.workers)
+			]
+			for thread in self._threads:
+				thread.start()
+
+	def stop(self):
+		"""
+		Stops the worker threads after their current batch.
+		"""
+		self._stop.set()
+		for thread in self._threads:
+			thread.join()
+		self._threads = []
+
+	def _run(self):
+		while not self._stop.is_set():
+			try:
+				self.drain()
+			except Exception:
+				logger.exception("Dispatching notifications failed")
+			self._stop.wait(self.poll_interval)
+
+	def _failure(self, notification, error):
+		attempts = notification['attempts'] + 1
+		next_attempt_at = None
+		if attempts < self.max_attempts:
+			delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+			next_attempt_at = datetime.now() + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+		return notification['notification_id'], attempts, next_attempt_at, str(error)
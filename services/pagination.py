@@ -0,0 +1,56 @@
+import base64
+import binascii
+import json
+
+
+def encode_cursor(sort, descending, sort_value, last_id):
+	"""
+	Encodes the position after a page's last record as an opaque,
+	URL-safe token.
+
+	Parameters
+	----------
+	sort : str
+		The column the pages are ordered by.
+	descending : bool
+		Whether the pages are in descending order.
+	sort_value : object
+		The last record's sort column value.
+	last_id : int
+		The last record's id.
+
+	Returns
+	-------
+	str
+		The cursor token for the next page.
+	"""
+	payload = json.dumps([sort, descending, sort_value, last_id], default=str, separators=(',', ':'))
+	return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, sort, descending):
+	"""
+	Decodes a cursor token, checking it was issued for the same ordering.
+
+	Parameters
+	----------
+	token : str
+		The cursor token.
+	sort : str
+		The column the pages are ordered by.
+	descending : bool
+		Whether the pages are in descending order.
+
+	Returns
+	-------
+	tuple
+		The (sort value, id) to continue after.
+	"""
+	try:
+		padded = token + '=' * (-len(token) % 4)
+		token_sort, token_descending, sort_value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+	except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+		raise ValueError("Invalid cursor")
+	if token_sort != sort or token_descending != descending:
+		raise ValueError("The cursor was issued for a different sort order")
+	return sort_value, last_id
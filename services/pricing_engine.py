@@ -0,0 +1,65 @@
+import threading
+
+DEFAULT_DAILY_RATE = 200.75
+
+
+class PricingEngine:
+	"""
+	Prices bookings from the rate table, which is read once into memory
+	on first use so pricing a batch costs no queries. Vehicle types
+	missing from the table are charged the default daily rate.
+	"""
+
+	def __init__(self, rate_dao=None, default_rate=DEFAULT_DAILY_RATE):
+		"""
+		Parameters
+		----------
+		rate_dao : RateDAO
+			The rate table, or None to charge every type the default rate.
+		default_rate : float
+			The daily rate of vehicle types without a rate.
+		"""
+		self.rate_dao = rate_dao
+		self.default_rate = default_rate
+		self._rates = None
+		self._lock = threading.Lock()
+
+	def load(self):
+		"""
+		Reads the rate table into memory, call again after changing it.
+		"""
+		rates = self.rate_dao.get_rates() if self.rate_dao is not None else {}
+		with self._lock:
+			self._rates = rates
+
+	def daily_rate(self, vehicle_type):
+		"""
+		Parameters
+		----------
+		vehicle_type : str
+			The vehicle's type.
+
+		Returns
+		-------
+		float
+			The daily rate for the type.
+		"""
+		if self._rates is None:
+			self.load()
+		return self._rates.get(vehicle_type, self.default_rate)
+
+	def price(self, booking, vehicle_type):
+		"""
+		Parameters
+		----------
+		booking : dict
+			The booking, with its date_hired and return_date.
+		vehicle_type : str
+			The type of the booked vehicle.
+
+		Returns
+		-------
+		float
+			The number of days hired times the type's daily rate.
+		"""
+		return (booking['return_date'] - booking['date_hired']).days * self.daily_rate(vehicle_type)
@@ -0,0 +1,79 @@
+import csv
+import io
+import json
+
+from models.models import Record
+
+
+def csv_chunks(rows, columns, chunk_size=500):
+	"""
+	Encodes rows as CSV, yielding the header straight away and then one
+	string per chunk of rows so a response can be streamed.
+
+	Parameters
+	----------
+	rows : iterable
+		Records or dictionaries keyed by column name.
+	columns : list
+		The column names, in output order.
+	chunk_size : int
+		The number of rows per yielded string.
+
+	Yields
+	------
+	str
+		The CSV header, then the CSV lines of each chunk of rows.
+	"""
+	buffer = io.StringIO()
+	writer = csv.writer(buffer)
+	writer.writerow(columns)
+	yield _drain(buffer)
+	pending = 0
+	for row in rows:
+		writer.writerow([row[column] for column in columns])
+		pending += 1
+		if pending == chunk_size:
+			yield _drain(buffer)
+			pending = 0
+	if pending:
+		yield _drain(buffer)
+
+
+def ndjson_chunks(rows, chunk_size=500):
+	"""
+	Encodes rows as newline delimited JSON, one string per chunk of rows.
+	Dates and other values JSON cannot encode are written as strings.
+
+	Parameters
+	----------
+	rows : iterable
+		Records or dictionaries keyed by column name.
+	chunk_size : int
+		The number of rows per yielded string.
+
+	Yields
+	------
+	str
+		The JSON lines of each chunk of rows.
+	"""
+	lines = []
+	for row in rows:
+		lines.append(json.dumps(row, default=_json_default))
+		if len(lines) == chunk_size:
+			yield '\n'.join(lines) + '\n'
+			lines = []
+	if lines:
+		yield '\n'.join(lines) + '\n'
+
+
+def _json_default(value):
+	if isinstance(value, Record):
+		return value._asdict()
+	return str(value)
+
+
+def _drain(buffer):
+	value = buffer.getvalue()
+	buffer.seek(0)
+	buffer.truncate()
+	return value
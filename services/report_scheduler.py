@@ -0,0 +1,297 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from services.report_formats import csv_chunks, ndjson_chunks
+
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class ReportSnapshot:
+	"""
+	One day's bookings report as materialized on disk. Rows are kept
+	as lists of JSON-safe values in column order, keyed by booking_id,
+	and rendered bodies are cached per format.
+	"""
+
+	def __init__(self, report_date, columns, rows):
+		self.report_date = report_date
+		self.columns = list(columns)
+		self.rows = rows
+		self.payload = json.dumps(
+			{"date": report_date.isoformat(), "columns": self.columns, "rows": list(rows.values())},
+			separators=(',', ':'),
+			default=str
+		).encode()
+		self.etag = hashlib.sha1(self.payload).hexdigest()
+		self._rendered = {}
+
+	@classmethod
+	def from_records(cls, report_date, columns, records):
+		rows = {}
+		for record in records:
+			rows[record['booking_id']] = json.loads(json.dumps([record[column] for column in columns], default=str))
+		return cls(report_date, columns, rows)
+
+	@classmethod
+	def from_payload(cls, payload):
+		data = json.loads(payload)
+		rows = {row[data['columns'].index('booking_id')]: row for row in data['rows']}
+		return cls(date.fromisoformat(data['date']), data['columns'], rows)
+
+	def with_record(self, booking_id, record):
+		"""
+		Returns a copy of the snapshot with one booking added, replaced,
+		or removed when record is None.
+		"""
+		rows = dict(self.rows)
+		rows.pop(booking_id, None)
+		if record is not None:
+			rows[booking_id] = json.loads(json.dumps([record[column] for column in self.columns], default=str))
+		return ReportSnapshot(self.report_date, self.columns, dict(sorted(rows.items())))
+
+	def records(self):
+		"""
+		Yields
+		------
+		dict
+			One dictionary per booking, keyed by column name.
+		"""
+		for row in self.rows.values():
+			yield dict(zip(self.columns, row))
+
+	def render(self, report_format):
+		"""
+		Parameters
+		----------
+		report_format : str
+			Either csv or ndjson.
+
+		Returns
+		-------
+		str
+			The whole report in that format.
+		"""
+		if report_format not in self._rendered:
+			if report_format == "csv":
+				chunks = csv_chunks(self.records(), self.columns)
+			else:
+				chunks = ndjson_chunks(self.records())
+			self._rendered[report_format] = ''.join(chunks)
+		return self._rendered[report_format]
+
+
+class DailyReportScheduler:
+	"""
+	Materializes each day's bookings report once, at run_at from a
+	background thread or when generate is called from the command line,
+	into a gzipped snapshot file that every request and every process
+	then serves without querying the database. While today's snapshot
+	exists it is patched one booking at a time as bookings for today
+	are created, changed or deleted.
+	"""
+
+	def __init__(self, booking_dao, snapshot_dir, run_at=None, keep_days=7):
+		"""
+		Parameters
+		----------
+		booking_dao : BookingDAO
+			The DAO the report is read from.
+		snapshot_dir : str
+			The directory snapshot files are written to.
+		run_at : datetime.time
+			The time of day the background thread generates the report,
+			defaults to 06:00.
+		keep_days : int
+			The number of days of snapshots to keep on disk.
+		"""
+		self.booking_dao = booking_dao
+		self.snapshot_dir = snapshot_dir
+		self.run_at = run_at or datetime.strptime("06:00", "%H:%M").time()
+		self.keep_days = keep_days
+		self._snapshots = {}
+		self._lock = threading.RLock()
+		self._stop = threading.Event()
+		self._thread = None
+
+	def generate(self, report_date=None):
+		"""
+		Reads a day's report from the database and writes its snapshot.
+
+		Parameters
+		----------
+		report_date : datetime.date
+			The day to report on, defaults to today.
+
+		Returns
+		-------
+		ReportSnapshot
+			The new snapshot.
+		"""
+		report_date = report_date or date.today()
+		# Read under the lock so a booking patched in meanwhile is not lost
+		with self._lock, self._file_lock():
+			records = self.booking_dao.iter_daily_bookings(report_date)
+			snapshot = ReportSnapshot.from_records(report_date, self.booking_dao.REPORT_COLUMNS, records)
+			self._write(snapshot)
+		logger.info("Generated daily report snapshot for %s with %d bookings", report_date, len(snapshot.rows))
+		return snapshot
+
+	def get(self, report_date):
+		"""
+		Returns a day's snapshot, reloading it if another process has
+		rewritten the file.
+
+		Parameters
+		----------
+		report_date : datetime.date
+			The day of the report.
+
+		Returns
+		-------
+		ReportSnapshot
+			The snapshot, or None if it has not been generated.
+		"""
+		path = self._path(report_date)
+		try:
+			modified = self._file_version(path)
+		except FileNotFoundError:
+			return None
+		with self._lock:
+			cached = self._snapshots.get(report_date)
+			if cached is not None and cached[1] == modified:
+				return cached[0]
+			with gzip.open(path, 'rb') as snapshot_file:
+				snapshot = ReportSnapshot.from_payload(snapshot_file.read())
+			self._snapshots[report_date] = (snapshot, modified)
+			return snapshot
+
+	def booking_saved(self, booking):
+		"""
+		Patches today's snapshot after a booking was created or updated.
+
+		Parameters
+		----------
+		booking : dict
+			The booking record.
+		"""
+		today = date.today()
+		booking_id = booking['booking_id']
+		with self._lock, self._file_lock():
+			snapshot = self.get(today)
+			if snapshot is None:
+				return
+			if booking['date_hired'] == today:
+				self._write(snapshot.with_record(booking_id, self.booking_dao.get_report_row(booking_id)))
+			elif booking_id in snapshot.rows:
+				self._write(snapshot.with_record(booking_id, None))
+
+	def booking_deleted(self, booking_id):
+		"""
+		Removes a booking from today's snapshot after it was deleted.
+
+		Parameters
+		----------
+		booking_id : int
+			The booking's id.
+		"""
+		with self._lock, self._file_lock():
+			snapshot = self.get(date.today())
+			if snapshot is not None and booking_id in snapshot.rows:
+				self._write(snapshot.with_record(booking_id, None))
+
+	def start(self):
+		"""
+		Starts the background thread that generates the report every
+		day at run_at, and straight away if today's is missing.
+		"""
+		if self._thread is None:
+			self._stop.clear()
+			self._thread = threading.Thread(target=self._run, name="daily-report-scheduler", daemon=True)
+			self._thread.start()
+
+	def stop(self):
+		"""
+		Stops the background thread.
+		"""
+		if self._thread is not None:
+			self._stop.set()
+			self._thread.join()
+			self._thread = None
+
+	def _run(self):
+		if self.get(date.today()) is None:
+			self._generate_and_prune()
+		while not self._stop.wait(self._seconds_until_next_run()):
+			self._generate_and_prune()
+
+	def _generate_and_prune(self):
+		try:
+			self.generate()
+			self._prune()
+		except Exception:
+			logger.exception("Generating the daily report snapshot failed")
+
+	def _seconds_until_next_run(self):
+		now = datetime.now()
+		next_run = datetime.combine(now.date(), self.run_at)
+		if next_run <= now:
+			next_run += timedelta(days=1)
+		return (next_run - now).total_seconds()
+
+	def _prune(self):
+		oldest = date.today() - timedelta(days=self.keep_days)
+		for name in os.listdir(self.snapshot_dir):
+			if name.startswith("daily-report-") and name.endswith(".json.gz"):
+				try:
+					report_date = date.fromisoformat(name[len("daily-report-"):-len(".json.gz")])
+				except ValueError:
+					continue
+				if report_date < oldest:
+					os.remove(os.path.join(self.snapshot_dir, name))
+					with self._lock:
+						self._snapshots.pop(report_date, None)
+
+	def _path(self, report_date):
+		return os.path.join(self.snapshot_dir, f"daily-report-{report_date.isoformat()}.json.gz")
+
+	def _write(self, snapshot):
+		# Write then rename so readers never see a partial file
+		os.makedirs(self.snapshot_dir, exist_ok=True)
+		path = self._path(snapshot.report_date)
+		temporary_path = f"{path}.{os.getpid()}.tmp"
+		with gzip.open(temporary_path, 'wb') as snapshot_file:
+			snapshot_file.write(snapshot.payload)
+		os.replace(temporary_path, path)
+		self._snapshots[snapshot.report_date] = (snapshot, self._file_version(path))
+
+	@staticmethod
+	def _file_version(path):
+		# Every write renames a new file into place, so the inode changes
+		# even when the filesystem's timestamps are too coarse to
+		stat = os.stat(path)
+		return stat.st_ino, stat.st_mtime_ns
+
+	@contextmanager
+	def _file_lock(self):
+		# Serializes snapshot rewrites across processes where flock exists
+		if fcntl is None:
+			yield
+			return
+		os.makedirs(self.snapshot_dir, exist_ok=True)
+		with open(os.path.join(self.snapshot_dir, ".lock"), 'w') as lock_file:
+			fcntl.flock(lock_file, fcntl.LOCK_EX)
+			try:
+				yield
+			finally:
+				fcntl.flock(lock_file, fcntl.LOCK_UN)
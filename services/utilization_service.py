@@ -0,0 +1,133 @@
+import numpy as np
+
+
+class UtilizationService:
+	"""
+	A service to report how much of the time the fleet is on hire. The
+	bookings in the date range are loaded in one query and laid out as a
+	vehicles x days occupancy matrix with NumPy, so the cost grows with
+	the size of the matrix rather than with Python work per booking.
+	"""
+
+	def __init__(self, booking_dao, vehicle_dao, invoice_dao):
+		self.booking_dao = booking_dao
+		self.vehicle_dao = vehicle_dao
+		self.invoice_dao = invoice_dao
+
+	def utilization_report(self, start_date, end_date):
+		"""
+		Computes the share of days booked per vehicle, per vehicle type and
+		per week, with the invoiced revenue per vehicle and type. A booking
+		occupies the days from date_hired up to, not including, its
+		return_date. Weeks are 7 day buckets from start_date.
+
+		Parameters
+		----------
+		start_date : datetime.date
+			The first day of the report.
+		end_date : datetime.date
+			The day after the last day of the report.
+
+		Returns
+		-------
+		dict
+			The report's start, end and days, and lists of vehicles, types
+			and weeks with their booked_days and utilization (0 to 1).
+		"""
+		if start_date >= end_date:
+			raise ValueError("The start date must be before the end date")
+		days = (end_date - start_date).days
+		fleet = self.vehicle_dao.get_fleet()
+		offsets = self.booking_dao.get_booking_day_offsets(start_date, end_date)
+		revenue_by_vehicle = self.invoice_dao.get_revenue_by_vehicle(start_date, end_date)
+
+		vehicle_ids = np.array([vehicle['vehicle_id'] for vehicle in fleet], dtype=np.int64)
+		booked = occupancy_matrix(vehicle_ids, offsets, days)
+		booked_days = booked.sum(axis=1)
+		revenue = np.array([revenue_by_vehicle.get(vehicle_id, 0.0) for vehicle_id in vehicle_ids.tolist()])
+
+		vehicles = [
+			{
+				"vehicle_id": vehicle['vehicle_id'],
+				"type": vehicle['type'],
+				"booked_days": vehicle_booked_days,
+				"utilization": vehicle_booked_days / days,
+				"revenue": vehicle_revenue
+			}
+			for vehicle, vehicle_booked_days, vehicle_revenue in zip(fleet, booked_days.tolist(), revenue.tolist())
+		]
+
+		type_names, type_index = np.unique(np.array([vehicle['type'] or '' for vehicle in fleet]), return_inverse=True)
+		type_counts = np.bincount(type_index, minlength=len(type_names))
+		type_booked_days = np.bincount(type_index, weights=booked_days, minlength=len(type_names))
+		type_revenue = np.bincount(type_index, weights=revenue, minlength=len(type_names))
+		types = [
+			{
+				"type": name,
+				"vehicles": count,
+				"booked_days": int(type_booked),
+				"utilization": type_booked / (count * days),
+				"revenue": type_total
+			}
+			for name, count, type_booked, type_total in zip(
+				type_names.tolist(), type_counts.tolist(), type_booked_days.tolist(), type_revenue.tolist())
+		]
+
+		week_offsets = np.arange(0, days, 7)
+		week_lengths = np.diff(np.append(week_offsets, days))
+		week_booked_days = np.add.reduceat(booked.sum(axis=0), week_offsets)
+		week_capacity = np.maximum(week_lengths * len(fleet), 1)
+		week_starts = np.datetime64(start_date, 'D') + week_offsets
+		weeks = [
+			{
+				"week_start": week_start,
+				"booked_days": int(week_booked),
+				"utilization": week_booked / capacity
+			}
+			for week_start, week_booked, capacity in zip(
+				week_starts.astype(object).tolist(), week_booked_days.tolist(), week_capacity.tolist())
+		]
+
+		return {
+			"start": start_date,
+			"end": end_date,
+			"days": days,
+			"vehicles": vehicles,
+			"types": types,
+			"weeks": weeks
+		}
+
+
+def occupancy_matrix(vehicle_ids, offsets, days):
+	"""
+	Marks the days each vehicle is booked. Each booking adds +1 at its
+	first day and -1 at its return day in a difference array, and a
+	cumulative sum along the days turns those into occupancy, so no
+	booking is ever expanded into its days in Python.
+
+	Parameters
+	----------
+	vehicle_ids : numpy.ndarray
+		The sorted ids of the vehicles, one row each.
+	offsets : list
+		(vehicle_id, first day, return day) tuples, days counted from the
+		first column. Bookings of vehicles not in vehicle_ids are ignored.
+	days : int
+		The number of days (columns).
+
+	Returns
+	-------
+	numpy.ndarray
+		A boolean vehicles x days matrix, True where a vehicle is booked.
+	"""
+	width = days + 1
+	size = len(vehicle_ids) * width
+	changes = np.zeros(size, dtype=np.int64)
+	if len(vehicle_ids) and offsets:
+		bookings = np.array(offsets, dtype=np.int64)
+		rows = np.minimum(np.searchsorted(vehicle_ids, bookings[:, 0]), len(vehicle_ids) - 1)
+		known = vehicle_ids[rows] == bookings[:, 0]
+		starts = rows[known] * width + np.clip(bookings[known, 1], 0, days)
+		ends = rows[known] * width + np.clip(bookings[known, 2], 0, days)
+		changes = np.bincount(starts, minlength=size) - np.bincount(ends, minlength=size)
+	return np.cumsum(changes.reshape(len(vehicle_ids), width)[:, :days], axis=1) > 0
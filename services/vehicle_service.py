@@ -2,7 +2,7 @@ from services.base_service import BaseService
 
 
 class VehicleService(BaseService):
-	def __init__(self, vehicle_dao):
+	def __init__(self, vehicle_dao, availability_index=None):
 		required_fields = {
 			"type",
 			"model",
@@ -12,6 +12,9 @@ class VehicleService(BaseService):
 			"available"
 		}
 		super().__init__(vehicle_dao, required_fields)
+		self.availability_index = availability_index
+		if availability_index is not None:
+			self.add_listener(availability_index)
 
 	def add_vehicle(self, vehicle_data):
 		"""
@@ -29,7 +32,9 @@ class VehicleService(BaseService):
 				A dictionary containing the data from the row that was just
 				inserted into the database.
 			"""
-		return super().create_record(vehicle_data)
+		vehicle = super().create_record(vehicle_data)
+		self._notify('vehicle_saved', vehicle)
+		return vehicle
 
 	def update_vehicle(self, vehicle_id, vehicle_data):
 		"""
@@ -49,7 +54,9 @@ class VehicleService(BaseService):
 			A dictionary containing the data from the row that was
 			updated in the database.
 		"""
-		return super().update_record(vehicle_id, vehicle_data)
+		vehicle = super().update_record(vehicle_id, vehicle_data)
+		self._notify('vehicle_saved', vehicle)
+		return vehicle
 
 	def delete_vehicle(self, vehicle_id):
 		"""
@@ -61,7 +68,8 @@ class VehicleService(BaseService):
 		vehicle_id : int
 			The vehicle's id
 		"""
-		return super().delete_record(vehicle_id)
+		super().delete_record(vehicle_id)
+		self._notify('vehicle_deleted', vehicle_id)
 
 	def get_vehicle(self, vehicle_id):
 		"""
@@ -79,3 +87,29 @@ class VehicleService(BaseService):
 			from the database.
 		"""
 		return super().get_record(vehicle_id)
+
+	def find_available_vehicles(self, vehicle_type, start_date, end_date):
+		"""
+		Finds the vehicles of a type that are free for the whole date range,
+		using the availability index when one is configured.
+
+		Parameters
+		----------
+		vehicle_type : str
+			The vehicle type, or None for every type.
+		start_date : datetime.date
+			The first day of hire.
+		end_date : datetime.date
+			The return date.
+
+		Returns
+		-------
+		list
+			A list of dictionaries containing the free vehicles.
+		"""
+		if start_date >= end_date:
+			raise ValueError("The return date must be after the hire date")
+		if self.availability_index is not None:
+			vehicle_ids = self.availability_index.available_vehicle_ids(vehicle_type, start_date, end_date)
+			return self.dao.get_many(vehicle_ids)
+		return self.dao.find_available_vehicles(vehicle_type, start_date, end_date)